@@ -0,0 +1,652 @@
+# benchmark.py
+
+"""
+Benchmark flight_tracker against the local databases
+Run with the name of a benchmark (or none to list them) and any arguments it takes,
+e.g. python3 benchmark.py lookups or python3 benchmark.py convert path/to/states.json
+"""
+
+# pylint: disable=wrong-import-position,wrong-import-order,protected-access
+from gevent.monkey import patch_all
+patch_all()
+
+from contextlib import contextmanager
+from functools import partial
+from gzip import compress
+from itertools import count, cycle
+from json import dumps
+from os import _exit, close, fork, pipe, read, sysconf, waitpid, write
+from os.path import exists, getsize
+from queue import LifoQueue
+from random import Random
+from resource import getrusage, RUSAGE_SELF
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+from tracemalloc import get_traced_memory, start as start_tracing, stop as stop_tracing
+from typing import Any, Callable, Iterable, Iterator
+import sqlite3
+from gevent.pool import Pool
+import connections
+from decoder import Decoder
+from delta import Deltas
+import detail
+import flights
+import get
+import opensky
+from shared import SharedState
+from spatial import Grid, Viewport
+from store import AircraftStore
+from tracks import Tracks
+import wire
+
+__all__: list[str] = [
+    "BENCHMARKS"
+]
+
+
+def _sample(table: str, column: str, size: int) -> list[str]:
+    """
+    Internal
+    Get a random sample of values from a column in the local database
+    """
+    get.check_dbs()
+    with connections.reading(get._paths["local"]) as db:
+        return [row[0] for row in db.execute(f"SELECT {column} FROM {table} "
+                                             "ORDER BY RANDOM() LIMIT ?", (size,))]
+
+
+def _rate(name: str, func: Callable[[str], object], queries: Iterable[str],
+          concurrency: int = 1) -> float:
+    """
+    Internal
+    Run func over every query using a pool of greenlets and print the calls per second
+    """
+    queries = list(queries)
+    pool: Pool = Pool(concurrency)
+    start: float = perf_counter()
+    pool.map(func, queries)
+    rate: float = len(queries) / (perf_counter() - start)
+    print(f"{name:<32} {concurrency:>4} greenlets {rate:>12,.0f}/s")
+    return rate
+
+
+def _time(name: str, func: Callable[[], object], repeat: int = 3) -> float:
+    """
+    Internal
+    Run func a few times and print the best time taken in milliseconds
+    """
+    best: float = min(_timer(func) for _ in range(repeat))
+    print(f"{name:<32} {best * 1000:>26,.1f} ms")
+    return best
+
+
+def _timer(func: Callable[[], object]) -> float:
+    """
+    Internal
+    Get the time taken to run func in seconds
+    """
+    start: float = perf_counter()
+    func()
+    return perf_counter() - start
+
+
+def _rss() -> float:
+    """
+    Internal
+    Get the resident set size of this process in MB (the peak if the current one isn't available)
+    """
+    if exists("/proc/self/statm"):
+        with open("/proc/self/statm", "r", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * sysconf("SC_PAGE_SIZE") / 1048576
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _allocated(func: Callable[[], object]) -> float:
+    """
+    Internal
+    Get the memory allocated by func that's still held by what it returns in MB
+    """
+    start_tracing()
+    result: object = func()
+    allocated: float = get_traced_memory()[0] / 1048576
+    stop_tracing()
+    del result
+    return allocated
+
+
+def _beast(message: str) -> bytes:
+    """
+    Internal
+    Get a Mode S message (in hex) as a Beast frame, with a timestamp that has to be escaped
+    """
+    return b"\x1a\x33" + (b"\x00\x01\x1a\x03\x04\x05\x30" + bytes.fromhex(message)).replace(
+        b"\x1a", b"\x1a\x1a")
+
+
+def _size(path: str) -> float:
+    """
+    Internal
+    Get the size of an SQLite database (with its write-ahead log) in MB
+    """
+    return sum(getsize(file) for file in (path, path + "-wal") if exists(file)) / 1048576
+
+
+def _states(icaos: list[str], seed: int = 0) -> list[list[Any]]:
+    """
+    Internal
+    Make an OpenSky API aircraft list with a state vector for each ICAO address
+    """
+    rand: Random = Random(seed)
+    return [[icao, f"{rand.choice(('BAW', 'DLH', 'UAL', 'N'))}{rand.randrange(10000):<4}",
+             "", 0, 0, rand.uniform(-180, 180), rand.uniform(-85, 85),
+             rand.uniform(0, 12000), False, rand.uniform(0, 280), rand.uniform(0, 360),
+             rand.uniform(-20, 20), None, 0, "", False, 0, 0] for icao in icaos]
+
+
+def _latencies(name: str, func: Callable[[], object], repeat: int = 200) -> list[float]:
+    """
+    Internal
+    Run func repeatedly and print the 50th and 99th percentile times in milliseconds
+    """
+    times: list[float] = sorted(_timer(func) for _ in range(repeat))
+    print(f"{name:<32} p50 {times[len(times) // 2] * 1000:>8,.3f} ms "
+          f"p99 {times[int(len(times) * 0.99)] * 1000:>8,.3f} ms")
+    return times
+
+
+def _positions(size: int, seed: int = 0) -> dict[str, dict[str, str | int | float]]:
+    """
+    Internal
+    Make a converted aircraft state with made up positions, most of them bunched up
+    over Europe and North America like real traffic
+    """
+    rand: Random = Random(seed)
+    state: dict[str, dict[str, str | int | float]] = {}
+    for n in range(size):
+        lat, lng = rand.choice(((50, 5), (40, -90),
+                                (rand.uniform(-60, 70), rand.uniform(-180, 180))))
+        icao: str = f"{n:06x}"
+        state[icao] = {"icao": icao, "csign": f"TST{n}", "lat": lat + rand.gauss(0, 6),
+                       "lng": lng + rand.gauss(0, 12), "alt": rand.uniform(0, 40000),
+                       "hdg": rand.uniform(0, 360), "speed": rand.uniform(0, 500)}
+    return state
+
+
+def _aircraft(size: int, seed: int = 0) -> dict[str, dict[str, str | int | float]]:
+    """
+    Internal
+    Make a converted aircraft state with made up positions (see _positions)
+    and registry details, as opensky.convert gets
+    """
+    state: dict[str, dict[str, str | int | float]] = _positions(size, seed)
+    for n, aircraft in enumerate(state.values()):
+        kind: str = ("A320", "B738", "B77W")[n % 3]
+        aircraft.update(climb=0.0, reg=f"G-{n % 10000:04}", type=kind, icon=kind)
+    return state
+
+
+# MARK: - Benchmarks
+def lookups(size: int = 20000) -> None:
+    """
+    get.info(..., "basic") lookups per second under gevent concurrency,
+    against opening a new connection for every query as _get_row used to
+    """
+    def unpooled_row(table: str, column: str, query: str) -> dict[str, str]:
+        db: sqlite3.Connection = sqlite3.connect(get._paths["local"])
+        db.row_factory = sqlite3.Row
+        row: sqlite3.Row | None = db.execute(f"SELECT * FROM {table} WHERE {column} = ?",
+                                             (query,)).fetchone()
+        db.close()
+        return dict(row) if row is not None else {}
+
+    def unpooled(icao: str) -> dict[str, str]:
+        result: dict[str, str] = unpooled_row("aircraft", "icao", icao)
+        if result.get("type"):
+            result.update(unpooled_row("icontypes", "type", result["type"]))
+        return result
+
+    icaos: list[str] = _sample("aircraft", "icao", size)
+    for concurrency in (1, 50):
+        before: float = _rate("new connection per query", unpooled, icaos, concurrency)
+        after: float = _rate("pooled connections", lambda icao: get.info(icao, "basic"),
+                             icaos, concurrency)
+        print(f"{'speedup':<32} {after / before:>29.1f}x")
+
+
+def convert(path: str = "", size: int = 10000) -> None:
+    """
+    opensky.convert on a worldwide-sized snapshot (or a recorded OpenSky API response,
+    given the path to one), against converting one aircraft at a time as it used to,
+    then packed with wire.pack against converted to columns and packed with wire.pack_columns,
+    and the "basic" lookups it needs made one by one with get.info against in bulk
+    """
+    kept: tuple[str, ...] = ("icao", "csign", "lng", "lat", "alt", "speed", "hdg", "climb", "cat")
+
+    def by_row(state: list[list[str | int | float]]) -> dict[str, dict[str, str | int | float]]:
+        result: dict[str, dict[str, str | int | float]] = {}
+        valid: list[dict[str, str | int | float]] = []
+        for osac in state:
+            ftac: dict[str, str | int | float] = dict(zip(opensky._HEADERS, osac))
+            if all(key in ftac and ftac[key] for key in opensky._REQUIRED):
+                ftac = dict(filter(lambda item: item[1] and item[0] in kept, ftac.items()))
+                for convertee, multiplier in opensky._CONVERSIONS:
+                    if convertee in ftac and ftac[convertee]:
+                        ftac[convertee] = float(ftac[convertee]) * multiplier
+                    else:
+                        ftac[convertee] = 0
+                ftac["csign"] = str(ftac["csign"]).strip()
+                valid.append(ftac)
+        basics: dict[str, dict[str, str]] = get.info_many((str(ftac["icao"]) for ftac in valid),
+                                                          "basic")
+        for ftac in valid:
+            ftac.update(basics[str(ftac["icao"])])
+            ftac["csign"] = opensky._callsign(str(ftac["csign"]), str(ftac.get("reg", "")))
+            result[str(ftac["icao"])] = ftac
+        return result
+
+    state: list[list[str | int | float]]
+    if path:
+        with open(path, "r", encoding="utf-8") as file:
+            state = opensky.extract(file.read())
+    else:
+        state = _states(_sample("aircraft", "icao", int(size)))
+    icaos: list[str] = [str(vector[0]) for vector in state]
+    print(f"{len(state):,} state vectors")
+    _time("get.info per aircraft", lambda: [get.info(icao, "basic") for icao in icaos])
+    _time("get.info_many", lambda: get.info_many(icaos, "basic"))
+    _time("one aircraft at a time", lambda: by_row(state))
+    _time("opensky.convert", lambda: opensky.convert(state))
+    _time("opensky.columns", lambda: opensky.columns(state))
+    _time("convert and wire.pack", lambda: wire.pack(opensky.convert(state)))
+    _time("columns and wire.pack_columns", lambda: wire.pack_columns(opensky.columns(state)))
+
+
+def registry(size: int = 20000) -> None:
+    """
+    Memory taken by the in-memory aircraft registry, and aircraft lookups per second
+    from it against from SQLite (both skipping the info cache)
+    """
+    icaos: list[str] = _sample("aircraft", "icao", size)
+    before: float = _rss()
+    start: float = perf_counter()
+    loaded: get.Registry = get._load_registry()
+    print(f"{'load registry':<32} {(perf_counter() - start) * 1000:>26,.1f} ms")
+    print(f"{'registry rss':<32} {_rss() - before:>26,.1f} MB ({len(loaded):,} aircraft)")
+    _rate("sqlite", lambda icao: get._get_row("aircraft", "icao", icao), icaos)
+    _rate("registry", loaded.get, icaos)
+
+
+def prefixes(size: int = 20000) -> None:
+    """
+    Countries looked up from registrations per second with the prefix trie,
+    against the LIKE query _get_country_from_reg used to run
+    """
+    def like(reg: str) -> str:
+        with connections.reading(get._paths["local"]) as db:
+            row: sqlite3.Row | None = db.execute("SELECT country FROM prefixes "
+                                                 "WHERE ? LIKE prefix || '%'", (reg,)).fetchone()
+        return row[0] if row is not None else ""
+
+    regs: list[str] = [reg for reg in _sample("aircraft", "reg", size) if reg]
+    _rate("LIKE query", like, regs)
+    _rate("trie", get._get_country_from_reg, regs)
+    _time("trie, all at once", lambda: get._get_countries_from_regs(regs))
+    differs: int = sum(like(reg) != get._get_country_from_reg(reg) for reg in regs)
+    print(f"{'longest prefix differs':<32} {differs:>29,}")
+
+
+def viewports(size: int = 20000) -> None:
+    """
+    Time to get the aircraft inside viewports of different sizes from the spatial grid,
+    against checking every aircraft, to cluster the whole world, and to make a client's delta
+    after a poll
+    """
+    state: dict[str, dict[str, str | int | float]] = _positions(size)
+    _time(f"build grid ({size:,} aircraft)", lambda: Grid(state))
+    grid: Grid = Grid(state)
+
+    def every(south: float, west: float, north: float, east: float) -> list[str]:
+        return [icao for icao, aircraft in state.items()
+                if south <= float(aircraft["lat"]) <= north
+                and west <= float(aircraft["lng"]) <= east]
+
+    for name, bounds in (("city", (51.2, -0.8, 51.8, 0.6)),
+                         ("country", (49.5, -8.5, 59, 2)),
+                         ("continent", (35, -25, 70, 45)),
+                         ("world", (-85, -180, 85, 180)),
+                         ("antimeridian", (-50, 160, 10, 200))):
+        south, west, north, east = bounds
+        print(f"{name} - {len(grid.query(*bounds)):,} aircraft")
+        _latencies("grid", partial(grid.query, south, west, north, east))
+        _latencies("every aircraft", partial(every, south, west, north, east))
+
+    for zoom in (2, 4):
+        clusters: list[list[float]] = grid.clusters(-85, -180, 85, 180, 90 / 2 ** zoom)
+        print(f"world at zoom {zoom} - {len(clusters):,} clusters")
+        _latencies("clusters", partial(grid.clusters, -85, -180, 85, 180, 90 / 2 ** zoom))
+
+    moved: dict[str, dict[str, str | int | float]] = {
+        icao: {**aircraft, "lat": float(aircraft["lat"]) + 0.05}
+        for icao, aircraft in state.items()}
+    viewport: Viewport = Viewport()
+    viewport.subscribe((35, -25, 70, 45), 5, "", state, grid)
+    delta: dict = {"changed": {icao: {"lat": aircraft["lat"]} for icao, aircraft in moved.items()},
+                   "added": {}}
+    moved_grid: Grid = Grid(moved)
+    _latencies("continent viewport delta",
+               lambda: Viewport.update(viewport, delta, moved, moved_grid), 50)
+
+
+def packing(size: int = 10000) -> None:
+    """
+    Bytes and time to encode a snapshot (and a delta moving every aircraft)
+    as JSON against packed with wire.pack
+    """
+    rand: Random = Random(0)
+    state: dict[str, dict[str, str | int | float]] = _positions(size)
+    for aircraft in state.values():
+        aircraft.update(climb=rand.uniform(-3000, 3000), cat=rand.randrange(8),
+                        icon=rand.choice(("A320", "B737", "B773", "generic")),
+                        type=rand.choice(("A20N", "A320", "B738", "B77W", "C172")),
+                        reg=f"G-{rand.randrange(26 ** 4):05d}")
+    changed: dict[str, dict[str, str | int | float]] = {
+        icao: {"lat": float(aircraft["lat"]) + 0.01, "lng": float(aircraft["lng"]) + 0.01,
+               "alt": float(aircraft["alt"]) + 25} for icao, aircraft in state.items()}
+
+    for name, payload in ((f"snapshot ({size:,} aircraft)", state), ("delta", changed)):
+        print(name)
+        as_json: bytes = dumps(payload).encode()
+        as_packed: bytes = wire.pack(payload)
+        for encoding, data in (("json", as_json), ("packed", as_packed)):
+            print(f"{encoding + ' bytes':<32} {len(data):>20,} ({len(compress(data)):,} gzipped)")
+        _time("json encode", partial(dumps, payload))
+        _time("packed encode", partial(wire.pack, payload))
+        _time("packed decode", partial(wire.unpack, as_packed))
+
+
+def select(size: int = 2000) -> None:
+    """
+    Latency of getting everything main.handle_select shows about an aircraft with
+    detail.flight_detail, against the get.info call for each part it used to make
+    (both skipping the info cache)
+    """
+    def by_info(icao: str, csign: str) -> dict[str, dict[str, str]]:
+        info: dict[str, dict[str, str]] = {"aircraft": get._info(icao, "aircraft"),
+                                           "airline": get._info(csign, "airline"),
+                                           "route": {"csign": csign}}
+        if "name" not in info["airline"] and "operatoricao" in info["aircraft"]:
+            get._info(info["aircraft"]["operatoricao"], "airline")
+        route: dict[str, str] = get._info(csign, "route")
+        info["orig"] = get._info(route["orig"], "airport") if "orig" in route else {}
+        info["dest"] = get._info(route["dest"], "airport") if "dest" in route else {}
+        return info
+
+    icaos: list[str] = _sample("aircraft", "icao", size)
+    with connections.reading(get._paths["instance"]) as db:
+        csigns: list[str] = [row[0] for row in db.execute("SELECT csign FROM routes LIMIT ?",
+                                                          (size,))]
+    csigns += [f"{airline}{n}" for n, airline in
+               enumerate(_sample("airlines", "icao", size - len(csigns)))]
+    pairs: list[tuple[str, str]] = list(zip(icaos, cycle(csigns)))
+
+    def call(func: Callable[[str, str], dict[str, dict[str, str]]],
+             queries: Iterator[tuple[str, str]]) -> dict[str, dict[str, str]]:
+        return func(*next(queries))
+
+    for name, func in (("get.info per part", by_info),
+                       ("detail.flight_detail", detail.flight_detail)):
+        _latencies(name, partial(call, func, cycle(pairs)), len(pairs))
+
+
+def tracks(size: int = 20000, snapshots: int = 120, interval: float = 5) -> None:
+    """
+    Time to record worldwide-sized snapshots (every aircraft moved) into the track store,
+    the size it grows to, and the latency of getting a trail and of each state of a replay
+    """
+    state: dict[str, dict[str, str | int | float]] = _positions(size)
+    with TemporaryDirectory() as directory:
+        track_store: Tracks = Tracks(f"{directory}/tracks.db")
+        times: list[float] = []
+        for n in range(snapshots):
+            for aircraft in state.values():
+                aircraft["lat"] = float(aircraft["lat"]) + 0.01
+            times.append(_timer(partial(track_store.record, state, 1e9 + n * interval)))
+        times.sort()
+        print(f"record {size:,} aircraft{'':<10} p50 {times[len(times) // 2] * 1000:>8,.1f} ms "
+              f"p99 {times[int(len(times) * 0.99)] * 1000:>8,.1f} ms")
+        print(f"{'database size':<32} {_size(f'{directory}/tracks.db'):>26,.1f} MB "
+              f"({size * snapshots:,} positions)")
+
+        icaos: Iterator[str] = cycle(state)
+        _latencies("trail", lambda: track_store.trail(next(icaos), 0, 2e9))
+        replay: Iterator[tuple[float, dict[str, dict[str, Any]]]] = track_store.replay(
+            1e9, 1e9 + snapshots * interval, interval)
+        _latencies("replay state", lambda: next(replay), snapshots - 1)
+        track_store.close()
+
+
+def decoder(size: int = 100000) -> None:
+    """
+    Messages decoded per second on one core from Beast binary frames (identification,
+    an even and odd airborne position and velocity, every frame needing unescaping)
+    and from SBS-1 BaseStation lines, given in 64KB chunks as if read from a receiver
+    """
+    messages: tuple[str, ...] = ("8D4840D6202CC371C32CE0576098", "8D40621D58C382D690C8AC2863A7",
+                                 "8D40621D58C386435CC412692AD6", "8D485020994409940838175B284F")
+    beast: bytes = b"".join(map(_beast, messages)) * (size // len(messages))
+    sbs: bytes = (b"MSG,3,1,1,4CA2D6,1,2024/01/01,00:00:00.000,2024/01/01,00:00:00.000,,"
+                  b"37000,,,51.5,-0.1,,,0,0,0,0\n") * size
+
+    def take_all(take: Callable[[Decoder, bytes], object], receiver: Decoder,
+                 chunks: list[bytes]) -> None:
+        for chunk in chunks:
+            take(receiver, chunk)
+
+    for name, data, take in (("beast", beast, Decoder.beast), ("sbs", sbs, Decoder.sbs)):
+        receiver: Decoder = Decoder()
+        chunks: list[bytes] = [data[start:start + 65536] for start in range(0, len(data), 65536)]
+        taken: float = _timer(partial(take_all, take, receiver, chunks))
+        print(f"{name:<32} {receiver.counts['decoded'] / taken:>26,.0f}/s")
+
+
+def store(*sizes: int) -> None:
+    """
+    Memory taken by the live state of aircraft (by default 10k and 100k of them, with registry
+    details) as a store.AircraftStore against a dict for each aircraft, and the time to update
+    to the next state (every aircraft moved) and get the delta for it either way
+    """
+    for size in map(int, sizes or (10000, 100000)):
+        def stored(size: int = size) -> AircraftStore:
+            live: AircraftStore = AircraftStore(_aircraft(size))
+            # as it is after the next poll, without holding on to the aircraft it added
+            live.update(_aircraft(size))
+            return live
+
+        print(f"{size:,} aircraft")
+        print(f"{'dicts':<32} {_allocated(partial(_aircraft, size)):>26,.1f} MB")
+        print(f"{'store':<32} {_allocated(stored):>26,.1f} MB")
+
+        states: Iterator[dict[str, dict[str, str | int | float]]] = cycle(
+            [_aircraft(size, seed) for seed in (1, 2)])
+        deltas: Deltas = Deltas()
+        deltas.update(_aircraft(size))
+
+        def update_dicts(deltas: Deltas = deltas,
+                         states: Iterator[dict[str, dict[str, str | int | float]]] = states
+                         ) -> None:
+            deltas.update(next(states))
+        _time("dicts update", update_dicts)
+
+        def update(live: AircraftStore = AircraftStore(_aircraft(size)), deltas: Deltas = Deltas(),
+                   states: Iterator[dict[str, dict[str, str | int | float]]] = states) -> None:
+            live.update(next(states))
+            deltas.apply(live, live.added, live.changed, live.removed)
+        _time("store update", update)
+
+
+def shared(size: int = 20000, seconds: float = 5) -> None:
+    """
+    Time to write a worldwide-sized state into a shared.SharedState and to read it back,
+    then states read per second from it by 1, 2 and 4 processes at once
+    (each as a worker does after every poll), while it's written every second
+    """
+    live: AircraftStore = AircraftStore(_aircraft(int(size)))
+    segment: SharedState = SharedState.create()
+    _time("write", lambda: segment.write(live))
+    reader: SharedState = SharedState(segment.path)
+
+    def read_again() -> None:
+        reader.sequence = 0
+        reader.read()
+    _time("read", read_again)
+
+    for processes in (1, 2, 4):
+        readers: list[tuple[int, int]] = []
+        for _ in range(processes):
+            output, into = pipe()
+            child: int = fork()
+            if child == 0:
+                reads: int = 0
+                end: float = perf_counter() + float(seconds)
+                while perf_counter() < end:
+                    if reader.read() is not None:
+                        reads += 1
+                    reader.sequence = 0
+                write(into, str(reads).encode())
+                _exit(0)
+            close(into)
+            readers.append((child, output))
+        end = perf_counter() + float(seconds)
+        while perf_counter() < end:
+            segment.write(live)
+            sleep(1)
+        reads = 0
+        for child, output in readers:
+            reads += int(read(output, 32) or 0)
+            close(output)
+            waitpid(child, 0)
+        print(f"{processes} reading{'':<23} {reads / float(seconds):>26,.1f}/s")
+    reader.close()
+    segment.close(remove=True)
+
+
+@contextmanager
+def _scratch_instance() -> Iterator[None]:
+    """
+    Internal
+    Point get at an empty instance database with my_flights for as long as the block runs
+    """
+    instance: str = get._paths["instance"]
+    with TemporaryDirectory() as directory:
+        get._paths["instance"] = f"{directory}/instance.db"
+        try:
+            flights.check_dbs(lambda line: None)
+            yield
+        finally:
+            connections._writers.pop(get._paths["instance"]).close()
+            for db in connections._readers.pop((get._paths["instance"], ""), LifoQueue()).queue:
+                db.close()
+            get._paths["instance"] = instance
+
+
+def my_flights(size: int = 10000, batch: int = 10) -> None:
+    """
+    Time to log a My Flights history of size flights at once, then latency of adding batch more
+    and of getting everything the /my page shows with flights.my_flights, from the statistics
+    counted as flights are added, against counting every flight again as each request used to
+    """
+    airports: list[str] = _sample("airports", "icao", 500)
+    airlines: list[str] = _sample("airlines", "icao", 100)
+    types: list[str] = _sample("icontypes", "type", 100)
+    rand: Random = Random(0)
+
+    def flight(n: int) -> dict[str, str]:
+        return {"date": f"{2000 + n % 25}-01-01",
+                "orig": rand.choice(airports),
+                "dest": rand.choice(airports),
+                "csign": f"{rand.choice(airlines)}{rand.randrange(1000)}",
+                "reg": "",
+                "type": rand.choice(types)}
+
+    def recount() -> None:
+        with connections.writing(get._paths["instance"]) as db:
+            db.execute("DELETE FROM my_flights_stats")
+            flights._tally_flights(db, db.execute("SELECT * FROM my_flights").fetchall())
+
+    logged: list[dict[str, str]] = [flight(n) for n in range(int(size))]
+    numbers: Iterator[int] = count(int(size))
+    with _scratch_instance():
+        _time(f"log {int(size):,} flights", lambda: flights.add_flights(logged), 1)
+        _latencies(f"add {int(batch)} flights",
+                   lambda: flights.add_flights([flight(next(numbers))
+                                                for _ in range(int(batch))]), 50)
+        _latencies("flights.my_flights", flights.my_flights, 50)
+        _time("count every flight again", recount)
+
+
+def mfr24(size: int = 100000) -> None:
+    """
+    Time to import a My Flightradar24 CSV export of size flights with flights.mfr24_to_mf,
+    then to import it again over itself, when every flight is already there,
+    and once more with every registration changed, when every flight is updated
+    """
+    airports: list[tuple[str, str]] = list(zip(_sample("airports", "iata", 500),
+                                               _sample("airports", "icao", 500)))
+    airlines: list[str] = _sample("airlines", "icao", 100)
+    types: list[str] = _sample("icontypes", "type", 100)
+    rand: Random = Random(0)
+    lines: list[str] = ['"Date","Flight number","From","To","Dep time","Arr time","Duration",'
+                        '"Airline","Aircraft","Registration","Seat number","Seat type",'
+                        '"Flight class","Flight reason","Note","Dep_id","Arr_id","Airline_id",'
+                        '"Aircraft_id"']
+    for n in range(int(size)):
+        (orig_iata, orig), (dest_iata, dest) = rand.choice(airports), rand.choice(airports)
+        airline: str = rand.choice(airlines)
+        lines.append(f'"{2000 + n // 365 % 25}-{n % 12 + 1:02}-{n % 28 + 1:02}",'
+                     f'"XX{n % 10000}",'
+                     f'"Somewhere, Anywhere ({orig_iata}/{orig})",'
+                     f'"Elsewhere ({dest_iata}/{dest})",'
+                     '"08:00:00","10:00:00","02:00:00",'
+                     f'"Some Airline ({airline[:2]}/{airline})",'
+                     f'"Some Aircraft ({rand.choice(types)})",'
+                     f'"G-{n % 17576:04X}","","0","0","1","A note, with a comma",'
+                     '"1","2","3","4"')
+    csv: str = "\n".join(lines)
+
+    reports: list[flights.ImportReport] = []
+    with _scratch_instance():
+        _time(f"import {int(size):,} flights",
+              lambda: reports.append(flights.mfr24_to_mf(csv.splitlines())), 1)
+        _time("import them again", lambda: reports.append(flights.mfr24_to_mf(csv.splitlines())), 1)
+        changed: str = csv.replace(',"G-', ',"N-')
+        _time("import them changed",
+              lambda: reports.append(flights.mfr24_to_mf(changed.splitlines())), 1)
+    for report in reports:
+        print(f"{report['read']:,} read, {report['added']:,} added, "
+              f"{report['updated']:,} updated, {report['unchanged']:,} unchanged, "
+              f"{report['repeated']:,} repeated, {len(report['skipped']):,} skipped")
+
+
+BENCHMARKS: dict[str, Callable[..., None]] = {
+    "lookups": lookups,
+    "convert": convert,
+    "registry": registry,
+    "prefixes": prefixes,
+    "viewports": viewports,
+    "packing": packing,
+    "select": select,
+    "tracks": tracks,
+    "decoder": decoder,
+    "store": store,
+    "shared": shared,
+    "myflights": my_flights,
+    "mfr24": mfr24
+}
+
+if __name__ == "__main__":
+    if len(argv) > 1 and argv[1] in BENCHMARKS:
+        BENCHMARKS[argv[1]](*argv[2:])
+    else:
+        for benchmark_name, benchmark in BENCHMARKS.items():
+            print(benchmark_name, "-", " ".join(str(benchmark.__doc__).split()))
@@ -0,0 +1,203 @@
+# cache.py
+
+"""
+Cache of get.info() results per kind, dropped when the tables each kind is built from change,
+including when another process serving from the same databases changes them
+"""
+
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+from typing import Callable, Iterable
+from shared import SharedState
+
+__all__: list[str] = [
+    "on_invalidate",
+    "cache_key",
+    "cached",
+    "invalidate",
+    "follow_changes",
+    "share_changes",
+    "stats"
+]
+
+_TTL: float = 3600
+_LIMITS: dict[str, int] = {
+    "aircraft": 5000,
+    "airline": 2000,
+    "airport": 5000,
+    "basic": 50000,
+    "icontype": 1000,
+    "route": 5000
+}
+_TABLES: dict[str, tuple[str, ...]] = {
+    "aircraft": ("aircraft", "prefixes"),
+    "airline": ("airlines",),
+    "airport": ("airports",),
+    "basic": ("aircraft", "icontypes"),
+    "icontype": ("icontypes",),
+    "route": ("routes",)
+}
+
+
+class _LRUCache:
+    """
+    Internal
+    Least recently used cache of info() results with a size limit and a time to live
+    """
+    def __init__(self, limit: int, ttl: float) -> None:
+        self.limit: int = limit
+        self.ttl: float = ttl
+        self.entries: OrderedDict[str, tuple[float, dict[str, str]]] = OrderedDict()
+        self.counts: dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "expiries": 0}
+        self.lock: RLock = RLock()
+
+    def get(self, key: str) -> dict[str, str] | None:
+        """Get a value if it is cached and hasn't expired, else None"""
+        with self.lock:
+            entry: tuple[float, dict[str, str]] | None = self.entries.get(key)
+            if entry is not None and entry[0] < monotonic():
+                del self.entries[key]
+                self.counts["expiries"] += 1
+                entry = None
+
+            if entry is None:
+                self.counts["misses"] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return entry[1]
+
+    def put(self, key: str, value: dict[str, str]) -> None:
+        """Cache a value, evicting the least recently used values if over the limit"""
+        with self.lock:
+            self.entries[key] = (monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def invalidate(self, keys: Iterable[str] | None = None) -> None:
+        """Drop the given keys, or everything if keys is None"""
+        with self.lock:
+            if keys is None:
+                self.entries.clear()
+            else:
+                for key in keys:
+                    self.entries.pop(key, None)
+
+
+_caches: dict[str, _LRUCache] = {kind: _LRUCache(limit, _TTL) for kind, limit in _LIMITS.items()}
+# when several processes serve from the same databases (see main.serve_workers), changes to
+# the tables info() is cached from are counted in a SharedState, one counter for each table,
+# and the others drop what they cached from a table when its counter moves (see share_changes)
+_SHARED_TABLES: tuple[str, ...] = tuple(dict.fromkeys(table for tables in _TABLES.values()
+                                                      for table in tables))
+_sharing: dict[str, SharedState] = {}
+_seen: list[int] = []
+
+# called with a table and the cache keys dropped (None for all of them) whenever a table changes,
+# in this process or another, for anything else kept from the table to be dropped too
+on_invalidate: list[Callable[[str, list[str] | None], object]] = []
+
+
+def cache_key(query: str, kind: str) -> str:
+    """
+    Get the query that info() would actually look up for a kind, used as its cache key
+    """
+    match kind.lower():
+        case "aircraft" | "basic":
+            return query.lower()
+        case "airline":
+            return query.upper()[:3]
+        case "airport" | "icontype" | "route":
+            return query.upper()
+    return query
+
+
+def cached(queries: Iterable[str],
+           kind: str,
+           lookup: Callable[[list[str]], dict[str, dict[str, str]]]) -> dict[str, dict[str, str]]:
+    """
+    Get the info for each query from the cache for its kind, looking up the misses all at once
+    Returns copies so callers can change them without changing the cache
+    """
+    follow_changes()
+    cache: _LRUCache | None = _caches.get(kind.lower())
+    if cache is None:
+        return lookup(list(dict.fromkeys(queries)))
+
+    keys: dict[str, str] = {query: cache_key(query, kind) for query in queries}
+    found: dict[str, dict[str, str]] = {}
+    misses: list[str] = []
+    for query, key in keys.items():
+        value: dict[str, str] | None = cache.get(key)
+        if value is None:
+            misses.append(query)
+        else:
+            found[key] = value
+
+    if misses:
+        for query, value in lookup(misses).items():
+            found[keys[query]] = value
+            cache.put(keys[query], value)
+
+    return {query: dict(found[key]) for query, key in keys.items()}
+
+
+def invalidate(table: str, keys: Iterable[str] | None = None, share: bool = True) -> None:
+    """
+    Drop cached info that depends on a table, or just the given cache keys if there are any,
+    then call on_invalidate
+    Other processes sharing changes (see share_changes) are told, unless share is False
+    """
+    keys = None if keys is None else list(keys)
+    if share and "changes" in _sharing and table in _SHARED_TABLES and keys != []:
+        index: int = _SHARED_TABLES.index(table)
+        counted: int = _sharing["changes"].count(index)
+        if counted != _seen[index] + 1:
+            # another process changed it too since this one last looked
+            keys = None
+        _seen[index] = counted
+
+    for kind, tables in _TABLES.items():
+        if table in tables:
+            _caches[kind].invalidate(keys)
+
+    for callback in on_invalidate:
+        callback(table, keys)
+
+
+def follow_changes() -> None:
+    """
+    Drop what's cached from the tables other processes have changed since this one last looked,
+    if sharing changes (see share_changes)
+    """
+    if "changes" not in _sharing:
+        return
+    for index, counter in enumerate(_sharing["changes"].counters()[:len(_SHARED_TABLES)]):
+        if counter != _seen[index]:
+            _seen[index] = counter
+            invalidate(_SHARED_TABLES[index], share=False)
+
+
+def share_changes(shared: SharedState) -> None:
+    """
+    Share changes to the tables info() is cached from with the other processes serving from
+    the same databases (e.g. main.serve_workers), through the counters of a SharedState,
+    so each drops what it cached from a table another has changed before it next uses it
+    """
+    _sharing["changes"] = shared
+    _seen[:] = shared.counters()[:len(_SHARED_TABLES)]
+
+
+def stats() -> dict[str, dict[str, int]]:
+    """
+    Get the size, limit, and hit/miss/eviction/expiry counters of the cache for each kind
+    """
+    result: dict[str, dict[str, int]] = {}
+    for kind, cache in _caches.items():
+        with cache.lock:
+            result[kind] = {"size": len(cache.entries), "limit": cache.limit, **cache.counts}
+    return result
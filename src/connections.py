@@ -0,0 +1,102 @@
+# connections.py
+
+"""
+Pooled SQLite connections to the databases, for lookups and for the single writer of each
+"""
+
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from threading import RLock
+from typing import Iterator
+import sqlite3
+
+__all__: list[str] = [
+    "POOL_SIZE",
+    "reading",
+    "writing",
+    "after_fork"
+]
+
+# readers are pooled per database and checked out for the length of one lookup, so under
+# gevent each greenlet has its own connection while it reads but nothing is opened per query
+# each database has a single writer shared behind a lock, WAL lets the readers carry on meanwhile
+POOL_SIZE: int = 16
+_CACHED_STATEMENTS: int = 256
+_readers: dict[tuple[str, str], LifoQueue[sqlite3.Connection]] = {}
+_writers: dict[str, sqlite3.Connection] = {}
+_writer_locks: dict[str, RLock] = {}
+# connections open when this process was forked from another, kept unused rather than closed
+# as closing them could have SQLite clean up after the other process (see after_fork)
+_inherited: list[sqlite3.Connection] = []
+
+
+def _connect(database: str, attach: str = "") -> sqlite3.Connection:
+    """
+    Internal, use reading() or writing()
+    Open a connection to a database in WAL mode, returning rows as sqlite3.Row
+    If attach is a path, that database is attached as instance
+    """
+    db: sqlite3.Connection = sqlite3.connect(database,
+                                             check_same_thread=False,
+                                             cached_statements=_CACHED_STATEMENTS)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    if attach:
+        db.execute("ATTACH DATABASE ? AS instance", (attach,))
+    return db
+
+
+@contextmanager
+def reading(database: str, attach: str = "") -> Iterator[sqlite3.Connection]:
+    """
+    Check out a read connection to a database from the pool for the length of the block
+    If attach is a path, that database is attached as instance (pooled separately)
+    """
+    pool: LifoQueue[sqlite3.Connection] = _readers.setdefault((database, attach),
+                                                              LifoQueue(POOL_SIZE))
+    try:
+        db: sqlite3.Connection = pool.get_nowait()
+    except Empty:
+        db = _connect(database, attach)
+
+    try:
+        yield db
+    finally:
+        if db.in_transaction:
+            db.rollback()
+        if pool.full():
+            db.close()
+        else:
+            pool.put_nowait(db)
+
+
+@contextmanager
+def writing(database: str) -> Iterator[sqlite3.Connection]:
+    """
+    Get the single write connection to a database for the length of the block
+    Writers are serialised, and the block is committed when it ends or rolled back if it raises
+    """
+    with _writer_locks.setdefault(database, RLock()):
+        if database not in _writers:
+            _writers[database] = _connect(database)
+        db: sqlite3.Connection = _writers[database]
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        db.commit()
+
+
+def after_fork() -> None:
+    """
+    Stop using the connections open when this process was forked from another
+    (e.g. by main.serve_workers), so new ones are opened as they're needed
+    SQLite connections can't be carried across fork(), so the old ones are never used or closed
+    """
+    for pool in _readers.values():
+        _inherited.extend(pool.queue)
+    _inherited.extend(_writers.values())
+    _readers.clear()
+    _writers.clear()
+    _writer_locks.clear()
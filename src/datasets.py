@@ -0,0 +1,93 @@
+# datasets.py
+
+"""
+Get the datasets tables are loaded from, from their URLs or local (optionally gzipped) copies
+"""
+
+from contextlib import contextmanager
+from gzip import open as gzip_open
+from hashlib import sha256
+from io import TextIOWrapper
+from os import stat
+from os.path import exists
+from typing import BinaryIO, cast, Iterator, TextIO
+import requests
+
+__all__: list[str] = [
+    "source_hash",
+    "fetch",
+    "csv_source"
+]
+
+# hashes of local files, by path, size and modification time
+_hashes: dict[tuple[str, int, int], str] = {}
+
+
+def source_hash(source: str) -> str:
+    """
+    Get the SHA-256 hash of a local dataset file, or an empty string for a URL
+    Hashes are kept until the file's size or modification time changes
+    """
+    if source.startswith(("http://", "https://")) or not exists(source):
+        return ""
+
+    key: tuple[str, int, int] = (source, stat(source).st_size, stat(source).st_mtime_ns)
+    if key not in _hashes:
+        digest = sha256()
+        with open(source, "rb") as dataset:
+            while chunk := dataset.read(1 << 20):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def fetch(source: str, timeout: int = 120) -> bytes | None:
+    """
+    Get the whole of a URL or a local (optionally gzipped) file path, None if it can't be got
+    """
+    if not source.startswith(("http://", "https://")):
+        if not exists(source):
+            return None
+        with (gzip_open(source, "rb") if source.endswith(".gz")
+              else open(source, "rb")) as dataset:
+            return dataset.read()
+
+    try:
+        response: requests.Response = requests.get(source, timeout=timeout)
+    except requests.exceptions.ReadTimeout:
+        return None
+    return response.content if response.ok else None
+
+
+@contextmanager
+def csv_source(source: str) -> Iterator[TextIO | None]:
+    """
+    Open a CSV from a URL (streamed) or a local file path as text for the length of the block
+    Gives None if it can't be got
+    """
+    if not source.startswith(("http://", "https://")):
+        if not exists(source):
+            yield None
+        elif source.endswith(".gz"):
+            with gzip_open(source, "rt", encoding="utf-8", newline="") as gzip_file:
+                yield gzip_file
+        else:
+            with open(source, "r", encoding="utf-8", newline="") as dataset:
+                yield dataset
+        return
+
+    try:
+        response: requests.Response = requests.get(source, stream=True, timeout=300)
+    except requests.exceptions.ReadTimeout:
+        yield None
+        return
+
+    with response:
+        if not response.ok:
+            yield None
+            return
+        response.raw.decode_content = True
+        response.raw.auto_close = False  # else it reads as closed to TextIOWrapper at the end
+        # urllib3's response reads as a binary file, though it isn't typed as one
+        with TextIOWrapper(cast(BinaryIO, response.raw), encoding="utf-8", newline="") as text:
+            yield text
@@ -0,0 +1,399 @@
+# decoder.py
+
+"""
+Decode ADS-B messages from a receiver (e.g. dump1090) into aircraft, instead of the OpenSky API
+Run with serve, a recorded capture and a port to serve the capture like a receiver would, e.g.
+python3 decoder.py serve capture.bin 30005
+"""
+
+from math import acos, atan2, cos, degrees, floor, hypot, pi, radians
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from sys import argv
+from time import sleep, time
+from typing import Any
+
+__all__: list[str] = [
+    "Decoder",
+    "PORTS"
+]
+
+Aircraft = dict[str, dict[str, Any]]
+
+# the ports receivers like dump1090 serve each kind of output on
+PORTS: dict[str, int] = {
+    "sbs": 30003,
+    "beast": 30005
+}
+
+# Beast frames are 0x1a, a type, a 6-byte timestamp, a signal level byte, then the message
+# with any 0x1a in them doubled
+_ESCAPE: int = 0x1A
+_BEAST_LENGTHS: dict[int, int] = {
+    0x31: 2,  # Mode A/C
+    0x32: 7,  # Mode S short
+    0x33: 14  # Mode S long
+}
+_BEAST_HEADER: int = 7
+
+_CHARSET: str = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######"
+_GENERATOR: int = 0xFFF409  # of the Mode S CRC
+
+# positions are decoded from an even and an odd message at most this many seconds apart,
+# or from one message near where the aircraft last was, if that was at most this many seconds ago
+_CPR_PAIR: float = 10
+_CPR_LOCAL: float = 30
+
+
+def _crc_table() -> tuple[int, ...]:
+    """
+    Internal
+    Get the Mode S CRC of each byte, for working it out a byte at a time
+    """
+    table: list[int] = []
+    for byte in range(256):
+        crc: int = byte << 16
+        for _ in range(8):
+            crc = (crc << 1) ^ _GENERATOR if crc & 0x800000 else crc << 1
+        table.append(crc & 0xFFFFFF)
+    return tuple(table)
+
+
+_CRC_TABLE: tuple[int, ...] = _crc_table()
+
+
+def _crc(data: bytes) -> int:
+    """
+    Internal
+    Get the Mode S CRC (parity) of data
+    """
+    crc: int = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ _CRC_TABLE[((crc >> 16) ^ byte) & 0xFF]
+    return crc
+
+
+def _nl(lat: float) -> int:
+    """
+    Internal
+    Get the number of longitude zones at a latitude, for CPR
+    """
+    if lat == 0:
+        return 59
+    if abs(lat) == 87:
+        return 2
+    if abs(lat) > 87:
+        return 1
+    return floor(2 * pi / acos(1 - (1 - cos(pi / 30)) / cos(radians(abs(lat))) ** 2))
+
+
+def _cpr_global(even: tuple[int, int], odd: tuple[int, int],
+                odd_newest: bool) -> tuple[float, float] | None:
+    """
+    Internal
+    Decode a position from the 17-bit CPR latitude and longitude of an even and an odd message
+    The position is the newest one's, or None if the two are in different longitude zones
+    """
+    lat_even: float = even[0] / 131072
+    lat_odd: float = odd[0] / 131072
+    j: int = floor(59 * lat_even - 60 * lat_odd + 0.5)
+    lats: list[float] = [360 / 60 * (j % 60 + lat_even), 360 / 59 * (j % 59 + lat_odd)]
+    lats = [lat - 360 if lat >= 270 else lat for lat in lats]
+    nl: int = _nl(lats[0])
+    if nl != _nl(lats[1]):
+        return None
+
+    lng_even: float = even[1] / 131072
+    lng_odd: float = odd[1] / 131072
+    m: int = floor(lng_even * (nl - 1) - lng_odd * nl + 0.5)
+    zones: int = max(nl - int(odd_newest), 1)
+    lng: float = 360 / zones * (m % zones + (lng_odd if odd_newest else lng_even))
+    return lats[odd_newest], lng - 360 if lng >= 180 else lng
+
+
+def _cpr_local(cpr: tuple[int, int], odd: bool, lat_ref: float,
+               lng_ref: float) -> tuple[float, float]:
+    """
+    Internal
+    Decode a position from the CPR latitude and longitude of one message,
+    given a position within 180 NM of it
+    """
+    lat_cpr: float = cpr[0] / 131072
+    lng_cpr: float = cpr[1] / 131072
+    dlat: float = 360 / (60 - odd)
+    lat: float = dlat * (floor(lat_ref / dlat)
+                         + floor(0.5 + (lat_ref % dlat) / dlat - lat_cpr) + lat_cpr)
+    zones: int = _nl(lat) - odd
+    dlng: float = 360 / zones if zones > 0 else 360
+    lng: float = dlng * (floor(lng_ref / dlng)
+                         + floor(0.5 + (lng_ref % dlng) / dlng - lng_cpr) + lng_cpr)
+    return lat, lng
+
+
+class _Track:
+    """
+    Internal
+    What's known about one aircraft from its messages
+    """
+    __slots__ = ("icao", "csign", "lat", "lng", "alt", "speed", "hdg", "climb",
+                 "seen", "positioned", "cpr")
+
+    def __init__(self, icao: str) -> None:
+        self.icao: str = icao
+        self.csign: str = ""
+        self.lat: float | None = None
+        self.lng: float | None = None
+        self.alt: float = 0
+        self.speed: float = 0
+        self.hdg: float = 0
+        self.climb: float = 0
+        self.seen: float = 0
+        self.positioned: float = 0
+        # the CPR latitude, longitude and time of the last even and odd messages
+        self.cpr: list[tuple[int, int, float] | None] = [None, None]
+
+    def position(self, odd: int, lat_cpr: int, lng_cpr: int, at: float) -> None:
+        """
+        Take the CPR position in a message, decoding the position if there's enough to
+        """
+        self.cpr[odd] = (lat_cpr, lng_cpr, at)
+        other: tuple[int, int, float] | None = self.cpr[1 - odd]
+        decoded: tuple[float, float] | None = None
+        if other is not None and at - other[2] <= _CPR_PAIR:
+            pair: tuple[tuple[int, int], tuple[int, int]] = (
+                (other[:2], (lat_cpr, lng_cpr)) if odd else ((lat_cpr, lng_cpr), other[:2]))
+            decoded = _cpr_global(*pair, bool(odd))
+        elif self.lat is not None and self.lng is not None and at - self.positioned <= _CPR_LOCAL:
+            decoded = _cpr_local((lat_cpr, lng_cpr), bool(odd), self.lat, self.lng)
+
+        if decoded is not None:
+            self.lat, self.lng = round(decoded[0], 6), round(decoded[1], 6)
+            self.positioned = at
+
+    def aircraft(self) -> dict[str, Any]:
+        """
+        Get the aircraft in flight_tracker format
+        """
+        return {"icao": self.icao, "csign": self.csign, "lat": self.lat, "lng": self.lng,
+                "alt": self.alt, "speed": self.speed, "hdg": self.hdg, "climb": self.climb}
+
+
+class Decoder:
+    """
+    Builds up the state of aircraft from ADS-B messages, from Beast binary frames
+    or SBS-1 BaseStation text, given in chunks as they arrive
+    Only extended squitters (DF 17 and 18) with a good CRC are used from Beast frames:
+    identification, airborne position (decoding CPR) and airborne velocity
+    Aircraft are forgotten timeout seconds after their last message
+    """
+    __slots__ = ("timeout", "tracks", "pending", "counts")
+
+    def __init__(self, timeout: float = 60) -> None:
+        self.timeout: float = timeout
+        self.tracks: dict[str, _Track] = {}
+        # the end of the last chunk, if it ended partway through a frame or line
+        self.pending: bytes = b""
+        self.counts: dict[str, int] = {"messages": 0, "decoded": 0, "bad": 0}
+
+    def _track(self, icao: str, at: float) -> _Track:
+        """
+        Internal
+        Get what's known about an aircraft, starting to keep track of it if it's new
+        """
+        track: _Track | None = self.tracks.get(icao)
+        if track is None:
+            track = self.tracks[icao] = _Track(icao)
+        track.seen = at
+        return track
+
+    def message(self, message: bytes, at: float | None = None) -> bool:
+        """
+        Take one Mode S message (without a Beast header), received at a time (now by default)
+        Returns whether anything was decoded from it
+        """
+        self.counts["messages"] += 1
+        if len(message) != 14 or message[0] >> 3 not in (17, 18):
+            return False
+        if _crc(message[:11]) != int.from_bytes(message[11:], "big"):
+            self.counts["bad"] += 1
+            return False
+
+        at = time() if at is None else at
+        track: _Track = self._track(message[1:4].hex(), at)
+        me: int = int.from_bytes(message[4:11], "big")
+        code: int = me >> 51
+
+        if 1 <= code <= 4:
+            track.csign = "".join(_CHARSET[(me >> shift) & 0x3F]
+                                  for shift in range(42, -1, -6)).replace("#", "").strip()
+        elif 9 <= code <= 18 or 20 <= code <= 22:
+            altitude: int = (me >> 36) & 0xFFF
+            if code >= 20:
+                track.alt = altitude * 3.28084
+            elif altitude & 0x10:
+                track.alt = (((altitude & 0xFE0) >> 1) | (altitude & 0xF)) * 25 - 1000
+            track.position((me >> 34) & 1, (me >> 17) & 0x1FFFF, me & 0x1FFFF, at)
+        elif code == 19:
+            subtype: int = (me >> 48) & 0x7
+            factor: int = 4 if subtype in (2, 4) else 1
+            if subtype in (1, 2):
+                east: int = ((me >> 32) & 0x3FF) - 1
+                north: int = ((me >> 21) & 0x3FF) - 1
+                if east >= 0 and north >= 0:
+                    east *= -factor if (me >> 42) & 1 else factor
+                    north *= -factor if (me >> 31) & 1 else factor
+                    track.speed = hypot(east, north)
+                    track.hdg = degrees(atan2(east, north)) % 360
+            elif subtype in (3, 4):
+                if (me >> 42) & 1:
+                    track.hdg = ((me >> 32) & 0x3FF) * 360 / 1024
+                airspeed: int = ((me >> 21) & 0x3FF) - 1
+                if airspeed >= 0:
+                    track.speed = airspeed * factor
+            rate: int = ((me >> 10) & 0x1FF) - 1
+            if rate >= 0:
+                track.climb = rate * (-64 if (me >> 19) & 1 else 64)
+        else:
+            return False
+
+        self.counts["decoded"] += 1
+        return True
+
+    def beast(self, data: bytes, at: float | None = None) -> int:
+        """
+        Take a chunk of Beast binary output, which can end partway through a frame
+        Returns how many frames were in it
+        """
+        at = time() if at is None else at
+        buffer: bytes = self.pending + data
+        position: int = 0
+        frames: int = 0
+        while True:
+            start: int = buffer.find(b"\x1a", position)
+            if start == -1:
+                position = len(buffer)
+                break
+            if start + 1 == len(buffer):
+                position = start
+                break
+            length: int | None = _BEAST_LENGTHS.get(buffer[start + 1])
+            if length is None:
+                # an escaped 0x1a, or garbage, so carry on to the next frame
+                position = start + 2 if buffer[start + 1] == _ESCAPE else start + 1
+                continue
+
+            end: int = start + 2 + _BEAST_HEADER + length
+            frame: bytes = buffer[start + 2:end]
+            if _ESCAPE in frame:
+                unescaped: bytearray = bytearray()
+                end = start + 2
+                while len(unescaped) < _BEAST_HEADER + length and end < len(buffer):
+                    if buffer[end] == _ESCAPE:
+                        if end + 1 == len(buffer) or buffer[end + 1] != _ESCAPE:
+                            break
+                        end += 1
+                    unescaped.append(buffer[end])
+                    end += 1
+                frame = bytes(unescaped)
+                if len(frame) < _BEAST_HEADER + length and end < len(buffer) - 1:
+                    # cut short by the start of another frame
+                    position = end
+                    continue
+            if len(frame) < _BEAST_HEADER + length:
+                position = start
+                break
+
+            self.message(frame[_BEAST_HEADER:], at)
+            frames += 1
+            position = end
+
+        self.pending = buffer[position:]
+        return frames
+
+    def sbs(self, data: bytes, at: float | None = None) -> int:
+        """
+        Take a chunk of SBS-1 BaseStation output (lines of comma separated values),
+        which can end partway through a line
+        Returns how many MSG lines were in it
+        """
+        at = time() if at is None else at
+        lines: list[bytes] = (self.pending + data).split(b"\n")
+        self.pending = lines.pop()
+        messages: int = 0
+        for line in lines:
+            fields: list[str] = line.decode("ascii", "replace").strip().split(",")
+            if fields[0] != "MSG" or len(fields) < 17 or not fields[4]:
+                continue
+            messages += 1
+            track: _Track = self._track(fields[4].lower(), at)
+            try:
+                if fields[10].strip():
+                    track.csign = fields[10].strip()
+                if fields[11]:
+                    track.alt = float(fields[11])
+                if fields[12]:
+                    track.speed = float(fields[12])
+                if fields[13]:
+                    track.hdg = float(fields[13])
+                if fields[14] and fields[15]:
+                    track.lat, track.lng = float(fields[14]), float(fields[15])
+                    track.positioned = at
+                if fields[16]:
+                    track.climb = float(fields[16])
+            except ValueError:
+                self.counts["bad"] += 1
+        self.counts["messages"] += messages
+        self.counts["decoded"] += messages
+        return messages
+
+    def state(self, at: float | None = None) -> Aircraft:
+        """
+        Get every aircraft with a position, in flight_tracker format keyed by ICAO address,
+        forgetting the ones not heard from in timeout seconds
+        """
+        at = time() if at is None else at
+        for icao in [icao for icao, track in self.tracks.items()
+                     if track.seen < at - self.timeout]:
+            del self.tracks[icao]
+        return {icao: track.aircraft() for icao, track in self.tracks.items()
+                if track.lat is not None}
+
+
+class _Server(ThreadingTCPServer):
+    """
+    Internal
+    TCP server handling each client in a thread, that doesn't wait for them to stop
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(path: str, port: int, rate: int = 1 << 20) -> None:
+    """
+    Serve a recorded capture (Beast or SBS-1 output saved as is) over TCP,
+    like a receiver would, sending it to each client in turn from the start, over and over,
+    at about rate bytes per second
+    """
+    with open(path, "rb") as file:
+        capture: bytes = file.read()
+
+    class Handler(StreamRequestHandler):
+        """Send the capture to a client until it disconnects"""
+        def handle(self) -> None:
+            chunk: int = max(rate // 10, 1)
+            try:
+                while True:
+                    for start in range(0, len(capture), chunk):
+                        self.wfile.write(capture[start:start + chunk])
+                        sleep(chunk / rate)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client has gone
+
+    with _Server(("", port), Handler) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(argv) >= 4 and argv[1] == "serve":
+        serve(argv[2], int(argv[3]), *(int(arg) for arg in argv[4:5]))
+    else:
+        print(__doc__.strip())
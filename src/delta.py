@@ -0,0 +1,76 @@
+# delta.py
+
+"""
+Work out what changed between states of aircraft, so only that has to be sent to the front end
+"""
+
+from collections.abc import Mapping
+from typing import Any
+
+__all__: list[str] = [
+    "Deltas"
+]
+
+Aircraft = dict[str, dict[str, Any]]
+State = Mapping[str, dict[str, Any]]
+
+
+class Deltas:
+    """
+    Keeps the last state of aircraft and a version for it
+    Every state given to update that differs from the last one gets the next version
+
+    A delta is a dict with keys:
+        base - the version it applies on top of
+        version - the version it brings it up to
+        added - the whole of each aircraft that's new (or to be replaced whole),
+                keyed by ICAO address
+        changed - only the changed fields of each aircraft, keyed by ICAO address,
+                  with None for a field that's gone
+        removed - the ICAO addresses of aircraft that are gone
+    """
+    def __init__(self) -> None:
+        self.version: int = 0
+        self.state: State = {}
+
+    def update(self, state: State) -> dict[str, Any] | None:
+        """
+        Take the new state and get the delta from the last one, or None if nothing changed
+        The state has to be a new one, not the last one changed in place
+        (for a store.AircraftStore, use apply with the changes it kept)
+        """
+        added: Aircraft = {}
+        changed: Aircraft = {}
+        for icao, new in state.items():
+            old: dict[str, Any] | None = self.state.get(icao)
+            if old is None:
+                added[icao] = new
+            elif old is not new:
+                fields: dict[str, Any] = {key: value for key, value in new.items()
+                                          if key not in old or old[key] != value}
+                fields.update((key, None) for key in old if key not in new)
+                if fields:
+                    changed[icao] = fields
+        removed: list[str] = [icao for icao in self.state if icao not in state]
+        return self.apply(state, added, changed, removed)
+
+    def apply(self, state: State, added: Mapping[str, Mapping[str, Any]], changed: Aircraft,
+              removed: list[str]) -> dict[str, Any] | None:
+        """
+        Take the new state and what changed from the last one, already worked out,
+        and get the delta, or None if nothing changed
+        """
+        if not (added or changed or removed):
+            self.state = state
+            return None
+
+        base: int = self.version
+        self.version += 1
+        self.state = state
+        return {
+            "base": base,
+            "version": self.version,
+            "added": added,
+            "changed": changed,
+            "removed": removed
+        }
@@ -0,0 +1,139 @@
+# detail.py
+
+"""
+Get everything to show about a selected aircraft and its flight in one query
+"""
+
+import sqlite3
+from cache import follow_changes, on_invalidate
+from connections import reading
+from get import _get_country_from_reg, _paths, check_dbs, info, radio
+
+__all__: list[str] = [
+    "flight_detail"
+]
+
+# the tables flight_detail() joins, by alias
+_TABLES: dict[str, str] = {
+    "aircraft": "aircraft",
+    "airline": "airlines",
+    "operator": "airlines",
+    "route": "instance.routes",
+    "orig": "airports",
+    "dest": "airports"
+}
+# the statement it runs, built from the columns of those tables (and built again when one changes)
+_statements: dict[str, str] = {}
+
+
+def _forget(table: str, _keys: list[str] | None) -> None:
+    """
+    Internal
+    Drop the statement if one of the tables it joins has changed (see cache.on_invalidate)
+    """
+    if table in [name.rpartition(".")[2] for name in _TABLES.values()]:
+        _statements.pop("detail", None)
+
+
+on_invalidate.append(_forget)
+
+
+def _statement(db: sqlite3.Connection) -> str:
+    """
+    Internal, use flight_detail()
+    Get the statement joining everything about an aircraft and its flight into one row,
+    with each column named table alias.column (see _TABLES)
+    Takes a connection to the local database with the instance database attached
+    """
+    if "detail" not in _statements:
+        columns: list[str] = []
+        for alias, table in _TABLES.items():
+            schema, _, name = table.rpartition(".")
+            columns += [f"{alias}.`{row['name']}` AS `{alias}.{row['name']}`"
+                        for row in db.execute(f"PRAGMA {schema or 'main'}.table_info({name})")]
+
+        _statements["detail"] = (
+            "SELECT " + ", ".join(columns) + " FROM (SELECT ? AS icao, ? AS csign) AS query "
+            "LEFT JOIN aircraft AS aircraft ON aircraft.icao = query.icao "
+            "LEFT JOIN airlines AS airline ON airline.icao = substr(query.csign, 1, 3) "
+            "LEFT JOIN airlines AS operator "
+            "ON operator.icao = upper(substr(aircraft.operatoricao, 1, 3)) "
+            "LEFT JOIN instance.routes AS route ON route.csign = query.csign "
+            "LEFT JOIN airports AS orig ON orig.icao = upper(route.orig) "
+            "LEFT JOIN airports AS dest ON dest.icao = upper(route.dest) "
+            "LIMIT 1"
+        )
+    return _statements["detail"]
+
+
+def flight_detail(icao: str, csign: str) -> dict[str, dict[str, str]]:
+    """
+    Get everything to show about a selected aircraft and its flight in one query
+    Takes an aircraft's 24-bit ICAO address and callsign
+    Returns a dict with keys aircraft, airline, dest, orig, route, as get.info() would for each
+    Key "route" contains the callsign ("csign") and its radio equivalent
+    The airline is the callsign's, unless it is a registration or has a digit in the first
+    three characters, and its name falls back to the aircraft's operator or owner
+    """
+    follow_changes()
+    row: sqlite3.Row | None
+    with reading(_paths["local"], _paths["instance"]) as db:
+        try:
+            row = db.execute(_statement(db), (icao.lower(), csign.upper())).fetchone()
+        except sqlite3.OperationalError:
+            # a table is missing, so create it and try again
+            _statements.pop("detail", None)
+            check_dbs(lambda _: None)
+            row = db.execute(_statement(db), (icao.lower(), csign.upper())).fetchone()
+
+    rows: dict[str, dict[str, str]] = {alias: {} for alias in _TABLES}
+    if row is not None:
+        for key in row.keys():
+            if row[key]:
+                alias, column = key.split(".", 1)
+                rows[alias][column] = row[key]
+
+    aircraft: dict[str, str] = rows["aircraft"] or {"icao": icao.lower()}
+    if "reg" in aircraft:
+        aircraft["radio"] = radio(aircraft["reg"].replace("-", ""))
+        aircraft["country"] = _get_country_from_reg(aircraft["reg"])
+
+    result: dict[str, dict[str, str]] = {
+        "aircraft": aircraft,
+        "airline": {},
+        "route": {
+            "csign": csign
+        }
+    }
+
+    if not (any(char.isdigit() for char in csign[:3]) or (
+            ("reg" in aircraft and aircraft["reg"].replace("-", "") == csign))):
+        result["airline"] = rows["airline"]
+
+    if "radio" in result["airline"]:
+        result["route"]["radio"] = " ".join([result["airline"]["radio"],
+                                             radio(csign[3:])]).strip()
+    else:
+        result["route"]["radio"] = radio(csign)
+
+    if "name" not in result["airline"]:
+        if "operatoricao" in aircraft and "name" in rows["operator"]:
+            result["airline"]["name"] = rows["operator"]["name"]
+
+        if "name" not in result["airline"]:
+            if "operator" in aircraft:
+                result["airline"]["name"] = aircraft["operator"]
+            elif "owner" in aircraft:
+                result["airline"]["name"] = aircraft["owner"]
+
+    for end in ("orig", "dest"):
+        code: str = rows["route"].get(end, "")
+        if not code:
+            result[end] = {}
+        elif rows[end]:
+            result[end] = rows[end]
+        else:
+            # not an ICAO code in the airports table, so look it up as get.info() would
+            result[end] = info(code, "airport")
+
+    return result
@@ -0,0 +1,328 @@
+# feed.py
+
+"""
+Keep the aircraft state up to date in the background from a feed
+"""
+
+from json import JSONDecodeError, JSONDecoder, load
+from socket import create_connection, socket
+from os import listdir
+from os.path import isdir, isfile, join
+from sys import stderr, stdin
+from time import perf_counter, time
+from typing import Any, Callable, Iterable, Iterator
+from gevent import Greenlet, sleep, spawn
+from gevent.fileobject import FileObject
+import requests
+from decoder import Decoder, PORTS
+from get import info_many
+from opensky import convert, ENDPOINT, stream
+from shared import SharedState
+from store import AircraftStore
+
+__all__: list[str] = [
+    "Aircraft",
+    "Source",
+    "Feed",
+    "opensky_source",
+    "file_source",
+    "replay_source",
+    "stdin_source",
+    "receiver_source",
+    "shared_source",
+    "documents",
+    "from_setting"
+]
+
+Aircraft = dict[str, dict[str, str | int | float]]
+# a source gets either an OpenSky API aircraft list (to be converted, and which can be an iterator
+# getting each state vector as it arrives) or aircraft already converted
+# a source raises EOFError when it has nothing more to give, which stops the feed
+Source = Callable[[], Iterable[list[str | int | float]] | Aircraft]
+
+_CHUNK_SIZE: int = 1 << 16  # bytes read from the OpenSky API or a receiver at a time
+
+
+# MARK: - Sources
+def opensky_source(endpoint: str = ENDPOINT, timeout: int = 120) -> Source:
+    """
+    Get the states from the OpenSky API
+    Limited to 100 worldwide requests per day without an account, so keep the interval long
+    The response is parsed as it arrives (see opensky.stream), so converting starts with the
+    first state vector and the whole body is never held at once
+    """
+    def source() -> Iterator[list[str | int | float]]:
+        with requests.get(endpoint, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            yield from stream(response.iter_content(_CHUNK_SIZE))
+    return source
+
+
+def file_source(path: str) -> Source:
+    """
+    Get the aircraft from a JSON file, read again every time so it can be replaced while running
+    Takes either an OpenSky API response or the output of opensky.py
+    """
+    def source() -> Iterable[list[str | int | float]] | Aircraft:
+        with open(path, "r", encoding="utf-8") as file:
+            data: dict = load(file)
+        return data["states"] if isinstance(data.get("states"), list) else data
+    return source
+
+
+def replay_source(directory: str) -> Source:
+    """
+    Get the aircraft from each of the JSON files in a directory in turn (sorted by name),
+    going back to the first after the last, to replay recorded states
+    """
+    paths: list[str] = sorted(join(directory, name) for name in listdir(directory)
+                              if name.endswith(".json"))
+    position: list[int] = [0]
+
+    def source() -> Iterable[list[str | int | float]] | Aircraft:
+        if not paths:
+            raise FileNotFoundError(directory)
+        path: str = paths[position[0] % len(paths)]
+        position[0] += 1
+        return file_source(path)()
+    return source
+
+
+def documents(lines: Iterable[str],
+              log: Callable[[str], object] = lambda message: print(message, file=stderr)
+              ) -> Iterator[Any]:
+    """
+    Get each JSON document in lines as soon as it's complete, e.g. newline-delimited JSON
+    A document can also span lines (e.g. when pretty printed), in which case it's parsed again
+    on a line that could end it (not indented, and ending in a bracket), or otherwise once
+    there are twice as many lines of it as when it last didn't parse
+    A line that can't be part of a document (as JSON can't break a line inside a value)
+    is dropped with whatever came before it, and output to log
+    Raises ValueError if the lines end partway through a document
+    """
+    decoder: JSONDecoder = JSONDecoder()
+    pending: str = ""
+    attempted: int = 0
+    for line in lines:
+        pending += line
+        pending = pending.lstrip()
+        closing: bool = line[:1] not in ("", " ", "\t") and line.rstrip()[-1:] in ("]", "}")
+        while pending and (closing or len(pending) >= 2 * attempted):
+            try:
+                document, end = decoder.raw_decode(pending)
+            except JSONDecodeError as error:
+                # an error before the end of the lines so far is in a complete line,
+                # so it won't parse however many more come
+                if not pending.endswith("\n") or error.pos >= len(pending):
+                    attempted = len(pending)
+                    break
+                broken: int = pending.index("\n", error.pos) + 1
+                log(f"Skipped invalid JSON ({error.msg}): {pending[:broken].strip()[:200]}")
+                pending = pending[broken:].lstrip()
+                attempted = 0
+                continue
+            yield document
+            pending = pending[end:].lstrip()
+            attempted = 0
+
+    # everything left, however many documents that is
+    while pending:
+        document, end = decoder.raw_decode(pending)
+        yield document
+        pending = pending[end:].lstrip()
+
+
+def stdin_source() -> Source:
+    """
+    Get the aircraft from each JSON document read from stdin in turn, waiting for the next one
+    Takes OpenSky API responses or the output of opensky.py, one per line to keep feeding it
+    (e.g. from a script printing a state every few seconds), or one on its own
+    Stdin is read in a thread so the server carries on while waiting
+    """
+    states: Iterator[Any] = documents(iter(FileObject(stdin, "r").readline, ""))
+
+    def source() -> Iterable[list[str | int | float]] | Aircraft:
+        data: dict | None = next(states, None)
+        if data is None:
+            raise EOFError("stdin")
+        return (data["states"] or []) if "states" in data else data
+    return source
+
+
+def receiver_source(kind: str, host: str, port: int | None = None,
+                    max_backoff: float = 60) -> Source:
+    """
+    Get the aircraft decoded (see decoder.py) from the output of an ADS-B receiver
+    (e.g. dump1090) over TCP, either "sbs" for SBS-1 BaseStation (port 30003 by default)
+    or "beast" for Beast binary (port 30005 by default)
+    The receiver is read in the background from the first poll, reconnecting if it goes away,
+    and each poll gets the aircraft decoded so far, with their registration, type and icon
+    """
+    decoder: Decoder = Decoder()
+    take: Callable[[bytes], int] = decoder.beast if kind == "beast" else decoder.sbs
+    reader: list[Greenlet] = []
+
+    def read() -> None:
+        failures: int = 0
+        while True:
+            try:
+                connection: socket = create_connection((host, port or PORTS[kind]))
+                with connection:
+                    failures = 0
+                    while data := connection.recv(_CHUNK_SIZE):
+                        take(data)
+            except OSError:
+                failures += 1
+            decoder.pending = b""
+            sleep(min(2 ** failures, max_backoff))
+
+    def source() -> Aircraft:
+        if not reader:
+            reader.append(spawn(read))
+        state: Aircraft = decoder.state()
+        basics: dict[str, dict[str, str]] = info_many(state, "basic")
+        return {icao: {**aircraft, **basics[icao]} for icao, aircraft in state.items()}
+    return source
+
+
+def shared_source(path: str, wait: float = 0.05) -> Source:
+    """
+    Get the aircraft another process writes into the SharedState at path (see shared.py),
+    waiting for each new state, so the feed can poll it with an interval of 0
+    Waiting only reads the sequence at the start of the file every wait seconds
+    """
+    shared: SharedState = SharedState(path)
+
+    def source() -> Aircraft:
+        while (state := shared.read()) is None:
+            sleep(wait)
+        return state
+    return source
+
+
+def from_setting(setting: str) -> Source | None:
+    """
+    Get the source for the feed setting
+    "opensky" for the OpenSky API, "sbs://host:port" or "beast://host:port" for a receiver
+    (see receiver_source, the port can be left out), a directory to replay, a JSON file,
+    or an empty string (or anything else) for None, to read states from stdin instead
+    """
+    if setting.lower() == "opensky":
+        return opensky_source()
+    kind, separator, address = setting.partition("://")
+    if separator and kind.lower() in PORTS:
+        host, _, port = address.partition(":")
+        return receiver_source(kind.lower(), host or "localhost", int(port) if port else None)
+    if isdir(setting):
+        return replay_source(setting)
+    if isfile(setting):
+        return file_source(setting)
+    return None
+
+
+# MARK: - Feed
+class Feed:
+    """
+    Polls a source in the background, converting what it gets and writing it into the state
+    The state is a store.AircraftStore, updated in place without yielding to other greenlets,
+    so readers always see one complete poll
+    Functions in on_update are called with the state after every successful poll,
+    when its added, changed and removed have what that poll changed
+    """
+    def __init__(self, source: Source | None = None,
+                 interval: float = 60,
+                 max_backoff: float = 900,
+                 state: Aircraft | None = None) -> None:
+        self.source: Source | None = source
+        self.interval: float = interval
+        self.max_backoff: float = max_backoff
+        self.state: AircraftStore = AircraftStore(state)
+        self.on_update: list[Callable[[AircraftStore], object]] = []
+        self.metrics: dict[str, float | int | str] = {
+            "cycles": 0,
+            "failures": 0,
+            "aircraft": len(self.state),
+            "fetch_ms": 0,
+            "convert_ms": 0,
+            "total_ms": 0,
+            "updated": 0,
+            "error": ""
+        }
+        self.greenlet: Greenlet | None = None
+
+    @classmethod
+    def from_stdin(cls) -> "Feed":
+        """
+        Make a feed reading states from stdin as they come (see stdin_source)
+        Waits for the first state before returning
+        """
+        feed: Feed = cls(stdin_source(), 0)
+        feed.poll()
+        return feed
+
+    def poll(self) -> None:
+        """
+        Get, convert and write in the state once, updating the metrics
+        Raises whatever the source raises
+        A source streaming state vectors is read while converting, so that time is in convert_ms
+        """
+        if self.source is None:
+            return
+
+        start: float = perf_counter()
+        data: Iterable[list[str | int | float]] | Aircraft = self.source()
+        fetched: float = perf_counter()
+        state: Aircraft = data if isinstance(data, dict) else convert(data)
+        converted: float = perf_counter()
+
+        self.state.update(state)
+        for callback in self.on_update:
+            callback(self.state)
+
+        self.metrics.update({
+            "cycles": int(self.metrics["cycles"]) + 1,
+            "aircraft": len(state),
+            "fetch_ms": round((fetched - start) * 1000, 1),
+            "convert_ms": round((converted - fetched) * 1000, 1),
+            "total_ms": round((perf_counter() - start) * 1000, 1),
+            "updated": time(),
+            "error": ""
+        })
+
+    def run(self) -> None:
+        """
+        Poll forever, waiting the interval between polls
+        After a failed poll, waits twice as long as the last wait (up to max_backoff)
+        before retrying, starting from at least a second
+        Stops when the source raises EOFError
+        """
+        failures: int = 0
+        while True:
+            try:
+                self.poll()
+                failures = 0
+            except EOFError:
+                self.greenlet = None
+                return
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                failures += 1
+                self.metrics["failures"] = int(self.metrics["failures"]) + 1
+                self.metrics["error"] = repr(error)
+            # sources without an interval (e.g. stdin) wait at least a second after a failure
+            sleep(min((max(self.interval, 1) if failures else self.interval) * 2 ** failures,
+                      self.max_backoff))
+
+    def start(self) -> None:
+        """
+        Start polling in a greenlet, if there is a source and it hasn't already started
+        """
+        if self.source is not None and self.greenlet is None:
+            self.greenlet = spawn(self.run)
+
+    def stop(self) -> None:
+        """
+        Stop polling
+        """
+        if self.greenlet is not None:
+            self.greenlet.kill()
+            self.greenlet = None
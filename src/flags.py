@@ -0,0 +1,107 @@
+# flags.py
+
+"""
+Flags from flags.xml, rendered once into SVG files ready to serve
+"""
+
+from copy import copy
+from functools import lru_cache
+from gzip import compress
+from hashlib import sha256
+from xml.etree.ElementTree import parse, tostring, Element
+
+__all__: list[str] = [
+    "Asset",
+    "Flags"
+]
+
+_NAMESPACE: str = "http://www.w3.org/2000/svg"
+_SIZE: int = 512
+
+
+class Asset:
+    """
+    A file rendered ahead of time, with its gzipped version and an ETag for each
+    """
+    __slots__ = ("body", "gzipped", "etag", "gzipped_etag", "mimetype")
+
+    def __init__(self, body: bytes, mimetype: str = "image/svg+xml") -> None:
+        self.body: bytes = body
+        self.gzipped: bytes = compress(body, mtime=0)
+        # the encodings are different representations, so each needs its own strong ETag
+        digest: str = sha256(body).hexdigest()[:20]
+        self.etag: str = digest
+        self.gzipped_etag: str = digest + "-gz"
+        self.mimetype: str = mimetype
+
+
+def _render(element: Element, **attributes: str) -> str:
+    """
+    Internal
+    Get a flag as SVG, with extra attributes on the svg element
+    Leaves out its id, which would clash with the views of a sprite
+    """
+    svg: Element = copy(element)
+    svg.attrib = {**attributes, **{key: value for key, value in element.attrib.items()
+                                   if key != "id"}}
+    svg.tail = None
+    return tostring(svg, encoding="unicode")
+
+
+class Flags:
+    """
+    Every flag in flags.xml by ISO 2-letter code (lowercase), rendered when it's made
+    Flags that aren't there get the unknown flag ("xx") instead
+    """
+    def __init__(self, path: str = "flags.xml") -> None:
+        self.elements: dict[str, Element] = {element.attrib["id"]: element
+                                             for element in parse(path).getroot()
+                                             if "id" in element.attrib}
+        self.flags: dict[str, Asset] = {
+            country: Asset(_render(element, xmlns=_NAMESPACE, viewBox=f"0 0 {_SIZE} {_SIZE}",
+                                   height=str(_SIZE), width=str(_SIZE)).encode())
+            for country, element in self.elements.items()}
+
+    def _code(self, country: str) -> str:
+        """
+        Internal
+        Get the code of the flag for a country, the unknown flag's if there isn't one
+        """
+        return country.lower() if country.lower() in self.elements else "xx"
+
+    def flag(self, country: str) -> Asset:
+        """
+        Get the flag of a country by its ISO 2-letter code
+        """
+        return self.flags[self._code(country)]
+
+    def sprite(self, countries: list[str]) -> Asset:
+        """
+        Get one SVG with the flags of the countries side by side,
+        and a view of each one with the code as its id, to use as sprite.svg#gb
+        """
+        return self._sprite(tuple(sorted({country.lower() for country in countries
+                                          if country.isalpha()})))
+
+    @lru_cache(maxsize=64)
+    def _sprite(self, countries: tuple[str, ...]) -> Asset:
+        """
+        Internal
+        Render a sprite for sorted, lowercase codes (see sprite)
+        Countries without a flag share the unknown flag, so it's only drawn once
+        """
+        positions: dict[str, int] = {}
+        for country in countries:
+            positions.setdefault(self._code(country), len(positions))
+
+        views: list[str] = [f"<view id=\"{country}\" viewBox=\""
+                            f"{positions[self._code(country)] * _SIZE} 0 {_SIZE} {_SIZE}\" />"
+                            for country in countries]
+        drawn: list[str] = [_render(self.elements[code], x=str(position * _SIZE), y="0",
+                                    height=str(_SIZE), width=str(_SIZE),
+                                    viewBox=f"0 0 {_SIZE} {_SIZE}")
+                            for code, position in positions.items()]
+
+        return Asset((f"<svg xmlns=\"{_NAMESPACE}\" "
+                      f"viewBox=\"0 0 {max(len(positions), 1) * _SIZE} {_SIZE}\">"
+                      + "".join(views) + "".join(drawn) + "</svg>").encode())
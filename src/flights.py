@@ -0,0 +1,339 @@
+# flights.py
+
+"""
+Log the flights taken for My Flights, counting the statistics it shows as they're added
+"""
+
+from csv import reader
+from io import StringIO
+from itertools import islice
+from json import dumps, loads
+from typing import Callable, Iterable, Iterator, TypedDict
+import sqlite3
+from connections import reading, writing
+from get import _INGEST_CHUNK_SIZE, _paths, info_many, STRINGS
+
+__all__: list[str] = [
+    "ImportReport",
+    "check_dbs",
+    "my_flights",
+    "add_flights",
+    "mfr24_to_mf"
+]
+
+# the columns of my_flights, in order, and the ones that make a flight unique
+_MY_FLIGHTS_COLUMNS: tuple[str, ...] = ("date", "orig", "dest", "csign", "reg", "type")
+_MY_FLIGHTS_KEY: tuple[str, ...] = ("date", "csign", "orig", "dest")
+# the columns of a My Flightradar24 CSV used, by header and by where they are without it
+_MFR24_COLUMNS: dict[str, tuple[str, int]] = {
+    "date": ("Date", 0),
+    "number": ("Flight number", 1),
+    "orig": ("From", 2),
+    "dest": ("To", 3),
+    "airline": ("Airline", 7),
+    "type": ("Aircraft", 8),
+    "reg": ("Registration", 9)
+}
+# the tables, in the order they're created
+_TABLES: dict[str, str] = {
+    "my_flights": "CREATE TABLE my_flights "
+                  "('date' TEXT, 'orig' TEXT, 'dest' TEXT, 'csign' TEXT, 'reg' TEXT, 'type' TEXT)",
+    "my_flights_stats": "CREATE TABLE my_flights_stats "
+                        "('kind' TEXT, 'key' TEXT, 'flights' INTEGER, 'info' TEXT, "
+                        "PRIMARY KEY (kind, key))"
+}
+
+
+class ImportReport(TypedDict):
+    """TypedDict for what adding flights to my_flights did"""
+    read: int
+    added: int
+    updated: int
+    unchanged: int
+    repeated: int
+    skipped: list[int]
+
+
+def _tally_flights(db: sqlite3.Connection,
+                   flights: Iterable[dict[str, str] | sqlite3.Row],
+                   change: int = 1) -> None:
+    """
+    Internal
+    Count flights into the My Flights statistics in my_flights_stats (see my_flights),
+    or out of them with a change of -1, in the transaction of the instance connection given
+    Each row is a kind (airports, airlines, types, continent, country or count), a key,
+    the number of flights and, for airports, airlines and types, the JSON of what to show
+    Airports, airlines and types are looked up once per batch rather than once per flight,
+    and the JSON of each one counted is rebuilt from that lookup, so it follows the datasets
+    """
+    flights = list(flights)
+    airports: dict[str, dict[str, str]] = info_many(
+        {flight[end] for flight in flights for end in ("orig", "dest") if flight[end]}, "airport")
+    airlines: dict[str, dict[str, str]] = info_many(
+        {flight["csign"][:3] for flight in flights if flight["csign"]}, "airline")
+    icons: dict[str, dict[str, str]] = info_many(
+        {flight["type"] for flight in flights if flight["type"]}, "icontype")
+
+    tallies: dict[tuple[str, str], int] = {}
+    details: dict[tuple[str, str], dict[str, str]] = {}
+
+    def tally(kind: str, key: str, detail: dict[str, str] | None = None) -> None:
+        """Count a flight into a statistic"""
+        tallies[kind, key] = tallies.get((kind, key), 0) + change
+        if detail is not None:
+            details.setdefault((kind, key), detail)
+
+    for flight in flights:
+        ends: list[dict[str, str]] = []
+        for end in ("orig", "dest"):
+            if flight[end]:
+                airport: dict[str, str] = airports[flight[end]]
+                # by ICAO code, even when the flight has the IATA code
+                tally("airports", airport.get("icao") or flight[end], airport)
+                for place in ("continent", "country"):
+                    if airport.get(place):
+                        tally(place, airport[place])
+                ends.append(airport)
+
+        if len(ends) == 2:
+            orig: dict[str, str] = ends[0]
+            dest: dict[str, str] = ends[1]
+            if orig.get("continent") != dest.get("continent"):
+                tally("count", "inc")
+            tally("count", "dom" if orig.get("country") == dest.get("country") else "int")
+            if orig.get("region") == dest.get("region"):
+                tally("count", "rnl")
+
+        if flight["csign"]:
+            airline: dict[str, str] = airlines[flight["csign"][:3]]
+            tally("airlines", airline.get("icao") or flight["csign"][:3],
+                  {"name": flight["csign"][:3], **airline})
+
+        if flight["type"]:
+            tally("types", flight["type"],
+                  {"icon": icons[flight["type"]]["icon"], "icao": flight["type"]})
+
+    db.executemany("INSERT INTO my_flights_stats (kind, key, flights, info) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT (kind, key) DO UPDATE SET flights = flights + excluded.flights, "
+                   "info = excluded.info",
+                   ((kind, key, flights_count, dumps(details.get((kind, key), {})))
+                    for (kind, key), flights_count in tallies.items()))
+    if change < 0:
+        db.execute("DELETE FROM my_flights_stats WHERE flights <= 0")
+
+
+def _upsert_flights(db: sqlite3.Connection, rows: list[tuple[str, ...]],
+                    seen: set[tuple[str, ...]]) -> tuple[int, int, int]:
+    """
+    Internal, use add_flights() or mfr24_to_mf()
+    Add rows (in the order of _MY_FLIGHTS_COLUMNS) to my_flights in the transaction of the
+    instance connection given, counting them into the statistics
+    A flight already there (with the same date, csign, orig and dest) has its reg and type
+    replaced instead, and only counted out and in again if they changed
+    A flight in the rows more than once is added as the last of them
+    Returns how many of the flights not in seen (the ones already in the same import)
+    were added, updated and already there unchanged, and adds the flights to seen
+    """
+    # the upsert needs the unique index, which an instance made before it won't have yet
+    _unique_flights(db)
+    # the last of each flight in the rows
+    flights: dict[tuple[str, ...], dict[str, str]] = {}
+    for row in rows:
+        flight: dict[str, str] = dict(zip(_MY_FLIGHTS_COLUMNS, row))
+        flights[tuple(flight[column] for column in _MY_FLIGHTS_KEY)] = flight
+
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS my_flights_imported "
+               "('date' TEXT, 'csign' TEXT, 'orig' TEXT, 'dest' TEXT)")
+    db.execute("DELETE FROM temp.my_flights_imported")
+    db.executemany("INSERT INTO temp.my_flights_imported VALUES (?, ?, ?, ?)", flights)
+    existing: dict[tuple[str, ...], sqlite3.Row] = {
+        tuple(row[column] for column in _MY_FLIGHTS_KEY): row for row in db.execute(
+            "SELECT my_flights.* FROM my_flights "
+            "JOIN temp.my_flights_imported USING (date, csign, orig, dest)")}
+
+    replaced: dict[tuple[str, ...], sqlite3.Row] = {
+        key: row for key, row in existing.items()
+        if (row["reg"], row["type"]) != (flights[key]["reg"], flights[key]["type"])}
+    changed: list[dict[str, str]] = [flight for key, flight in flights.items()
+                                     if key not in existing or key in replaced]
+    db.executemany("INSERT INTO my_flights (date, orig, dest, csign, reg, type) "
+                   "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (date, csign, orig, dest) "
+                   "DO UPDATE SET reg = excluded.reg, type = excluded.type",
+                   (tuple(flight.values()) for flight in changed))
+    _tally_flights(db, replaced.values(), -1)
+    _tally_flights(db, changed)
+
+    first: list[tuple[str, ...]] = [key for key in flights if key not in seen]
+    seen.update(first)
+    added: int = sum(key not in existing for key in first)
+    updated: int = sum(key in replaced for key in first)
+    return added, updated, len(first) - added - updated
+
+
+def _unique_flights(db: sqlite3.Connection) -> None:
+    """
+    Internal
+    Make flights in my_flights unique by date, csign, orig and dest (see add_flights)
+    in the transaction of the instance connection given, if they aren't already
+    Keeps the first of any flight logged more than once (e.g. by importing a log twice),
+    and counts the statistics again if there were any
+    """
+    if db.execute("SELECT name FROM sqlite_master WHERE type='index' "
+                  "AND name = 'idx_my_flights_flight'").fetchone() is not None:
+        return
+
+    removed: int = db.execute("DELETE FROM my_flights WHERE rowid NOT IN "
+                              "(SELECT min(rowid) FROM my_flights "
+                              "GROUP BY date, csign, orig, dest)").rowcount
+    db.execute("CREATE UNIQUE INDEX idx_my_flights_flight ON my_flights (date, csign, orig, dest)")
+    if removed > 0 and db.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                  "AND name = 'my_flights_stats'").fetchone() is not None:
+        db.execute("DELETE FROM my_flights_stats")
+        _tally_flights(db, db.execute("SELECT * FROM my_flights").fetchall())
+
+
+def check_dbs(output: Callable[[str], None] = print) -> None:
+    """
+    Check if the my_flights and my_flights_stats tables are present, creating them if not,
+    and that flights in my_flights are unique (see _unique_flights)
+    Takes a callable to output logs to, as get.check_dbs() does
+    my_flights_stats is counted from the flights already in my_flights when it's created
+    """
+    with writing(_paths["instance"]) as db:
+        missing: list[str] = [table for table in _TABLES
+                              if db.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                            "AND name = ?", (table,)).fetchone() is None]
+        for index, table in enumerate(missing, start=1):
+            output(STRINGS["logs"]["creatingtable"].format(i=index, l=len(missing),
+                                                           t=table, p=_paths["instance"]))
+            db.execute(_TABLES[table])
+            if table == "my_flights_stats":
+                # from the flights already there
+                _tally_flights(db, db.execute("SELECT * FROM my_flights").fetchall())
+        # including ones logged before they were unique
+        _unique_flights(db)
+
+
+def my_flights() -> dict[str, dict[str, list[dict[str, str | int]]] | dict[str, int] | list[str]
+                              | list[dict[str, str]]]:
+    """
+    Get my flights, with the statistics counted as they were added (see add_flights)
+    Airports, airlines and types are sorted by number of flights, then by when first flown
+    """
+    with reading(_paths["instance"]) as db:
+        flights: list[dict[str, str]] = [dict(row) for row in
+                                         db.execute("SELECT * FROM my_flights")]
+        stats: list[sqlite3.Row] = db.execute("SELECT kind, key, flights, info "
+                                              "FROM my_flights_stats "
+                                              "ORDER BY flights DESC, rowid").fetchall()
+
+    entities: dict[str, list[dict[str, str | int]]] = {
+        "airlines": [],
+        "airports": [],
+        "types": []
+    }
+
+    counts: dict[str, int] = {
+        "inc": 0,
+        "int": 0,
+        "dom": 0,
+        "rnl": 0
+    }
+
+    places: dict[str, list[str]] = {
+        "continent": [],
+        "country": []
+    }
+
+    for kind, key, flights_count, detail in stats:
+        if kind in entities:
+            entities[kind].append({**loads(detail), "flights": flights_count})
+        elif kind in places:
+            places[kind].append(key)
+        elif kind == "count":
+            counts[key] = flights_count
+
+    return {"entities": entities,
+            "counts": counts,
+            "continents": sorted(places["continent"]),
+            "countries": sorted(places["country"]),
+            "flights": flights}
+
+
+def add_flights(flights: Iterable[dict[str, str]]) -> ImportReport:
+    """
+    Add flights to my_flights, each a dict with a date, orig, dest, csign, reg and type
+    (any left out are empty), counting them into the statistics in the same transaction
+    A flight already there (with the same date, csign, orig and dest) has its reg and type
+    updated instead of being added again
+    Returns how many flights were read, added, updated, already there unchanged,
+    and repeats of one earlier in the flights (the last of which is the one added)
+    """
+    rows: list[tuple[str, ...]] = [tuple(flight.get(column) or "" for column in _MY_FLIGHTS_COLUMNS)
+                                   for flight in flights]
+    with writing(_paths["instance"]) as db:
+        added, updated, unchanged = _upsert_flights(db, rows, set())
+    return {"read": len(rows),
+            "added": added,
+            "updated": updated,
+            "unchanged": unchanged,
+            "repeated": len(rows) - added - updated - unchanged,
+            "skipped": []}
+
+
+def mfr24_to_mf(mfr24: str | Iterable[str]) -> ImportReport:
+    """
+    Add flights from a My Flightradar24 CSV export to my_flights (see add_flights),
+    given as a string or as lines (e.g. a file opened with newline=""), read as it goes
+    Flights already there are updated rather than added again, so importing a newer export
+    of the same log only adds the new flights
+    Everything is added in one transaction, so nothing is if the import fails partway through
+    Returns how many rows were read, added, updated, already there unchanged, and repeats
+    of a flight earlier in the export (the last of which is the one added),
+    and the line numbers of the rows skipped because they're missing columns or a date
+    """
+    def codes(field: str, length: int = 0) -> str:
+        """Get the codes in the last brackets of a field without slashes, the last length of them"""
+        start: int = field.rfind("(")
+        end: int = field.rfind(")")
+        if not -1 < start < end:
+            return ""
+        inside: str = field[start + 1:end].replace("/", "").strip()
+        return inside[-length:] if length else inside
+
+    csv_reader = reader(StringIO(mfr24) if isinstance(mfr24, str) else mfr24)
+    header: list[str] = next(csv_reader, [])
+    # the line each row ends on, as a row can go over several if a field has a line break
+    rows_read: Iterator[tuple[int, list[str]]] = ((csv_reader.line_num, row) for row in csv_reader)
+    positions: dict[str, int] = {field: header.index(name) if name in header else position
+                                 for field, (name, position) in _MFR24_COLUMNS.items()}
+    report: ImportReport = {"read": 0, "added": 0, "updated": 0, "unchanged": 0, "repeated": 0,
+                            "skipped": []}
+    seen: set[tuple[str, ...]] = set()
+
+    with writing(_paths["instance"]) as db:
+        for chunk in iter(lambda: list(islice(rows_read, _INGEST_CHUNK_SIZE)), []):
+            rows: list[tuple[str, ...]] = []
+            for line, row in chunk:
+                try:
+                    columns: dict[str, str] = {field: row[position].strip()
+                                               for field, position in positions.items()}
+                except IndexError:
+                    columns = {}
+                if not columns.get("date"):
+                    report["skipped"].append(line)
+                    continue
+                rows.append((columns["date"],
+                             codes(columns["orig"], 4),
+                             codes(columns["dest"], 4),
+                             codes(columns["airline"], 3) + columns["number"][2:],
+                             columns["reg"],
+                             codes(columns["type"])))
+            report["read"] += len(chunk)
+
+            added, updated, unchanged = _upsert_flights(db, rows, seen)
+            report["added"] += added
+            report["updated"] += updated
+            report["unchanged"] += unchanged
+            report["repeated"] += len(rows) - added - updated - unchanged
+    return report
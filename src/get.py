@@ -6,16 +6,20 @@ Get things for flight_tracker
 
 from csv import reader
 from getpass import getuser
+from itertools import islice
 from json import load
 from locale import getlocale
 from os import makedirs
-from os.path import dirname, exists, expanduser
-from re import Match, search
+from os.path import abspath, dirname, exists, expanduser, isdir, join
 from sys import platform
-from typing import Callable, cast, Iterator, TypedDict
+from threading import RLock
+from typing import Callable, Iterable, Iterator, TypedDict
 import sqlite3
-import requests
 from bs4 import BeautifulSoup, NavigableString, Tag
+from cache import cache_key, cached, invalidate, on_invalidate
+from connections import after_fork as forget_connections, reading, writing
+from datasets import csv_source, fetch, source_hash
+from registry import PrefixTrie, Registry
 
 __all__: list[str] = [
     "DEFAULTS",
@@ -26,10 +30,9 @@ __all__: list[str] = [
     "check_dbs",
     "add_route",
     "info",
-    "radio",
-    "image",
-    "my_flights",
-    "mfr24_to_mf"
+    "info_many",
+    "after_fork",
+    "radio"
 ]
 
 _URLS: dict[str, str] = {
@@ -40,6 +43,33 @@ _URLS: dict[str, str] = {
     "prefixes": "https://raw.githubusercontent.com/jack-jw/flight_tracker/main/prefixes.csv"
 }
 
+# local copies of the above are used instead if they're in the datasets directory (see settings)
+# or bundled in the repository root, either as is or gzipped (with .gz on the end)
+_FILES: dict[str, str] = {
+    "airlines_wiki": "List_of_airline_codes.html",
+    "aircraft": "aircraftDatabase.csv",
+    "airports": "airports.csv",
+    "icontypes": "icontypes.csv",
+    "prefixes": "prefixes.csv"
+}
+_BUNDLED: str = dirname(dirname(abspath(__file__)))
+
+# the columns that identify a row, for only changing the rows that have changed on an update
+_KEYS: dict[str, tuple[str, ...]] = {
+    "aircraft": ("icao",),
+    "airlines": ("icao",),
+    "airports": ("icao", "iata")
+}
+# the columns rows are looked up by, indexed after a table is loaded
+_INDEXES: dict[str, tuple[str, ...]] = {
+    "aircraft": ("icao",),
+    "airlines": ("icao",),
+    "airports": ("icao", "iata"),
+    "icontypes": ("type",),
+    "prefixes": ("prefix",),
+    "routes": ("csign",)
+}
+
 # really bad paths, settings and strings implementation. fix!!
 # paths
 _paths: dict[str, str] = {file: expanduser("~") for file in ("instance", "local", "settings")}
@@ -72,7 +102,15 @@ DEFAULTS: dict[str, str | int | bool] = {
     "port": 5003,
     "usewikimedia": False,
     "fontdisambiguation": False,
-    "language": SYS_LANG
+    "language": SYS_LANG,
+    "datasets": "",
+    "registry": False,
+    "feed": "",
+    "feedinterval": 60,
+    "clusterzoom": 6,
+    "tracks": join(dirname(_paths["instance"]), "tracks.db"),
+    "trackhours": 24,
+    "workers": 1
 }
 if not exists(_paths["settings"]):
     if platform == "darwin":
@@ -112,53 +150,177 @@ class Strings(TypedDict):
 with open("strings.json", "r", encoding="utf-8") as sfr:
     STRINGS: Strings = load(sfr)[settings.get("language", "en")]
 
+# databases (connections are pooled, see connections.py)
+_CHUNK_SIZE: int = 500  # bound parameters per bulk query, kept under SQLite's limit
+_INGEST_CHUNK_SIZE: int = 25000  # CSV rows per executemany when building a table
+_rebuild_locks: dict[str, RLock] = {}
+
+# the aircraft table is also held in memory if the registry setting is on
+_registries: dict[str, Registry] = {}
+# and the prefixes table is always held as a trie, for longest prefix matches
+_tries: dict[str, PrefixTrie] = {}
+
 # MARK: - Internal functions
+def _source(name: str, datasets: str = "") -> str:
+    """
+    Internal
+    Get where to load a dataset (a key of _URLS) from
+    A local copy in the datasets directory (or bundled) if there is one, else its URL
+    """
+    for directory in (datasets or str(settings["datasets"]), _BUNDLED):
+        if directory and isdir(directory):
+            for path in (join(directory, _FILES[name]), join(directory, _FILES[name] + ".gz")):
+                if exists(path):
+                    return path
+    return _URLS[name]
+
+def _dataset_hash(table: str) -> str:
+    """
+    Internal
+    Get the hash of the local file a table was last loaded from, if the table is still there
+    """
+    with reading(_paths["local"]) as db:
+        try:
+            result: sqlite3.Row | None = db.execute(
+                "SELECT hash FROM datasets WHERE name = ? AND name IN "
+                "(SELECT name FROM sqlite_master WHERE type='table')", (table,)).fetchone()
+        except sqlite3.OperationalError:
+            return ""
+    return result[0] if isinstance(result, sqlite3.Row) else ""
+
+def _record_dataset(table: str, source: str, digest: str, changed: bool = True) -> None:
+    """
+    Internal
+    Record where a table was loaded from and the hash of the file if it was local
+    The table's version goes up by one if its rows changed
+    """
+    with writing(_paths["local"]) as db:
+        db.execute("CREATE TABLE IF NOT EXISTS datasets "
+                   "('name' TEXT PRIMARY KEY, 'source' TEXT, 'hash' TEXT, 'updated' TEXT, "
+                   "'version' INTEGER DEFAULT 0)")
+        if "version" not in [row["name"] for row in db.execute("PRAGMA table_info(datasets)")]:
+            db.execute("ALTER TABLE datasets ADD COLUMN 'version' INTEGER DEFAULT 0")
+        db.execute("INSERT OR REPLACE INTO datasets VALUES (?, ?, ?, datetime('now'), "
+                   "COALESCE((SELECT version FROM datasets WHERE name = ?), 0) + ?)",
+                   (table, source, digest, table, int(changed)))
+
+def _index(db: sqlite3.Connection, table_name: str) -> None:
+    """
+    Internal
+    Index the columns a table is looked up by (see _INDEXES) that don't lead an index already
+    Indexes are named after the table too, since index names are shared by the whole database
+    """
+    indexed: set[str] = set()
+    for index in db.execute(f"PRAGMA index_list({table_name})").fetchall():
+        first: sqlite3.Row | None = db.execute(f"PRAGMA index_info({index['name']})").fetchone()
+        if first is not None:
+            indexed.add(first["name"])
+
+    for column in _INDEXES.get(table_name, ()):
+        if column not in indexed:
+            db.execute(f"CREATE INDEX idx_{table_name}_{column} ON {table_name}({column})")
+
+def _load_table(database: str,
+                table_name: str,
+                columns: list[str],
+                rows: Iterable[list[str]],
+                progress: Callable[[int], None] | None = None,
+                key_columns: tuple[str, ...] = ()) -> list[str] | None:
+    """
+    Internal, use update_db()
+    Load rows into a shadow copy of a table, then swap it in for the table in one transaction
+    Readers keep getting the old table until the swap commits, so it never goes missing
+    Rows are inserted in chunks, so memory use doesn't grow with the number of rows
+    If given, progress is called with the number of rows loaded so far after every chunk
+
+    If key columns are given and the table is already there with the same columns, the shadow is
+    a temporary table instead and only the rows of keys that have changed are deleted/inserted
+    Returns the values of the key columns that changed, or None if the whole table was swapped
+    """
+    columns_str: str = ", ".join([f"'{col}' TEXT" for col in columns])
+    row_iter: Iterator[list[str]] = iter(rows)
+    changed: list[str] | None = None
+
+    with writing(database) as db:
+        incremental: bool = bool(key_columns) and columns == [
+            row["name"] for row in db.execute(f"PRAGMA table_info({table_name})")]
+        shadow: str = f"temp.{table_name}_new" if incremental else f"{table_name}_new"
+        insert: str = f"INSERT INTO {shadow} VALUES ({', '.join(['?'] * len(columns))})"
+
+        # the shadow isn't read until it's swapped in, so there's nothing to gain from syncing
+        db.execute("PRAGMA synchronous=OFF")
+        try:
+            db.execute(f"DROP TABLE IF EXISTS {shadow}")
+            db.execute(f"CREATE TABLE {shadow} ({columns_str})")
+
+            loaded: int = 0
+            while chunk := list(islice(row_iter, _INGEST_CHUNK_SIZE)):
+                db.executemany(insert, chunk)
+                loaded += len(chunk)
+                if progress is not None:
+                    progress(loaded)
+            db.commit()
+
+            db.execute("BEGIN")
+            if incremental:
+                keys: str = ", ".join(key_columns)
+                db.execute(f"DROP TABLE IF EXISTS temp.{table_name}_changed")
+                db.execute(f"CREATE TABLE temp.{table_name}_changed AS SELECT DISTINCT {keys} FROM "
+                           f"(SELECT * FROM (SELECT * FROM main.{table_name} "
+                           f"EXCEPT SELECT * FROM {shadow}) "
+                           f"UNION ALL SELECT * FROM (SELECT * FROM {shadow} "
+                           f"EXCEPT SELECT * FROM main.{table_name}))")
+                db.execute(f"DELETE FROM main.{table_name} WHERE ({keys}) IN "
+                           f"(SELECT {keys} FROM temp.{table_name}_changed)")
+                db.execute(f"INSERT INTO main.{table_name} SELECT * FROM {shadow} "
+                           f"WHERE ({keys}) IN (SELECT {keys} FROM temp.{table_name}_changed)")
+                changed = list(dict.fromkeys(value for row in
+                                             db.execute(f"SELECT * FROM temp.{table_name}_changed")
+                                             for value in row if value))
+                db.execute(f"DROP TABLE temp.{table_name}_changed")
+                db.execute(f"DROP TABLE {shadow}")
+            else:
+                db.execute(f"DROP TABLE IF EXISTS {table_name}")
+                db.execute(f"ALTER TABLE {shadow} RENAME TO {table_name}")
+            # after loading, so each index is built once instead of updated for every row
+            _index(db, table_name)
+            db.commit()
+        finally:
+            if db.in_transaction:
+                db.rollback()
+            db.execute("PRAGMA synchronous=FULL")
+        db.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    return changed
+
 def _csv_to_db(database: str,
-               url: str,
+               source: str,
                table_name: str,
                column_names: tuple[str, ...],
-               index_column: str = "") -> None:
+               progress: Callable[[int], None] | None = None,
+               key_columns: tuple[str, ...] = ()) -> tuple[bool, list[str] | None]:
     """
     Internal, use update_db()
-    Get a CSV from the web and add it to a database
+    Stream a CSV from the web (or a local file path) into a table in a database
+    Columns starting with del_ are left out
+    Returns whether the CSV could be got and loaded, and what _load_table() returns
     """
-    try:
-        response: requests.Response = requests.get(url, timeout=300)
-        if not response.ok:
-            return
-    except requests.exceptions.ReadTimeout:
-        return
-
-    data: list[str] = response.text.splitlines()
-
     fil_columns: list[str] = [col for col in column_names if not col.startswith("del_")]
     fil_indices: list[int] = [i for i, col in enumerate(column_names) if not col.startswith("del_")]
 
-    db: sqlite3.Connection = sqlite3.connect(database)
-    cursor: sqlite3.Cursor = db.cursor()
-
-    try:
-        cursor.execute(f"DROP TABLE {table_name}")
-    except sqlite3.OperationalError:
-        pass
-
-    columns_str: str = ", ".join([f"'{col}' TEXT" for col in fil_columns])
-    cursor.execute(f"CREATE TABLE {table_name} ({columns_str})")
+    with csv_source(source) as csv_file:
+        if csv_file is None:
+            return False, None
 
-    csv_reader: Iterator[list[str]] = reader(data)
-    next(csv_reader)
-    for row in csv_reader:
-        fil_row = [row[i] for i in fil_indices]
-        cursor.execute(f"INSERT INTO {table_name} "
-                       f"VALUES ({', '.join(['?' for _ in range(len(fil_columns))])}"
-                       ")", fil_row)
-
-    if index_column:
-        cursor.execute(f"CREATE INDEX idx_{index_column} ON {table_name}({index_column})")
-
-    cursor.close()
-    db.commit()
-    db.close()
+        csv_reader: Iterator[list[str]] = reader(csv_file)
+        next(csv_reader, None)
+        return True, _load_table(database,
+                                 table_name,
+                                 fil_columns,
+                                 ([row[i] if i < len(row) else "" for i in fil_indices]
+                                  for row in csv_reader if row),
+                                 progress,
+                                 key_columns)
 
 def _get_row(table: str,
              search_column: str,
@@ -169,21 +331,15 @@ def _get_row(table: str,
     Get a row from the DB (instance if table is routes, else local)
     If loopback is True, always returns the search column with the value of the query
     """
-    db: sqlite3.Connection = sqlite3.connect(_paths["instance"] if table == "routes"
-                                             else _paths["local"])
-    db.row_factory = sqlite3.Row
-    cursor: sqlite3.Cursor = db.cursor()
-
-    while True:
-        try:
-            cursor.execute(f"SELECT * FROM {table} WHERE `{search_column}` = '{query}'")
-            break
-        except sqlite3.OperationalError:
-            update_db(table)
-
-    result: sqlite3.Row | None = cursor.fetchone()
-    cursor.close()
-    db.close()
+    result: sqlite3.Row | None
+    with reading(_paths["instance"] if table == "routes" else _paths["local"]) as db:
+        while True:
+            try:
+                result = db.execute(f"SELECT * FROM {table} WHERE `{search_column}` = ?",
+                                    (query,)).fetchone()
+                break
+            except sqlite3.OperationalError:
+                update_db(table)
 
     row: dict[str, str] = {}
 
@@ -197,202 +353,466 @@ def _get_row(table: str,
 
     return row
 
+def _get_rows(table: str,
+              search_column: str,
+              queries: Iterable[str],
+              loopback: bool = False) -> dict[str, dict[str, str]]:
+    """
+    Internal, use info_many()
+    Get the first row for each of the queries from the DB, keyed by query, in chunked IN queries
+    Every chunk is padded to the same size so they all share one prepared statement
+    If loopback is True, queries without a row get the search column with the value of the query
+    """
+    unique: list[str] = list(dict.fromkeys(queries))
+    rows: dict[str, dict[str, str]] = {}
+    if not unique:
+        return rows
+
+    statement: str = (f"SELECT * FROM {table} WHERE `{search_column}` "
+                      f"IN ({', '.join(['?'] * _CHUNK_SIZE)})")
+    with reading(_paths["instance"] if table == "routes" else _paths["local"]) as db:
+        for start in range(0, len(unique), _CHUNK_SIZE):
+            chunk: list[str] = unique[start:start + _CHUNK_SIZE]
+            chunk += [chunk[-1]] * (_CHUNK_SIZE - len(chunk))
+            while True:
+                try:
+                    results: list[sqlite3.Row] = db.execute(statement, chunk).fetchall()
+                    break
+                except sqlite3.OperationalError:
+                    update_db(table)
+
+            for result in results:
+                if result[search_column] not in rows:
+                    rows[result[search_column]] = {key: value for key, value in dict(result).items()
+                                                   if value}
+
+    if loopback:
+        for query in unique:
+            rows.setdefault(query, {search_column: query})
+
+    return rows
+
+def _load_registry() -> Registry:
+    """
+    Internal, use _get_aircraft()
+    Load the aircraft table into an in-memory registry
+    """
+    with reading(_paths["local"]) as db:
+        while True:
+            try:
+                cursor: sqlite3.Cursor = db.execute("SELECT * FROM aircraft")
+                break
+            except sqlite3.OperationalError:
+                update_db("aircraft")
+        return Registry([column[0] for column in cursor.description], cursor)
+
+def _get_aircraft(query: str, loopback: bool = False) -> dict[str, str]:
+    """
+    Internal, use info()
+    Get a row from the aircraft table, from the registry if the registry setting is on
+    """
+    if not settings["registry"]:
+        return _get_row("aircraft", "icao", query, loopback)
+
+    if "aircraft" not in _registries:
+        _registries["aircraft"] = _load_registry()
+    return _registries["aircraft"].get(query) or ({"icao": query} if loopback else {})
+
+def _get_many_aircraft(queries: Iterable[str],
+                       loopback: bool = False) -> dict[str, dict[str, str]]:
+    """
+    Internal, use info_many()
+    Get the rows for each of the queries from the aircraft table, keyed by query,
+    from the registry if the registry setting is on
+    """
+    if not settings["registry"]:
+        return _get_rows("aircraft", "icao", queries, loopback)
+
+    rows: dict[str, dict[str, str]] = {}
+    for query in queries:
+        row: dict[str, str] = _get_aircraft(query, loopback)
+        if row:
+            rows[query] = row
+    return rows
+
+def _load_prefixes() -> PrefixTrie:
+    """
+    Internal, use _get_country_from_reg()
+    Load the prefixes table into a trie
+    """
+    with reading(_paths["local"]) as db:
+        while True:
+            try:
+                return PrefixTrie((row["prefix"], row["country"]) for row in
+                                  db.execute("SELECT prefix, country FROM prefixes"))
+            except sqlite3.OperationalError:
+                update_db("prefixes")
+
 def _get_country_from_reg(reg: str) -> str:
     """
     Internal, use info()
     Get the corresponding ISO 2-letter country code for an aircraft registration
+    Uses the longest registration prefix it matches
     """
-    db = sqlite3.connect(_paths["local"])
-    cursor = db.cursor()
+    if "prefixes" not in _tries:
+        _tries["prefixes"] = _load_prefixes()
+    return _tries["prefixes"].get(reg)
 
-    while True:
-        try:
-            cursor.execute("SELECT country FROM prefixes WHERE ? LIKE prefix || '%'", (reg,))
-            break
-        except sqlite3.OperationalError:
-            update_db("prefixes")
+def _get_countries_from_regs(regs: Iterable[str]) -> dict[str, str]:
+    """
+    Internal, use info_many()
+    Get the corresponding ISO 2-letter country codes for aircraft registrations, keyed by reg
+    """
+    if "prefixes" not in _tries:
+        _tries["prefixes"] = _load_prefixes()
+    return _tries["prefixes"].get_many(regs)
 
-    result: tuple | None = cursor.fetchone()
-    cursor.close()
-    db.close()
-    return result[0] if isinstance(result, tuple) else ""
+def _reload(table: str, keys: list[str] | None) -> None:
+    """
+    Internal
+    Load the aircraft registry or prefix trie again when its table changes (see cache.on_invalidate)
+    """
+    if table == "aircraft" and "aircraft" in _registries and keys != []:
+        _registries["aircraft"] = _load_registry()
+    if table == "prefixes" and "prefixes" in _tries:
+        _tries["prefixes"] = _load_prefixes()
 
-# MARK: - Public functions
-def update_db(table: str) -> None:
+on_invalidate.append(_reload)
+
+def _info(query: str, kind: str) -> dict[str, str]:
     """
-    Update a table in the database
-    Takes a table name (aircraft, airports, airlines, icontypes, prefixes, my_flights, routes)
-    Passing "all" updates every table
+    Internal, use info()
+    Get information from the database, skipping the cache
+    """
+    result: dict[str, str] = {}
+
+    match kind.lower():
+        case "aircraft":
+            query = query.lower()
+            result = _get_aircraft(query, loopback=True)
+            if "reg" in result:
+                result["radio"] = radio(result["reg"].replace("-", ""))
+                result["country"] = _get_country_from_reg(result["reg"])
+        case "airline":
+            query = query.upper()[:3]
+            result = _get_row("airlines", "icao", query)
+        case "airport":
+            query = query.upper()
+            if len(query) == 3:
+                result = _get_row("airports", "iata", query, loopback=True)
+            elif len(query) == 4:
+                result = _get_row("airports", "icao", query, loopback=True)
+        case "basic":
+            aircraft_row: dict[str, str] = _get_aircraft(query.lower())
+            if "reg" in aircraft_row:
+                result["reg"] = aircraft_row["reg"]
+
+            result["icon"] = "generic"
+            if "type" in aircraft_row:
+                result["type"] = aircraft_row["type"]
+                icon_row: dict[str, str] = _get_row("icontypes", "type", result["type"])
+                if icon_row:
+                    result["icon"] = icon_row["icon"]
+        case "icontype":
+            query = query.upper()
+            result = _get_row("icontypes", "type", query, loopback=True)
+            if "icon" not in result:
+                result["icon"] = "generic"
+        case "route":
+            query = query.upper()
+            result = _get_row("routes", "csign", query, loopback=True)
 
-    Updating the routes/my_flights table only creates the table if it doesn't exist
+    return result
+
+def _info_many(queries: list[str], kind: str) -> dict[str, dict[str, str]]:
+    """
+    Internal, use info_many()
+    Get information from the database for many queries at once, skipping the cache
     """
+    # an empty dict for each query of an unknown kind, as info() gets
+    results: dict[str, dict[str, str]] = {query: {} for query in queries}
+    rows: dict[str, dict[str, str]]
+
+    match kind.lower():
+        case "aircraft":
+            rows = _get_many_aircraft([query.lower() for query in queries], loopback=True)
+            countries: dict[str, str] = _get_countries_from_regs(row["reg"] for row in rows.values()
+                                                                 if "reg" in row)
+            for query in queries:
+                results[query] = dict(rows[query.lower()])
+                if "reg" in results[query]:
+                    reg: str = results[query]["reg"]
+                    results[query]["radio"] = radio(reg.replace("-", ""))
+                    results[query]["country"] = countries[reg]
+        case "airline":
+            rows = _get_rows("airlines", "icao", [query.upper()[:3] for query in queries])
+            results = {query: dict(rows.get(query.upper()[:3], {})) for query in queries}
+        case "airport":
+            for length, column in ((3, "iata"), (4, "icao")):
+                rows = _get_rows("airports", column, [query.upper() for query in queries
+                                                      if len(query) == length], loopback=True)
+                results.update({query: dict(rows[query.upper()]) for query in queries
+                                if len(query) == length})
+        case "basic":
+            rows = _get_many_aircraft([query.lower() for query in queries])
+            icons: dict[str, dict[str, str]] = _get_rows("icontypes", "type",
+                                                         [row["type"] for row in rows.values()
+                                                          if "type" in row])
+            for query in queries:
+                aircraft_row: dict[str, str] = rows.get(query.lower(), {})
+                results[query] = {}
+                if "reg" in aircraft_row:
+                    results[query]["reg"] = aircraft_row["reg"]
+
+                results[query]["icon"] = "generic"
+                if "type" in aircraft_row:
+                    results[query]["type"] = aircraft_row["type"]
+                    if aircraft_row["type"] in icons:
+                        results[query]["icon"] = icons[aircraft_row["type"]]["icon"]
+        case "icontype":
+            rows = _get_rows("icontypes", "type", [query.upper() for query in queries],
+                             loopback=True)
+            results = {query: {"icon": "generic", **rows[query.upper()]} for query in queries}
+        case "route":
+            rows = _get_rows("routes", "csign", [query.upper() for query in queries],
+                             loopback=True)
+            results = {query: dict(rows[query.upper()]) for query in queries}
+
+    return results
+
+def _update_db(table: str,
+               output: Callable[[str], None] | None = None,
+               datasets: str = "",
+               incremental: bool = True) -> list[str] | None:
+    """
+    Internal, use update_db()
+    Update a table in the database without checking if it's already being updated
+    Returns the keys of the rows that changed, or None if any of them could have
+    """
+    def progress(rows: int) -> None:
+        """Output the number of rows loaded so far"""
+        if output is not None:
+            output(STRINGS["logs"]["loadedrows"].format(t=table.lower(), n=rows))
+
+    name: str = "airlines_wiki" if table.lower() == "airlines" else table.lower()
+    source: str = _source(name, datasets) if name in _URLS else ""
+    digest: str = source_hash(source)
+    if digest and digest == _dataset_hash(table.lower()):
+        return []
+
+    keys: tuple[str, ...] = _KEYS.get(table.lower(), ()) if incremental else ()
+    loaded: bool = False
+    changed: list[str] | None = None
     match table.lower():
         case "aircraft":
-            _csv_to_db(_paths["local"],
-                       _URLS["aircraft"],
-                       "aircraft",
-                       ("icao",
-                        "reg",
-                        "man",
-                        "del_man_name",
-                        "del_model",
-                        "type",
-                        "del_serial",
-                        "del_linenum",
-                        "del_typecode",
-                        "operator",
-                        "del_operatorcsign",
-                        "operatoricao",
-                        "del_operatoriata",
-                        "owner",
-                        "del_test_reg",
-                        "reged",
-                        "del_reged_until",
-                        "del_status",
-                        "built",
-                        "firstflight",
-                        "del_seat_config",
-                        "del_engines",
-                        "del_modes",
-                        "del_adsb",
-                        "del_acars",
-                        "del_notes",
-                        "del_categorydesc"),
-                       "icao")
+            loaded, changed = _csv_to_db(_paths["local"],
+                                         source,
+                                         "aircraft",
+                                         ("icao",
+                                          "reg",
+                                          "man",
+                                          "del_man_name",
+                                          "del_model",
+                                          "type",
+                                          "del_serial",
+                                          "del_linenum",
+                                          "del_typecode",
+                                          "operator",
+                                          "del_operatorcsign",
+                                          "operatoricao",
+                                          "del_operatoriata",
+                                          "owner",
+                                          "del_test_reg",
+                                          "reged",
+                                          "del_reged_until",
+                                          "del_status",
+                                          "built",
+                                          "firstflight",
+                                          "del_seat_config",
+                                          "del_engines",
+                                          "del_modes",
+                                          "del_adsb",
+                                          "del_acars",
+                                          "del_notes",
+                                          "del_categorydesc"),
+                                         progress,
+                                         keys)
 
         case "airlines":
-            try:
-                response: requests.Response = requests.get(_URLS["airlines_wiki"], timeout=120)
-                if not response.ok:
-                    return
-            except requests.exceptions.ReadTimeout:
-                return
+            content: bytes | None = fetch(source)
+            if content is None:
+                return []
 
-            airlines_table: Tag | NavigableString | None = BeautifulSoup(response.content,
+            airlines_table: Tag | NavigableString | None = BeautifulSoup(content,
                                                                          "html.parser").find(
                 "table", class_="wikitable")
 
             if isinstance(airlines_table, Tag):
-                adb: sqlite3.Connection = sqlite3.connect(_paths["local"])
-                acursor: sqlite3.Cursor = adb.cursor()
-
-                try:
-                    acursor.execute("DROP TABLE airlines")
-                except sqlite3.OperationalError:
-                    pass
-
-                acursor.execute("CREATE TABLE airlines "
-                                "('iata' TEXT, "
-                                "'icao' TEXT, "
-                                "'name' TEXT, "
-                                "'radio' TEXT, "
-                                "'country' TEXT)")
-
-                rows: list[Tag] = airlines_table.find_all("tr")[1:]
-
                 noadd: tuple[str, str, str] = (
                     "defunct",
                     "no longer allocated",
                     "icao code in use by another company"
                 )
 
-                for row in rows:
-                    columns: list[Tag] = row.find_all("td")
-                    data: list[str | None] = [column.get_text(strip=True) for column in columns]
-                    data += [""] * (6 - len(data))
-                    if data[5] is None or not any(word in data[5].lower() for word in noadd):
-                        acursor.execute("INSERT INTO airlines VALUES (?, ?, ?, ?, ?)", data[:5])
-
-                acursor.close()
-                adb.commit()
-                adb.close()
+                def airline_rows(rows: list[Tag]) -> Iterator[list[str]]:
+                    """Get the airlines to add from the rows of the table"""
+                    for row in rows:
+                        columns: list[Tag] = row.find_all("td")
+                        data: list[str] = [column.get_text(strip=True) for column in columns]
+                        data += [""] * (6 - len(data))
+                        if not any(word in data[5].lower() for word in noadd):
+                            yield data[:5]
+
+                changed = _load_table(_paths["local"],
+                                      "airlines",
+                                      ["iata", "icao", "name", "radio", "country"],
+                                      airline_rows(airlines_table.find_all("tr")[1:]),
+                                      progress=progress,
+                                      key_columns=keys)
+                loaded = True
 
         case "airports":
-            _csv_to_db(_paths["local"],
-                       _URLS["airports"],
-                       "airports",
-                       ("del_id",
-                        "del_ident",
-                        "del_type",
-                        "name",
-                        "lat",
-                        "lng",
-                        "alt",
-                        "continent",
-                        "country",
-                        "region",
-                        "muni",
-                        "airlines",
-                        "icao",
-                        "iata",
-                        "del_local",
-                        "website",
-                        "wiki",
-                        "del_keywords"))
+            loaded, changed = _csv_to_db(_paths["local"],
+                                         source,
+                                         "airports",
+                                         ("del_id",
+                                          "del_ident",
+                                          "del_type",
+                                          "name",
+                                          "lat",
+                                          "lng",
+                                          "alt",
+                                          "continent",
+                                          "country",
+                                          "region",
+                                          "muni",
+                                          "airlines",
+                                          "icao",
+                                          "iata",
+                                          "del_local",
+                                          "website",
+                                          "wiki",
+                                          "del_keywords"),
+                                         progress=progress,
+                                         key_columns=keys)
 
         case "icontypes":
-            _csv_to_db(_paths["local"],
-                       _URLS["icontypes"],
-                       "icontypes",
-                       ("type", "icon", "size"),
-                       "type")
+            loaded, changed = _csv_to_db(_paths["local"],
+                                         source,
+                                         "icontypes",
+                                         ("type", "icon", "size"),
+                                         progress)
 
         case "prefixes":
-            _csv_to_db(_paths["local"],
-                       _URLS["prefixes"],
-                       "prefixes",
-                       ("prefix", "country"),
-                       "prefix")
-
-        case "my_flights" | "routes":
-            idb: sqlite3.Connection = sqlite3.connect(_paths["instance"])
-            icursor: sqlite3.Cursor = idb.cursor()
-
-            icursor.execute("SELECT name FROM sqlite_master WHERE type='table' "
-                            f"AND name = '{table.lower()}'")
-            if icursor.fetchone() is None:
-                if table.lower() == "my_flights":
-                    icursor.execute("CREATE TABLE my_flights "
-                                    "('date' TEXT, 'orig' TEXT, 'dest' TEXT, "
-                                    "'csign' TEXT, 'reg' TEXT, 'type' TEXT)")
-                else:
-                    icursor.execute("CREATE TABLE routes "
-                                    "('csign' TEXT, 'orig' TEXT, 'dest' TEXT)")
-
-            icursor.close()
-            idb.commit()
-            idb.close()
+            loaded, changed = _csv_to_db(_paths["local"],
+                                         source,
+                                         "prefixes",
+                                         ("prefix", "country"),
+                                         progress)
+
+        case "routes" | "images":
+            with writing(_paths["instance"]) as idb:
+                icursor: sqlite3.Cursor = idb.cursor()
+
+                icursor.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                                "AND name = ?", (table.lower(),))
+                if icursor.fetchone() is None:
+                    if table.lower() == "images":
+                        icursor.execute("CREATE TABLE images "
+                                        "('key' TEXT PRIMARY KEY, 'src' TEXT, 'attr' TEXT, "
+                                        "'link' TEXT, 'fetched' REAL)")
+                    else:
+                        icursor.execute("CREATE TABLE routes "
+                                        "('csign' TEXT, 'orig' TEXT, 'dest' TEXT)")
+
+                icursor.close()
 
         case "all":
             for table_name in ("aircraft", "airports", "airlines",
                                "icontypes", "prefixes", "routes"):
-                update_db(table_name)
+                update_db(table_name, output, datasets, incremental)
+
+    if loaded:
+        _record_dataset(table.lower(), source, digest, changed != [])
+    return changed
+
+# MARK: - Public functions
+def update_db(table: str,
+              output: Callable[[str], None] | None = None,
+              datasets: str = "",
+              incremental: bool = True) -> None:
+    """
+    Update a table in the database
+    Takes a table name (aircraft, airports, airlines, icontypes, prefixes, routes, images),
+    the My Flights tables are created by flights.check_dbs()
+    Passing "all" updates every table
+    Takes an optional callable to output progress logs to while loading large tables
+
+    Datasets are loaded from local copies in a directory if they're there (see _FILES for names),
+    from the datasets argument, else the datasets setting, else the ones bundled in the repository
+    If a local copy hasn't changed since the table was last loaded from it, it isn't loaded again
+
+    If incremental, the aircraft, airlines and airports tables (if already there) only have the
+    rows that have changed replaced, and only those rows are dropped from the info cache
+
+    Tables are rebuilt alongside the old ones and swapped in at the end, so lookups carry on
+    Calling it for a table that's already being updated waits for that update instead
+
+    Updating the routes/images table only creates the table if it doesn't exist
+    """
+    lock: RLock = _rebuild_locks.setdefault(table.lower(), RLock())
+    if not lock.acquire(blocking=False):
+        # already being updated by another greenlet or thread, so wait for that instead
+        with lock:
+            return
+
+    try:
+        changed: list[str] | None = _update_db(table, output, datasets, incremental)
+    finally:
+        lock.release()
 
-def check_dbs(output: Callable[[str], None] = print) -> None:
+    invalidate(table.lower(), changed)
+
+def check_dbs(output: Callable[[str], None] = print, datasets: str = "") -> None:
     """
     Check if all the databases and tables are present
     Takes a callable to output logs to (e.g. lambda l: print(l, file=sys.stderr) outputs to stderr)
+    Tables with a local copy of their dataset (see update_db) are also updated if it has changed
+    Then loads the registration prefixes into a trie for looking up countries
     """
     dbs: dict[str, tuple[str, ...]] = {
         _paths["local"]: ("airlines", "aircraft", "airports", "icontypes", "prefixes"),
-        _paths["instance"]: ("routes", "my_flights")
+        _paths["instance"]: ("routes", "images")
     }
     needs_update: list[tuple[str, str]] = []
 
     for db_path, tables in dbs.items():
-        db: sqlite3.Connection = sqlite3.connect(db_path)
-        cursor: sqlite3.Cursor = db.cursor()
-        for table in tables:
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'")
-            if cursor.fetchone() is None:
-                needs_update += [(db_path, table)]
-        cursor.close()
-        db.close()
+        with reading(db_path) as db:
+            for table in tables:
+                if db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?",
+                              (table,)).fetchone() is None:
+                    needs_update += [(db_path, table)]
+                elif db_path == _paths["local"]:
+                    digest: str = source_hash(_source("airlines_wiki" if table == "airlines"
+                                                      else table, datasets))
+                    if digest and digest != _dataset_hash(table):
+                        needs_update += [(db_path, table)]
 
     for index, (db_path, table) in enumerate(needs_update, start=1):
         output(STRINGS["logs"]["creatingtable"].format(i=index, l=len(needs_update),
                                                        t=table, p=db_path))
-        update_db(table)
+        update_db(table, output, datasets)
+
+    # tables made before they were indexed
+    for db_path, tables in dbs.items():
+        with writing(db_path) as db:
+            for table in tables:
+                if db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?",
+                              (table,)).fetchone() is not None:
+                    _index(db, table)
+
+    if "prefixes" not in _tries:
+        _tries["prefixes"] = _load_prefixes()
 
 def add_route(csign: str, orig: str = "", dest: str = "") -> None:
     """
@@ -403,26 +823,26 @@ def add_route(csign: str, orig: str = "", dest: str = "") -> None:
     if not (csign and (orig or dest)):
         return
 
-    db: sqlite3.Connection = sqlite3.connect(_paths["instance"])
-    cursor: sqlite3.Cursor = db.cursor()
-    cursor.execute("SELECT * FROM routes WHERE csign = ?", (csign,))
-    row_exists: tuple | None = cursor.fetchone()
+    with writing(_paths["instance"]) as db:
+        cursor: sqlite3.Cursor = db.cursor()
+        cursor.execute("SELECT * FROM routes WHERE csign = ?", (csign,))
+        row_exists: sqlite3.Row | None = cursor.fetchone()
+
+        if isinstance(row_exists, sqlite3.Row):
+            if orig:
+                cursor.execute("UPDATE routes SET orig = ? WHERE csign = ?", (orig, csign))
+            if dest:
+                cursor.execute("UPDATE routes SET dest = ? WHERE csign = ?", (dest, csign))
+        else:
+            cursor.execute("INSERT INTO routes ("
+                           "csign, "
+                           "orig, "
+                           "dest"
+                           ") VALUES (?, ?, ?)", (csign, orig, dest))
 
-    if isinstance(row_exists, tuple):
-        if orig:
-            cursor.execute("UPDATE routes SET orig = ? WHERE csign = ?", (orig, csign))
-        if dest:
-            cursor.execute("UPDATE routes SET dest = ? WHERE csign = ?", (dest, csign))
-    else:
-        cursor.execute("INSERT INTO routes ("
-                       "csign, "
-                       "orig, "
-                       "dest"
-                       ") VALUES (?, ?, ?)", (csign, orig, dest))
+        cursor.close()
 
-    db.commit()
-    cursor.close()
-    db.close()
+    invalidate("routes", [cache_key(csign, "route")])
 
 def info(query: str, kind: str) -> dict[str, str]:
     """
@@ -443,45 +863,24 @@ def info(query: str, kind: str) -> dict[str, str]:
         basic: if aircraft info/icontype can't be found, just the icontype generic
         icontype: returns the query with icontype generic
     """
-    result: dict[str, str] = {}
+    return cached([query], kind, lambda misses: {misses[0]: _info(misses[0], kind)})[query]
 
-    match kind.lower():
-        case "aircraft":
-            query = query.lower()
-            result = _get_row("aircraft", "icao", query, loopback=True)
-            if "reg" in result:
-                result["radio"] = radio(result["reg"].replace("-", ""))
-                result["country"] = _get_country_from_reg(result["reg"])
-        case "airline":
-            query = query.upper()[:3]
-            result = _get_row("airlines", "icao", query)
-        case "airport":
-            query = query.upper()
-            if len(query) == 3:
-                result = _get_row("airports", "iata", query, loopback=True)
-            elif len(query) == 4:
-                result = _get_row("airports", "icao", query, loopback=True)
-        case "basic":
-            aircraft_row: dict[str, str] = _get_row("aircraft", "icao", query)
-            if "reg" in aircraft_row:
-                result["reg"] = aircraft_row["reg"]
-
-            result["icon"] = "generic"
-            if "type" in aircraft_row:
-                result["type"] = aircraft_row["type"]
-                icon_row: dict[str, str] = _get_row("icontypes", "type", result["type"])
-                if icon_row:
-                    result["icon"] = icon_row["icon"]
-        case "icontype":
-            query = query.upper()
-            result = _get_row("icontypes", "type", query, loopback=True)
-            if "icon" not in result:
-                result["icon"] = "generic"
-        case "route":
-            query = query.upper()
-            result = _get_row("routes", "csign", query, loopback=True)
+def info_many(queries: Iterable[str], kind: str) -> dict[str, dict[str, str]]:
+    """
+    Get information from the database for many queries at once
+    Takes the same kinds as info(), but resolves all the queries in a handful of bulk queries
+    Returns a dict of what info() would return for each query, keyed by query
+    """
+    return cached(queries, kind, lambda misses: _info_many(misses, kind))
 
-    return result
+def after_fork() -> None:
+    """
+    Stop using the database connections open when this process was forked from another
+    (e.g. by main.serve_workers), so new ones are opened as they're needed (see connections.py),
+    and forget the tables being updated by the other process
+    """
+    forget_connections()
+    _rebuild_locks.clear()
 
 def radio(string: str) -> str:
     """
@@ -529,206 +928,3 @@ def radio(string: str) -> str:
     }
 
     return " ".join([maps.get(char, char) for char in string.upper()])
-
-def image(query: str, kind: str, usewikimedia: bool = False) -> dict[str, str]:
-    """
-    Get an image of something
-    Uses Planespotters.net to get images (or Wikimedia if usewikimedia = True)
-    Returns a dict with keys src, attr, and link (link to the original page of the image)
-
-    Kinds:
-        hex - an aircraft's 24-bit ICAO address (Planespotters.net only)
-        reg - an aircraft's registration (Planespotters.net or Wikimedia)
-        other (Wikimedia only)
-    """
-    result: dict[str, str] = {
-        "src": "",
-        "attr": "",
-        "link": ""
-    }
-
-    if not usewikimedia and kind in ("hex", "reg"):
-        response: requests.Response = requests.get("https://api.planespotters.net/pub/photos/"
-                                                   + kind + "/" + query, timeout=60)
-        if "error" not in response.json() and len(response.json()["photos"]):
-            result["src"] = response.json()["photos"][0]["thumbnail_large"]["src"]
-            result["attr"] = response.json()["photos"][0]["photographer"]
-            result["link"] = response.json()["photos"][0]["link"]
-
-    elif usewikimedia and kind in ("reg", "other"):
-        # initial search
-        initial: requests.Response = requests.get("https://commons.wikimedia.org/w/api.php"
-                                                  "?action=query&format=json&list=search"
-                                                  "&srsearch=" + query +
-                                                  "&srnamespace=6&srlimit=1", timeout=60)
-
-        if not initial or initial.json()["query"]["searchinfo"]["totalhits"] == 0:
-            return result
-
-        title: str = initial.json()["query"]["search"][0]["title"]
-        result["link"] = "https://commons.wikimedia.org/wiki/" + title
-
-        # get url
-        src: requests.Response = requests.get("https://commons.wikimedia.org/w/api.php"
-                                              "?action=query&format=json&prop=imageinfo"
-                                              "&iiprop=url&titles=" + title, timeout=60)
-        result["src"] = list(src.json()["query"]["pages"].values())[0]["imageinfo"][0]["url"]
-
-        # get attribution
-        attr: requests.Response = requests.get("https://commons.wikimedia.org/w/api.php"
-                                               "?action=query&titles=" + title +
-                                               "&prop=imageinfo&iiprop=extmetadata"
-                                               "&format=json", timeout=60)
-        if attr and "-1" not in attr.json()["query"]["pages"]:
-            meta: dict[str, dict[str, str | float]] = next(
-                iter(attr.json()["query"]["pages"].values())
-            )["imageinfo"][0]["extmetadata"]
-            if str(meta["AttributionRequired"]["value"]).lower() == "true":
-                attr_elem: str | float | None = meta.get("Artist", {}).get("value")
-                if isinstance(attr_elem, str):
-                    result["attr"] = BeautifulSoup(attr_elem, "html.parser").get_text()
-
-    return result
-
-def my_flights() -> dict[str, dict[str, list[dict[str, str | int]]] | dict[str, int] | list[str]
-                              | list[dict[str, str]]]:
-    """Get my flights"""
-    update_db("my_flights")
-
-    db: sqlite3.Connection = sqlite3.connect(_paths["instance"])
-    db.row_factory = sqlite3.Row
-    cursor: sqlite3.Cursor = db.cursor()
-    cursor.execute("SELECT * FROM my_flights")
-    rows: tuple[sqlite3.Row, ...] = tuple(cursor.fetchall())
-    db.close()
-
-    def idx(data: list[dict[str, str | int]],
-            value: str,
-            key: str = "icao") -> int:
-        """Get the index of a dictionary in a list by one of its keys"""
-
-        return next((n for n, data in enumerate(data) if data.get(key) == value), -1)
-
-    entities: dict[str, list[dict[str, str | int]]] = {
-        "airlines": [],
-        "airports": [],
-        "types": []
-    }
-
-    counts: dict[str, int] = {
-        "inc": 0,
-        "int": 0,
-        "dom": 0,
-        "rnl": 0
-    }
-
-    continents: list[str] = []
-    countries: list[str] = []
-    flights: list[dict[str, str]] = []
-
-    if isinstance(rows, tuple):
-        flights = [dict(row) for row in rows]
-        i: int
-
-        for flight in flights:
-            origin_continent: str = ""
-            origin_country: str = ""
-            origin_region: str = ""
-            for airport in ("orig", "dest"):
-                i = idx(entities["airports"], flight[airport])
-                if i != -1:
-                    entities["airports"][i]["flights"] = 1 + cast(int,
-                                                                  entities["airports"][i][
-                                                                      "flights"])
-                else:
-                    entities["airports"].append({
-                        **info(flight[airport], "airport"),
-                        "flights": 1
-                    })
-                    if entities["airports"][i]["continent"] not in continents:
-                        continents.append(cast(str, entities["airports"][i]["continent"]))
-                    if entities["airports"][i]["country"] not in countries:
-                        countries.append(cast(str, entities["airports"][i]["country"]))
-
-                if airport == "orig":
-                    origin_continent = cast(str, entities["airports"][i]["continent"])
-                    origin_country = cast(str, entities["airports"][i]["country"])
-                    origin_region = cast(str, entities["airports"][i]["region"])
-                elif airport == "dest":
-                    if origin_continent != entities["airports"][i]["continent"]:
-                        counts["inc"] += 1
-                    if origin_country == entities["airports"][i]["country"]:
-                        counts["dom"] += 1
-                    else:
-                        counts["int"] += 1
-                    if origin_region == entities["airports"][i]["region"]:
-                        counts["rnl"] += 1
-
-            if flight["csign"]:
-                i = idx(entities["airlines"], flight["csign"][:3])
-                if i != -1:
-                    entities["airlines"][i]["flights"] = 1 + cast(int,
-                                                                  entities["airlines"][i][
-                                                                      "flights"])
-                else:
-                    entities["airlines"].append({
-                        "name": flight["csign"][:3],
-                        **info(flight["csign"][:3], "airline"),
-                        "flights": 1
-                    })
-
-            if flight["type"]:
-                i = idx(entities["types"], flight["type"])
-                if i != -1:
-                    entities["types"][i]["flights"] = 1 + cast(int, entities["types"][i]["flights"])
-                else:
-                    entities["types"].append({
-                        "icon": info(flight["type"], "icontype")["icon"],
-                        "icao": flight["type"],
-                        "flights": 1
-                    })
-
-        continents = sorted(continents)
-        countries = sorted(countries)
-        entities = {c: sorted(e, key=lambda v: v["flights"], reverse=True)
-                    for c, e in entities.items()}
-    return {"entities": entities,
-            "counts": counts,
-            "continents": continents,
-            "countries": countries,
-            "flights": flights}
-
-def mfr24_to_mf(mfr24: str) -> None:
-    """Add flights from a My Flightradar24 CSV (as a string) to my_flights"""
-    def brackets(string: str) -> str:
-        """Get the text in brackets in a string (and remove slashes)"""
-        match: Match[str] | None = search(r"\((.*?)\)", string)
-        result: str = ""
-        if match is not None:
-            result = match.group().replace("/", "").strip()[1:-1]
-        return result
-
-    db: sqlite3.Connection = sqlite3.connect(_paths["instance"])
-    cursor: sqlite3.Cursor = db.cursor()
-    rows: list[str] = mfr24.replace('"',"").strip().splitlines()[1:]
-    for row in rows:
-        columns: list[str] = row.split(",")
-        data: tuple[str, str, str, str, str, str] = (
-            columns[0],                                 # data
-            brackets(columns[2])[-4:],                   # orig
-            brackets(columns[3])[-4:],                   # dest
-            brackets(columns[7])[-3:] + columns[1][2:],  # csign
-            columns[9],                                 # reg
-            brackets(columns[8])                        # type
-        )
-        cursor.execute("INSERT INTO my_flights ("
-                       "date, "
-                       "orig, "
-                       "dest, "
-                       "csign, "
-                       "reg, "
-                       "type"
-                       ") VALUES (?, ?, ?, ?, ?, ?)", data)
-    cursor.close()
-    db.commit()
-    db.close()
@@ -0,0 +1,120 @@
+# images.py
+
+"""
+Get images of aircraft, kept in instance.db so the same one isn't looked up again
+"""
+
+from time import time
+import sqlite3
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from connections import POOL_SIZE, reading, writing
+from get import _paths
+
+__all__: list[str] = [
+    "image"
+]
+
+# image() results are kept in instance.db so the same aircraft isn't looked up again,
+# including when there was no image (for less time, in case one is added)
+_IMAGE_TTL: float = 7 * 86400
+_IMAGE_MISS_TTL: float = 86400
+_IMAGE_TIMEOUT: int = 20
+# one pooled session, so image lookups reuse their connections to the APIs
+_session: requests.Session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+
+
+def _fetch_image(query: str, kind: str, usewikimedia: bool) -> dict[str, str]:
+    """
+    Internal, use image()
+    Get an image of something from Planespotters.net or Wikimedia, skipping the cache
+    Wikimedia is searched and the image's URL and attribution got in the same request
+    Raises requests.RequestException if a request fails
+    """
+    result: dict[str, str] = {}
+
+    if not usewikimedia:
+        response: requests.Response = _session.get("https://api.planespotters.net/pub/photos/"
+                                                   + kind + "/" + query, timeout=_IMAGE_TIMEOUT)
+        response.raise_for_status()
+        photos: dict = response.json()
+        if "error" not in photos and photos.get("photos"):
+            result["src"] = photos["photos"][0]["thumbnail_large"]["src"]
+            result["attr"] = photos["photos"][0]["photographer"]
+            result["link"] = photos["photos"][0]["link"]
+        return result
+
+    params: dict[str, str] = {
+        "action": "query",
+        "format": "json",
+        "generator": "search",
+        "gsrsearch": query,
+        "gsrnamespace": "6",
+        "gsrlimit": "1",
+        "prop": "imageinfo",
+        "iiprop": "url|extmetadata"
+    }
+    search: requests.Response = _session.get("https://commons.wikimedia.org/w/api.php",
+                                             params=params, timeout=_IMAGE_TIMEOUT)
+    search.raise_for_status()
+    pages: dict = search.json().get("query", {}).get("pages", {})
+    if not pages:
+        return result
+
+    page: dict = next(iter(pages.values()))
+    result["link"] = "https://commons.wikimedia.org/wiki/" + page["title"]
+    if not page.get("imageinfo"):
+        return result
+
+    result["src"] = page["imageinfo"][0]["url"]
+    meta: dict[str, dict[str, str | float]] = page["imageinfo"][0].get("extmetadata", {})
+    if str(meta.get("AttributionRequired", {}).get("value")).lower() == "true":
+        attr_elem: str | float | None = meta.get("Artist", {}).get("value")
+        if isinstance(attr_elem, str):
+            result["attr"] = BeautifulSoup(attr_elem, "html.parser").get_text()
+
+    return result
+
+
+def image(query: str, kind: str, usewikimedia: bool = False) -> dict[str, str]:
+    """
+    Get an image of something
+    Uses Planespotters.net to get images (or Wikimedia if usewikimedia = True)
+    Returns a dict with keys src, attr, and link (link to the original page of the image)
+    Results are cached in instance.db for a week (a day if there was no image),
+    but not if the request failed
+
+    Kinds:
+        hex - an aircraft's 24-bit ICAO address (Planespotters.net only)
+        reg - an aircraft's registration (Planespotters.net or Wikimedia)
+        other (Wikimedia only)
+    """
+    result: dict[str, str] = {
+        "src": "",
+        "attr": "",
+        "link": ""
+    }
+
+    if not ((not usewikimedia and kind in ("hex", "reg")) or
+            (usewikimedia and kind in ("reg", "other"))):
+        return result
+
+    key: str = "/".join(("wikimedia" if usewikimedia else "planespotters", kind, query.lower()))
+    with reading(_paths["instance"]) as db:
+        row: sqlite3.Row | None = db.execute("SELECT src, attr, link, fetched FROM images "
+                                             "WHERE key = ?", (key,)).fetchone()
+    if row is not None and time() - row["fetched"] < (_IMAGE_TTL if row["src"]
+                                                      else _IMAGE_MISS_TTL):
+        return {"src": row["src"], "attr": row["attr"], "link": row["link"]}
+
+    try:
+        result.update(_fetch_image(query, kind, usewikimedia))
+    except requests.RequestException:
+        return result
+
+    with writing(_paths["instance"]) as db:
+        db.execute("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)",
+                   (key, result["src"], result["attr"], result["link"], time()))
+    return result
@@ -7,28 +7,106 @@ Start the HTTP server
 # pylint: disable=wrong-import-position,wrong-import-order
 from gevent.monkey import patch_all
 patch_all()
+from gevent.pywsgi import WSGIServer
 
-from os import urandom
-from sys import stdin
-from random import shuffle
-from json import loads
-from xml.etree.ElementTree import parse, tostring, Element
-from flask import Flask, jsonify, render_template, Response
+from os import fork, kill, urandom, waitpid
+from signal import SIGTERM
+from socket import create_server, socket
+from time import time
+from flask import Flask, jsonify, render_template, request, Response
 from flask_socketio import SocketIO, emit
+from geventwebsocket.handler import WebSocketHandler
+from delta import Deltas
+from feed import Aircraft, Feed, from_setting, shared_source, Source
+from flags import Asset, Flags
+from shared import SharedState
+from spatial import Grid, State, Viewport
+from store import AircraftStore
+from tracks import Tracks
+from wire import ENCODING, pack_columns, pack_delta
+import cache
+import detail
+import flights
 import get
+import images
 
 get.check_dbs()
-flags: Element = parse("flags.xml").getroot()
+flights.check_dbs()
+flags: Flags = Flags("flags.xml")
 with open("aircraft.svg", "r", encoding="utf-8") as svg:
     aircraft_icons: str = svg.read()
 
-# will be replaced by the actual decoder later
-aircraft: dict[str, dict[str, str | int | float]] = loads(stdin.read())
+# polls the source in the feed setting (the OpenSky API, a receiver, or files),
+# or reads states from stdin as they come if there isn't one
+source: Source | None = from_setting(str(get.settings["feed"]))
+feed: Feed = (Feed(source, float(get.settings["feedinterval"])) if source is not None
+              else Feed.from_stdin())
 
 flask: Flask = Flask("flight_tracker")
 flask.config["SECRET_KEY"] = urandom(24)
 socketio: SocketIO = SocketIO(flask)
 
+# only what changed is sent after the first state, as a delta,
+# and each client only gets the aircraft inside its viewport
+deltas: Deltas = Deltas()
+deltas.update(feed.state)
+grid: Grid = Grid(feed.state)
+viewports: dict[str, Viewport] = {}
+# clients that asked for aircraft packed with wire.pack rather than as JSON
+packed: set[str] = set()
+
+# every position is recorded (unless trackhours is 0) for trails and replays,
+# and clients replaying have that state and grid instead of the live ones
+tracks: Tracks | None = (Tracks(str(get.settings["tracks"]), float(get.settings["trackhours"]))
+                         if get.settings["trackhours"] else None)
+replays: dict[str, tuple[Aircraft, Grid]] = {}
+# a replay sends a state at least every second, with at least this many seconds between them
+REPLAY_STEP: float = 5
+# with more than one worker, clients only connect with WebSockets (see serve_workers)
+workers: int = max(int(get.settings["workers"]), 1)
+
+def encode(delta: dict, sid: str) -> dict:
+    """
+    Get a delta (or snapshot) in the encoding a client asked for
+    """
+    return pack_delta(delta) if sid in packed else delta
+
+def broadcast_delta(state: AircraftStore) -> None:
+    """
+    Emit the delta (and clusters, when zoomed out) of its viewport to every client
+    after every poll of the feed
+    """
+    global grid  # pylint: disable=global-statement
+    delta: dict | None = deltas.apply(state, state.added, state.changed, state.removed)
+    grid = Grid(state)
+    for sid, viewport in list(viewports.items()):
+        if sid in replays:
+            continue
+        viewport_delta: dict | None = viewport.update(delta, state, grid)
+        if viewport_delta is not None:
+            socketio.emit("delta", encode(viewport_delta, sid), to=sid)
+        clusters: list | None = viewport.clusters(grid)
+        if clusters is not None:
+            socketio.emit("clusters", clusters, to=sid)
+
+feed.on_update.append(broadcast_delta)
+if tracks is not None:
+    tracks.record(feed.state)
+    feed.on_update.append(tracks.record)
+
+def request_sid() -> str:
+    """
+    Get the session ID of the client whose event is being handled
+    (flask_socketio adds it to the request, which isn't typed as having it)
+    """
+    return str(getattr(request, "sid"))
+
+def viewing(sid: str) -> tuple[State, Grid]:
+    """
+    Get the state and grid a client is looking at, the replay's if it's replaying
+    """
+    return replays.get(sid, (feed.state, grid))
+
 @flask.route("/")
 def serve_map() -> str:
     """
@@ -39,6 +117,7 @@ def serve_map() -> str:
                            initial=str(get.settings["name"])[0],
                            colour=get.settings["colour"],
                            fontdisambiguation=get.settings["fontdisambiguation"],
+                           transports=["websocket"] if workers > 1 else ["polling", "websocket"],
                            aircraft_icons=aircraft_icons)
 
 @flask.route("/aircraft.json")
@@ -46,22 +125,63 @@ def serve_aircraft_json() -> Response:
     """
     Get the current state of aircraft as a JSON file
     """
-    return jsonify(aircraft)
+    return jsonify(dict(feed.state))
+
+@flask.route("/track/<icao>.json")
+def serve_track_json(icao: str) -> Response:
+    """
+    Get the positions of an aircraft by its 24-bit ICAO address, oldest first,
+    as lists of the time, lat, lng and alt
+    Takes the since and until parameters as UNIX times, the last hour until now by default
+    """
+    if tracks is None:
+        return jsonify([])
+    now: float = time()
+    return jsonify(tracks.trail(icao, request.args.get("since", now - 3600, float),
+                                request.args.get("until", now, float)))
+
+@flask.route("/aircraft.bin")
+def serve_aircraft_bin() -> Response:
+    """
+    Get the current state of aircraft packed with wire.pack, a fraction of the size of the JSON
+    Packed straight from the columns of the state
+    """
+    return Response(pack_columns(feed.state.columns()), mimetype="application/octet-stream")
+
+def serve_asset(asset: Asset) -> Response:
+    """
+    Serve a file rendered ahead of time, gzipped if the client accepts it
+    These never change while running, so clients can keep them without asking again,
+    and get a 304 if they do ask with the ETag
+    """
+    gzipped: bool = "gzip" in request.accept_encodings
+    etag: str = asset.gzipped_etag if gzipped else asset.etag
+    response: Response
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.gzipped if gzipped else asset.body, mimetype=asset.mimetype)
+        if gzipped:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 @flask.route("/image/flag/<country>")
-def serve_flag(country: str) -> tuple[str, int, dict[str, str]]:
+def serve_flag(country: str) -> Response:
     """
     Get the flag of a country (from flags.xml) by its ISO 2-letter code
     """
-    common: str = ("<svg xmlns=\"http://www.w3.org/2000/svg\" "
-                   "viewBox=\"0 0 512 512\" height=\"512\" width=\"512\"")
-    flag_elem: Element | None = flags.find(f".//*[@id='{country.lower()}']")
-    flag: str = ""
-    if flag_elem is None:
-        flag_elem = flags.find(".//*[@id='xx']")
-    if isinstance(flag_elem, Element):
-        flag = tostring(flag_elem, encoding="unicode").replace("<svg", common)
-    return flag, 200, {"Content-Type": "image/svg+xml"}
+    return serve_asset(flags.flag(country))
+
+@flask.route("/image/flags.svg")
+def serve_flag_sprite() -> Response:
+    """
+    Get the flags of the countries in the c parameter (ISO 2-letter codes split by commas)
+    in one file, each shown with its code as the fragment, e.g. /image/flags.svg?c=fr,gb#gb
+    """
+    return serve_asset(flags.sprite(request.args.get("c", "").split(",")))
 
 @flask.route("/my")
 def serve_my_flights() -> str:
@@ -74,7 +194,7 @@ def serve_my_flights() -> str:
                            initial=str(get.settings["name"])[0],
                            colour=get.settings["colour"],
                            fontdisambiguation=get.settings["fontdisambiguation"],
-                           my_flights=get.my_flights(),
+                           my_flights=flights.my_flights(),
                            aircraft_icons=aircraft_icons)
 
 @flask.route("/my/add")
@@ -94,16 +214,118 @@ def serve_get_info_json(query: str, kind: str) -> Response:
     """
     return jsonify(get.info(query, kind))
 
+@flask.route("/feed.json")
+def serve_feed_json() -> Response:
+    """
+    Get the timings and counters of the feed's polls
+    """
+    return jsonify(feed.metrics)
+
+@flask.route("/cache.json")
+def serve_cache_json() -> Response:
+    """
+    Get the size and hit/miss/eviction counters of the info cache for each kind
+    """
+    return jsonify(cache.stats())
+
 @socketio.on("connect")
+def handle_connect(auth: dict | None = None) -> None:
+    """
+    Start keeping track of what a client has
+    It gets no aircraft until it sends its viewport
+    Aircraft are packed (see wire.py) for clients that connect with {"encoding": "packed"}
+    """
+    viewports[request_sid()] = Viewport(float(get.settings["clusterzoom"]))
+    if isinstance(auth, dict) and auth.get("encoding") == ENCODING:
+        packed.add(request_sid())
+
+@socketio.on("disconnect")
+def handle_disconnect() -> None:
+    """
+    Stop keeping track of what a client has
+    """
+    viewports.pop(request_sid(), None)
+    packed.discard(request_sid())
+    replays.pop(request_sid(), None)
+
+@socketio.on("viewport")
+def handle_viewport(bounds: list[float], zoom: float, selected: str = "") -> None:
+    """
+    Change what a client is looking at, on connecting and after every pan or zoom
+    Takes the bounds (south, west, north, east), the zoom and the ICAO address of the selected
+    aircraft (kept even outside the bounds) if there is one
+    Emits a delta adding the aircraft now in view and removing the ones that aren't,
+    and clusters instead of the aircraft when zoomed out below the clusterzoom setting
+    """
+    viewport: Viewport = viewports.setdefault(request_sid(),
+                                                 Viewport(float(get.settings["clusterzoom"])))
+    south, west, north, east = (float(bound) for bound in bounds)
+    state, state_grid = viewing(request_sid())
+    delta: dict | None = viewport.subscribe((south, west, north, east), float(zoom),
+                                            str(selected or ""), state, state_grid)
+    if delta is not None:
+        emit("delta", encode(delta, request_sid()))
+    clusters: list | None = viewport.clusters(state_grid)
+    if clusters is not None:
+        emit("clusters", clusters)
+
+@socketio.on("resync")
 def send_aircraft() -> None:
     """
-    Emit the current aircraft state dict (750 randomly picked for performance, temporary)
-    Adds the aircraft to the map on the front end
+    Emit every aircraft in a client's viewport and a new version, after it missed a delta
+    Replaces the aircraft on the front end
     """
-    aircraft_l: list[tuple[str, dict[str, str | int | float]]] = list(aircraft.items())
-    shuffle(aircraft_l)
-    shuffled: dict[str, dict[str, str | int | float]] = dict(aircraft_l[:750])
-    emit("aircraft", shuffled)
+    viewport: Viewport = viewports.setdefault(request_sid(),
+                                                 Viewport(float(get.settings["clusterzoom"])))
+    emit("aircraft", encode(viewport.snapshot(*viewing(request_sid())), request_sid()))
+
+@socketio.on("replay")
+def handle_replay(start: float, end: float, speed: float = 1) -> None:
+    """
+    Replay the aircraft recorded between two UNIX times to a client, speed times as fast
+    The client gets the aircraft in its viewport (and clusters) as it would live,
+    and goes back to live when the replay ends or it sends live
+    """
+    if tracks is None:
+        return
+    replays[request_sid()] = ({}, Grid({}))
+    socketio.start_background_task(send_replay, request_sid(), float(start), float(end),
+                                   max(float(speed), 0.1))
+
+@socketio.on("live")
+def handle_live() -> None:
+    """
+    Stop replaying to a client, sending it the live aircraft in its viewport again
+    """
+    if replays.pop(request_sid(), None) is not None:
+        send_aircraft()
+
+def send_replay(sid: str, start: float, end: float, speed: float) -> None:
+    """
+    Emit the recorded aircraft in a client's viewport from start to end, after handle_replay
+    Each state is sent as a whole, and the client is sent the live aircraft again at the end
+    Stops if the client starts another replay, goes back to live or disconnects
+    """
+    if tracks is None or sid not in replays:
+        return
+    marker: tuple[Aircraft, Grid] = replays[sid]
+    step: float = max(REPLAY_STEP, speed)
+    for _, state in tracks.replay(start, end, step):
+        if replays.get(sid) is not marker or sid not in viewports:
+            return
+        basics: dict[str, dict[str, str]] = get.info_many(state, "basic")
+        state = {icao: {**basics[icao], **aircraft} for icao, aircraft in state.items()}
+        marker = replays[sid] = (state, Grid(state))
+        socketio.emit("aircraft", encode(viewports[sid].snapshot(*marker), sid), to=sid)
+        clusters: list | None = viewports[sid].clusters(marker[1])
+        if clusters is not None:
+            socketio.emit("clusters", clusters, to=sid)
+        socketio.sleep(step / speed)
+
+    if replays.get(sid) is marker and sid in viewports:
+        del replays[sid]
+        socketio.emit("aircraft", encode(viewports[sid].snapshot(feed.state, grid), sid), to=sid)
+        socketio.emit("live", to=sid)
 
 @socketio.on("route")
 def handle_add_route(csign: str, orig: str, dest: str) -> None:
@@ -119,70 +341,101 @@ def handle_add_route(csign: str, orig: str, dest: str) -> None:
 @socketio.on("select")
 def handle_select(icao: str, csign: str) -> None:
     """
-    Emit necessary info about an aircraft and its airline/route using get.info(),
-    and its image using get.image() to show on the front end
+    Emit necessary info about an aircraft and its airline/route using detail.flight_detail()
+    to show on the front end, then its image in the background with send_image
     Takes an aircraft's 24-bit ICAO address and callsign
-    Emits a dict with keys aircraft, airline, dest, image, orig, route
+    Emits a dict with keys aircraft, airline, dest, image (empty), orig, route
     Key "route" contains the callsign ("csign") and its radio equivalent
     Selects the aircraft on the front end
     """
-    info: dict[str, dict[str, str]] = {
-        "aircraft": get.info(icao, "aircraft"),
-        "route": {
-            "csign": csign
-        }
-    }
-
-    if not (any(char.isdigit() for char in csign[:3]) or (
-            ("reg" in info["aircraft"] and
-             info["aircraft"]["reg"].replace("-", "") == csign))):
-        info["airline"] = get.info(csign, "airline")
-    else:
-        info["airline"] = {}
+    info: dict[str, dict[str, str]] = detail.flight_detail(icao, csign)
 
-    if "radio" in info["airline"]:
-        info["route"]["radio"] = " ".join([info["airline"]["radio"], get.radio(csign[3:])]).strip()
-    else:
-        info["route"]["radio"] = get.radio(csign)
-
-    if "name" not in info["airline"]:
-        if "operatoricao" in info["aircraft"]:
-            airline: dict[str, str] = get.info(info["aircraft"]["operatoricao"], "airline")
-            if "name" in airline:
-                info["airline"]["name"] = airline["name"]
-
-        if "name" not in info["airline"]:
-            if "operator" in info["aircraft"]:
-                info["airline"]["name"] = info["aircraft"]["operator"]
-            elif "owner" in info["aircraft"]:
-                info["airline"]["name"] = info["aircraft"]["owner"]
-
-    route: dict[str, str] = get.info(csign, "route")
-    if route:
-        info["orig"] = (get.info(route["orig"], "airport")
-                        if "orig" in route else {})
-        info["dest"] = (get.info(route["dest"], "airport")
-                        if "dest" in route else {})
-    else:
-        info["orig"] = info["dest"] = {}
+    # the image can take a while to find, so it's sent afterwards
+    info["image"] = {"src": "", "attr": "", "link": ""}
+    emit("select", info)
+    socketio.start_background_task(send_image, request_sid(), icao, info["aircraft"].get("reg", ""))
 
-    if "reg" in info["aircraft"]:
-        info["image"] = get.image(info["aircraft"]["reg"],
-                                  "reg",
-                                  bool(get.settings["usewikimedia"]))
+def send_image(sid: str, icao: str, reg: str) -> None:
+    """
+    Emit the image of an aircraft using images.image() to a client, after handle_select
+    Takes the client's session ID, and the aircraft's 24-bit ICAO address and registration
+    Emits a dict with keys icao and image
+    Shows the image on the front end if the aircraft is still selected
+    """
+    image: dict[str, str]
+    if reg:
+        image = images.image(reg, "reg", bool(get.settings["usewikimedia"]))
     elif not get.settings["usewikimedia"]:
-        info["image"] = get.image(icao, "hex")
+        image = images.image(icao, "hex")
     else:
-        info["image"] = {"src": "", "attr": "", "link": ""}
+        return
 
-    emit("select", info)
+    if image["src"]:
+        socketio.emit("image", {"icao": icao, "image": image}, to=sid)
+
+def serve_worker(path: str, listener: socket) -> None:
+    """
+    Serve clients from a worker process forked by serve_workers, never returning
+    The feed follows the state the main process writes at path instead of polling the source
+    The database connections forked with it are left to the main process and new ones opened
+    """
+    get.after_fork()
+    feed.source = shared_source(path)
+    feed.interval = 0
+    if tracks is not None:
+        tracks.after_fork()
+        feed.on_update.remove(tracks.record)
+    feed.start()
+    WSGIServer(listener, flask, handler_class=WebSocketHandler).serve_forever()
+
+def serve_workers(listen_port: int) -> None:
+    """
+    Serve from as many worker processes as the workers setting, sharing one listening socket,
+    while this process polls the feed (and records tracks) and writes each state
+    into a shared.SharedState for the workers to follow
+    Each worker has its own clients, and sends them deltas as it would on its own
+    whenever the state changes, so the sequence of the SharedState is all they need between them,
+    besides its counters of changes to the databases (see cache.share_changes)
+    Clients only connect with WebSockets, so every request of one goes to the same worker
+    """
+    shared: SharedState = SharedState.create()
+    shared.write(feed.state)
+    # so a route added through one worker isn't left cached by the others
+    cache.share_changes(shared)
+    listener: socket = create_server(("0.0.0.0", listen_port))
+    children: list[int] = []
+    for _ in range(workers):
+        child: int = fork()
+        if child == 0:
+            serve_worker(shared.path, listener)
+        children.append(child)
+
+    # no clients here, just the feed
+    listener.close()
+    feed.on_update.remove(broadcast_delta)
+    feed.on_update.append(shared.write)
+    try:
+        feed.run()
+        for child in children:
+            waitpid(child, 0)
+    finally:
+        for child in children:
+            try:
+                kill(child, SIGTERM)
+            except ProcessLookupError:
+                pass
+        shared.close(remove=True)
 
 if __name__ == "__main__":
     port: str | int | None = get.settings["port"]
     if isinstance(port, int):
         print(get.STRINGS["logs"]["running"].format("http://localhost:" + str(port)))
         try:
-            socketio.run(flask, host="0.0.0.0", port=port)
+            if workers > 1:
+                serve_workers(port)
+            else:
+                feed.start()
+                socketio.run(flask, host="0.0.0.0", port=port)
         except KeyboardInterrupt:
             pass
     else:
@@ -4,88 +4,200 @@
 Download and convert JSON files from the OpenSky API for testing
 """
 
-from json import loads, dumps
+from array import array
+from codecs import getincrementaldecoder
+from json import dumps, JSONDecoder, loads
 from sys import stderr
-from requests import get, Response
-from get import check_dbs, info
+from typing import Iterable, Iterator, Sequence
+from requests import get
+from get import check_dbs, info_many
 
 __all__: list[str] = [
     "extract",
+    "stream",
+    "columns",
     "convert",
     "ENDPOINT"
 ]
 
 ENDPOINT: str = "https://opensky-network.org/api/states/all"
 
+# the fields of an OpenSky API state vector, in order
+_HEADERS: tuple[str, ...] = (
+    "icao",
+    "csign",
+    "origin",
+    "time",
+    "contact",
+    "lng",
+    "lat",
+    "alt",
+    "ground",
+    "speed",
+    "hdg",
+    "climb",
+    "sensors",
+    "geo_alt",
+    "squawk",
+    "special",
+    "source",
+    "cat"
+)
+_REQUIRED: tuple[str, ...] = ("icao", "lat", "lng", "csign")
+# the fields of a state vector kept by columns
+_KEPT: tuple[str, ...] = ("icao", "csign", "lng", "lat", "alt", "speed", "hdg", "climb", "cat")
+_CONVERSIONS: tuple[tuple[str, float], ...] = (
+    ("hdg", 1),  # ensure it's there
+    ("alt", 3.28084),  # to ft
+    ("climb", 196.8503937008),  # to ft/min
+    ("speed", 1.943844)  # to kt
+)
+
+_DECODER: JSONDecoder = JSONDecoder()
+# what can come between the states key and the aircraft list, and between state vectors
+_SEPARATORS: str = " \t\n\r:,"
+
 
 def extract(os_json: str) -> list[list[str | int | float]]:
     """
     Extract the aircraft list from an OpenSky API state
     """
-    return loads(os_json)["states"]
+    return loads(os_json)["states"] or []
 
 
-def convert(state: list[list[str | int | float]]) -> dict[str, dict[str, str | int | float]]:
+def stream(chunks: Iterable[bytes | str]) -> Iterator[list[str | int | float]]:
     """
-    Convert an OpenSky API aircraft list to flight_tracker format
+    Extract the aircraft list from an OpenSky API state as it arrives in chunks
+    (e.g. from requests.Response.iter_content), getting each state vector as soon as it's complete
+    Only the chunk being parsed is kept, rather than the whole text
+    Bytes are decoded as UTF-8
+    Raises ValueError if the chunks end before the aircraft list does
     """
-    headers: tuple[str, ...] = (
-        "icao",
-        "csign",
-        "del_origin",
-        "del_time",
-        "del_contact",
-        "lng",
-        "lat",
-        "alt",
-        "del_ground",
-        "speed",
-        "hdg",
-        "climb",
-        "del_sensors",
-        "del_geo_alt",
-        "del_squawk",
-        "del_special",
-        "del_source",
-        "cat"
-    )
-
-    conv_headers: tuple[tuple[str, float], ...] = (
-        ("hdg", 1),  # ensure it's there
-        ("alt", 3.28084),  # to ft
-        ("climb", 196.8503937008),  # to ft/min
-        ("speed", 1.943844)  # to kt
-    )
-
-    result: dict[str, dict[str, str | int | float]] = {}
-
-    for osac in state:
-        ftac: dict[str, str | int | float] = dict(zip(headers, osac))
-
-        if all(key in ftac and ftac[key] for key in ("icao", "lat", "lng", "csign")):
-            # delete unnecessary keys to save bandwidth
-            ftac = dict(filter(lambda item: item[1] and not item[0].startswith("del_"),
-                               ftac.items()))
-
-            # convert to flight tracker values (or add default 0)
-            for convertee, multiplier in conv_headers:
-                if convertee in ftac and ftac[convertee]:
-                    ftac[convertee] = float(ftac[convertee]) * multiplier
+    decoder = getincrementaldecoder("utf-8")()
+    texts: Iterator[str] = (chunk if isinstance(chunk, str) else decoder.decode(chunk)
+                            for chunk in chunks)
+
+    # skip to the aircraft list, keeping enough of each chunk to find the key across two
+    buffer: str = ""
+    for text in texts:
+        buffer += text
+        if '"states"' in buffer:
+            buffer = buffer[buffer.index('"states"') + 8:]
+            break
+        buffer = buffer[-7:]
+    else:
+        raise ValueError("no states in the OpenSky API state")
+
+    position: int = 0
+    opened: bool = False
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+
+        if position < len(buffer):
+            if not opened:
+                if buffer[position] == "[":
+                    opened = True
+                    position += 1
+                    continue
+                if buffer.startswith("null", position):
+                    return
+                if not "null".startswith(buffer[position:]):
+                    raise ValueError("the states in the OpenSky API state aren't a list")
+            elif buffer[position] == "]":
+                return
+            else:
+                vector: list[str | int | float]
+                try:
+                    vector, position = _DECODER.raw_decode(buffer, position)
+                except ValueError:
+                    pass
                 else:
-                    ftac[convertee] = 0
+                    yield vector
+                    continue
+
+        # the rest of the state vector (or the start of the list) hasn't arrived yet
+        more: str | None = next(texts, None)
+        if more is None:
+            raise ValueError("the OpenSky API state ended early")
+        buffer = buffer[position:] + more
+        position = 0
+
+
+def _callsign(csign: str, reg: str) -> str:
+    """
+    Internal
+    Get a callsign without the zeros padding its number, unless it's a registration
+    or has a digit in its first three characters
+    """
+    if any(char.isdigit() for char in csign[:3]) or reg.replace("-", "") == csign:
+        return csign
+    return csign[:3] + csign[3:].lstrip("0")
 
-            ftac["csign"] = str(ftac["csign"]).strip()
-            ftac.update(info(str(ftac["icao"]), "basic"))
-            if not (any(char.isdigit() for char in str(ftac["csign"])[:3]) or (
-                    ("reg" in ftac and str(ftac["reg"]).replace("-", "") == ftac["csign"]))):
-                ftac["csign"] = str(ftac["csign"])[:3] + str(ftac["csign"])[3:].lstrip("0")
-            result[str(ftac["icao"])] = ftac
 
+def columns(state: Iterable[list[str | int | float]]
+            ) -> dict[str, Sequence[str | int | float | None]]:
+    """
+    Convert an OpenSky API aircraft list to flight_tracker format, as columns
+    Returns a list (or typed array, for the numbers) of each field of every aircraft,
+    keyed by field, with None for an aircraft without the field
+    Every aircraft has an icao, csign, lat, lng, alt, speed, hdg, climb and icon
+
+    Works a column at a time rather than an aircraft at a time: the fields kept from each
+    state vector are added to their columns as it comes (e.g. from stream), so the state is
+    never held whole, then each column is converted at once
+    """
+    indexes: list[int] = [_HEADERS.index(key) for key in _KEPT]
+    required: list[int] = [_HEADERS.index(key) for key in _REQUIRED]
+    kept: list[list[str | int | float | None]] = [[] for _ in _KEPT]
+    for vector in state:
+        # aircraft without an address, a position or a callsign are left out
+        if len(vector) <= max(required) or not all(vector[index] for index in required):
+            continue
+        # the last fields (e.g. cat) aren't always there
+        for values, index in zip(kept, indexes):
+            values.append(vector[index] if index < len(vector) else None)
+    column: dict[str, list[str | int | float | None]] = dict(zip(_KEPT, kept))
+
+    icaos: list[str] = list(map(str, column["icao"]))
+    # look up every aircraft at once rather than one query per state vector
+    basics: dict[str, dict[str, str]] = info_many(icaos, "basic")
+    regs: list[str | None] = [basics[icao].get("reg") for icao in icaos]
+
+    result: dict[str, Sequence[str | int | float | None]] = {
+        "icao": icaos,
+        "csign": list(map(_callsign, map(str.strip, map(str, column["csign"])),
+                          (reg or "" for reg in regs))),
+        "lng": column["lng"],
+        "lat": column["lat"]
+    }
+    # converted to flight tracker units (or 0 if missing)
+    for convertee, multiplier in _CONVERSIONS:
+        result[convertee] = array("d", [float(value) * multiplier if value else 0
+                                        for value in column[convertee]])
+    result["cat"] = [value or None for value in column["cat"]]
+    result["reg"] = regs
+    result["icon"] = [basics[icao]["icon"] for icao in icaos]
+    result["type"] = [basics[icao].get("type") for icao in icaos]
     return result
 
 
+def convert(state: Iterable[list[str | int | float]]) -> dict[str, dict[str, str | int | float]]:
+    """
+    Convert an OpenSky API aircraft list to flight_tracker format
+    Converted as columns (see columns), then made into a dict for each aircraft
+    """
+    converted: dict[str, Sequence[str | int | float | None]] = columns(state)
+    names: list[str] = list(converted)
+    return {str(values[0]): {name: value for name, value in zip(names, values)
+                             if value is not None}
+            for values in zip(*converted.values())}
+
+
 if __name__ == "__main__":
     check_dbs(lambda log: print(log, file=stderr))
-    response: Response = get(ENDPOINT, timeout=120)
-    aircraft: dict[str, dict[str, str | int | float]] = convert(extract(response.text))
+    with get(ENDPOINT, timeout=120, stream=True) as response:
+        response.raise_for_status()
+        aircraft: dict[str, dict[str, str | int | float]] = convert(
+            stream(response.iter_content(1 << 16)))
     print(dumps(aircraft))
@@ -0,0 +1,168 @@
+# registry.py
+
+"""
+Compact in-memory registry of aircraft for flight_tracker, keyed by 24-bit ICAO address,
+and a trie of registration prefixes
+"""
+
+from array import array
+from bisect import bisect_left
+from sys import intern
+from typing import Iterable, Sequence
+
+__all__: list[str] = [
+    "Registry",
+    "PrefixTrie"
+]
+
+# columns with up to this many different values keep them as interned strings,
+# columns with more (e.g. registrations) keep them encoded in one bytes object
+_SMALL_POOL: int = 65535
+
+
+class _Column:
+    """
+    Internal
+    A dictionary encoded column: a code for each row, and the different values the codes refer to
+    """
+    __slots__ = ("codes", "values", "blob", "offsets")
+
+    def __init__(self, values: list[str], codes: Iterable[int]) -> None:
+        self.values: tuple[str, ...] = ()
+        self.blob: bytes = b""
+        self.offsets: array = array("I")
+        if len(values) <= _SMALL_POOL:
+            self.values = tuple(intern(value) for value in values)
+            self.codes: array = array("H", codes)
+        else:
+            encoded: list[bytes] = [value.encode() for value in values]
+            self.blob = b"".join(encoded)
+            self.offsets = array("I", [0])
+            for value in encoded:
+                self.offsets.append(self.offsets[-1] + len(value))
+            self.codes = array("I", codes)
+
+    def __getitem__(self, slot: int) -> str:
+        code: int = self.codes[slot]
+        if self.values:
+            return self.values[code]
+        return self.blob[self.offsets[code]:self.offsets[code + 1]].decode()
+
+
+class Registry:
+    """
+    Rows of the aircraft table held in memory, looked up by 24-bit ICAO address
+    Addresses are kept as a sorted array of integers, and every other column is dictionary encoded
+    Gets rows in the same shape as the database would (without empty values)
+    """
+    __slots__ = ("names", "addresses", "columns")
+
+    def __init__(self, names: Sequence[str], rows: Iterable[Sequence[str]],
+                 key: str = "icao") -> None:
+        """
+        Takes the column names and the rows of the table (as sequences in the same order)
+        Rows without a valid hex address in the key column are left out,
+        and only the first row for each address is kept
+        """
+        key_index: int = list(names).index(key)
+        indices: list[int] = [i for i, name in enumerate(names) if name != key]
+        self.names: tuple[str, ...] = tuple(names[i] for i in indices)
+
+        # encode the rows as they come, then sort them by address at the end
+        addresses: array = array("I")
+        pools: list[dict[str, int]] = [{} for _ in indices]
+        codes: list[array] = [array("I") for _ in indices]
+        for row in rows:
+            try:
+                address: int = int(row[key_index], 16)
+            except (TypeError, ValueError):
+                continue
+            if not 0 <= address < 1 << 24:
+                continue
+            addresses.append(address)
+            for pool, column_codes, index in zip(pools, codes, indices):
+                column_codes.append(pool.setdefault(row[index] or "", len(pool)))
+
+        order: list[int] = sorted(range(len(addresses)), key=addresses.__getitem__)
+        keep: list[int] = [slot for n, slot in enumerate(order)
+                           if n == 0 or addresses[slot] != addresses[order[n - 1]]]
+        self.addresses: array = array("I", (addresses[slot] for slot in keep))
+        self.columns: tuple[_Column, ...] = tuple(
+            _Column(list(pool), (column_codes[slot] for slot in keep))
+            for pool, column_codes in zip(pools, codes))
+
+    def _slot(self, icao: str) -> int:
+        """
+        Internal
+        Get the position of an address in the registry, or -1 if it isn't there
+        """
+        try:
+            address: int = int(icao, 16)
+        except ValueError:
+            return -1
+        slot: int = bisect_left(self.addresses, address)
+        if slot < len(self.addresses) and self.addresses[slot] == address:
+            return slot
+        return -1
+
+    def get(self, icao: str) -> dict[str, str]:
+        """
+        Get the row of an aircraft by its 24-bit ICAO address (in hex)
+        Returns an empty dict if it isn't there
+        """
+        slot: int = self._slot(icao)
+        if slot == -1:
+            return {}
+
+        row: dict[str, str] = {"icao": format(self.addresses[slot], "06x")}
+        for name, column in zip(self.names, self.columns):
+            value: str = column[slot]
+            if value:
+                row[name] = value
+        return row
+
+    def __contains__(self, icao: object) -> bool:
+        return isinstance(icao, str) and self._slot(icao) != -1
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+
+class PrefixTrie:
+    """
+    Trie of prefixes (e.g. of registrations) for finding the value of the longest one a string has
+    Matching ignores case, like SQL LIKE
+    """
+    __slots__ = ("root",)
+
+    def __init__(self, prefixes: Iterable[tuple[str, str]]) -> None:
+        """
+        Takes pairs of prefixes and their values (e.g. countries)
+        The first value for a prefix is kept if it's there more than once
+        """
+        # each node is a dict of the next characters, with the value of the prefix under ""
+        self.root: dict = {}
+        for prefix, value in prefixes:
+            node: dict = self.root
+            for char in prefix.upper():
+                node = node.setdefault(char, {})
+            node.setdefault("", value)
+
+    def get(self, string: str) -> str:
+        """
+        Get the value of the longest prefix of a string, or an empty string if it has none
+        """
+        node: dict = self.root
+        value: str = node.get("", "")
+        for char in string.upper():
+            if char not in node:
+                break
+            node = node[char]
+            value = node.get("", value)
+        return value
+
+    def get_many(self, strings: Iterable[str]) -> dict[str, str]:
+        """
+        Get the value of the longest prefix of each of the strings, keyed by string
+        """
+        return {string: self.get(string) for string in set(strings)}
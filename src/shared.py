@@ -0,0 +1,190 @@
+# shared.py
+
+"""
+Share the state of aircraft between processes through a memory-mapped file,
+so one process can poll the feed while others serve it
+"""
+
+from fcntl import lockf, LOCK_EX, LOCK_UN
+from json import dumps, loads
+from mmap import mmap
+from os import close, fstat, ftruncate, open as open_fd, O_CREAT, O_RDWR, unlink
+from os.path import isdir
+from struct import calcsize, Struct, unpack_from
+from tempfile import mkstemp
+from typing import Any
+from store import AircraftStore
+
+__all__: list[str] = [
+    "SharedState"
+]
+
+Aircraft = dict[str, dict[str, Any]]
+
+# magic, sequence (odd while being written), length of the state after the header
+_HEADER: Struct = Struct("<4sQQ")
+_MAGIC: bytes = b"FTSS"
+# counters any of the processes can add to, after the header
+_COUNTERS: Struct = Struct("<16Q")
+_COUNTER: Struct = Struct("<Q")
+# where the state starts
+_BODY: int = _HEADER.size + _COUNTERS.size
+_LENGTH: Struct = Struct("<I")
+_SIZE: int = 1 << 20  # bytes mapped to start with, doubled whenever a state doesn't fit
+
+
+class SharedState:
+    """
+    A state of aircraft in a file mapped into memory, written by one process and read by others
+    without sending it between them, though each reader still decodes the state it reads into
+    a dict for each aircraft
+    Kept as the columns of the writer's store.AircraftStore: the length of a JSON header
+    (a little-endian unsigned 32-bit integer), the header, with the ICAO address, strings and
+    other fields of each slot, then the numbers of every slot for each field, as native doubles
+
+    Consistency is kept like a seqlock: the writer makes the sequence odd before writing
+    and even again after, and a reader keeps what it read only if the sequence was even
+    and the same before and after, trying again on the next read otherwise
+    The sequence only goes up, so half of it is the version of the state
+
+    It also has counters that any of the processes can add to (see count),
+    e.g. to tell the others something has changed
+    """
+    __slots__ = ("path", "descriptor", "map", "sequence")
+
+    def __init__(self, path: str, size: int = _SIZE) -> None:
+        """
+        Map the file at path, creating it (at least size bytes) if it doesn't exist
+        """
+        self.path: str = path
+        self.descriptor: int = open_fd(path, O_RDWR | O_CREAT, 0o600)
+        if fstat(self.descriptor).st_size < _BODY:
+            ftruncate(self.descriptor, max(size, _BODY))
+        self.map: mmap = mmap(self.descriptor, 0)
+        # the sequence of the last state written or read
+        self.sequence: int = 0
+
+    @classmethod
+    def create(cls) -> "SharedState":
+        """
+        Make a new shared state in a temporary file, in memory (/dev/shm) where there is one
+        """
+        descriptor, path = mkstemp(".shm", "flight_tracker-",
+                                   "/dev/shm" if isdir("/dev/shm") else None)
+        close(descriptor)
+        return cls(path)
+
+    def write(self, state: AircraftStore) -> None:
+        """
+        Write a state for readers, growing the file if it doesn't fit
+        """
+        header: bytes = dumps({
+            "slots": len(state.icaos),
+            "icaos": state.icaos,
+            "numbers": list(state.numbers),
+            "strings": state.strings,
+            "others": state.others
+        }, separators=(",", ":")).encode()
+        body: bytes = b"".join((_LENGTH.pack(len(header)), header,
+                                *(numbers.tobytes() for numbers in state.numbers.values())))
+
+        size: int = len(self.map)
+        while _BODY + len(body) > size:
+            size *= 2
+        if size > len(self.map):
+            ftruncate(self.descriptor, size)
+            self.map.resize(size)
+
+        sequence: int = max(self.sequence, _HEADER.unpack_from(self.map)[1])
+        sequence += sequence % 2  # after a writer that stopped partway through
+        _HEADER.pack_into(self.map, 0, _MAGIC, sequence + 1, len(body))
+        self.map[_BODY:_BODY + len(body)] = body
+        _HEADER.pack_into(self.map, 0, _MAGIC, sequence + 2, len(body))
+        self.sequence = sequence + 2
+
+    def read(self) -> Aircraft | None:
+        """
+        Get the state, in the same shape as opensky.convert gets,
+        or None if it hasn't changed since the last read or is being written
+        """
+        magic, sequence, length = _HEADER.unpack_from(self.map)
+        if magic != _MAGIC or sequence % 2 or sequence == self.sequence:
+            return None
+        if _BODY + length > len(self.map):
+            # the writer has grown the file since it was mapped
+            self.map.close()
+            self.map = mmap(self.descriptor, 0)
+            return self.read()
+
+        # anything read while the state was being rewritten is thrown away, even if it broke
+        try:
+            state: Aircraft = self._decode()
+        except (ValueError, IndexError, KeyError, TypeError):
+            if _HEADER.unpack_from(self.map)[1] != sequence:
+                return None
+            raise
+        if _HEADER.unpack_from(self.map)[1] != sequence:
+            return None
+        self.sequence = sequence
+        return state
+
+    def _decode(self) -> Aircraft:
+        """
+        Internal
+        Get the state from the map, reading the numbers straight out of it
+        """
+        offset: int = _BODY
+        length: int = _LENGTH.unpack_from(self.map, offset)[0]
+        offset += _LENGTH.size
+        header: dict[str, Any] = loads(self.map[offset:offset + length])
+        offset += length
+
+        slots: int = header["slots"]
+        icaos: list[str | None] = header["icaos"]
+        live: list[int] = [slot for slot, icao in enumerate(icaos) if icao is not None]
+        rows: list[dict[str, Any]] = [{"icao": icaos[slot]} for slot in live]
+
+        # a field at a time, like store.AircraftStore.columns
+        for field in header["numbers"]:
+            numbers: tuple[float, ...] = unpack_from(f"{slots}d", self.map, offset)
+            offset += calcsize(f"{slots}d")
+            for row, slot in zip(rows, live):
+                if numbers[slot] == numbers[slot]:  # not NaN
+                    row[field] = numbers[slot]
+        for field, strings in header["strings"].items():
+            for row, slot in zip(rows, live):
+                if strings[slot] is not None:
+                    row[field] = strings[slot]
+        by_slot: dict[int, dict[str, Any]] = dict(zip(live, rows))
+        for slot, others in header["others"].items():
+            by_slot[int(slot)].update(others)
+        return {row["icao"]: row for row in rows}
+
+    def count(self, counter: int) -> int:
+        """
+        Add one to a counter (from 0 to 15), locking it against the other processes meanwhile
+        Returns its new value
+        """
+        offset: int = _HEADER.size + counter * _COUNTER.size
+        lockf(self.descriptor, LOCK_EX, _COUNTER.size, offset)
+        try:
+            value: int = _COUNTER.unpack_from(self.map, offset)[0] + 1
+            _COUNTER.pack_into(self.map, offset, value)
+        finally:
+            lockf(self.descriptor, LOCK_UN, _COUNTER.size, offset)
+        return value
+
+    def counters(self) -> tuple[int, ...]:
+        """
+        Get the value of every counter
+        """
+        return _COUNTERS.unpack_from(self.map, _HEADER.size)
+
+    def close(self, remove: bool = False) -> None:
+        """
+        Unmap the file, and delete it if remove is True
+        """
+        self.map.close()
+        close(self.descriptor)
+        if remove:
+            unlink(self.path)
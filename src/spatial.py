@@ -0,0 +1,257 @@
+# spatial.py
+
+"""
+Find the aircraft inside a map viewport, and keep each client's viewport up to date with deltas
+"""
+
+from collections.abc import Mapping
+from math import ceil
+from typing import Any
+
+__all__: list[str] = [
+    "Grid",
+    "Viewport"
+]
+
+Aircraft = dict[str, dict[str, Any]]
+State = Mapping[str, dict[str, Any]]
+
+
+class Grid:
+    """
+    Spatial index of aircraft by position, splitting the world into cells of size by size degrees
+    Built once per state, then queried for every viewport
+    """
+    __slots__ = ("size", "rows", "columns", "cells", "addresses", "totals")
+
+    def __init__(self, state: State, size: float = 2.0) -> None:
+        """
+        Takes the aircraft state, leaving out aircraft without a position
+        """
+        self.size: float = size
+        self.rows: int = ceil(180 / size)
+        self.columns: int = ceil(360 / size)
+        # each cell has the ICAO address and position of each aircraft in it
+        self.cells: dict[int, list[tuple[str, float, float]]] = {}
+        for icao, aircraft in state.items():
+            try:
+                lat: float = float(aircraft["lat"])
+                lng: float = float(aircraft["lng"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            cell: int = self._row(lat) * self.columns + self._column(lng)
+            self.cells.setdefault(cell, []).append((icao, lat, lng))
+        # and just the ICAO addresses, for the cells entirely inside a query
+        self.addresses: dict[int, list[str]] = {
+            cell: [icao for icao, _, _ in points] for cell, points in self.cells.items()}
+        # and the number of aircraft and the sums of their positions, for clusters
+        self.totals: dict[int, tuple[int, float, float]] = {
+            cell: (len(points), sum(lat for _, lat, _ in points), sum(lng for _, _, lng in points))
+            for cell, points in self.cells.items()}
+
+    def _row(self, lat: float) -> int:
+        """
+        Internal
+        Get the row of the cells a latitude is in
+        """
+        return min(max(int((lat + 90) // self.size), 0), self.rows - 1)
+
+    def _column(self, lng: float) -> int:
+        """
+        Internal
+        Get the column of the cells a longitude (from -180 to 180) is in
+        """
+        return min(max(int((lng + 180) // self.size), 0), self.columns - 1)
+
+    @staticmethod
+    def _split(west: float, east: float) -> list[tuple[float, float]]:
+        """
+        Internal
+        Split longitudes as Leaflet gives them (which can go past 180 or -180 when the map wraps
+        around, and west is always less than east) into ranges from -180 to 180
+        """
+        if east - west >= 360:
+            return [(-180, 180)]
+        width: float = east - west
+        west = (west + 180) % 360 - 180
+        east = west + width
+        if east > 180:
+            return [(west, 180), (-180, east - 360)]
+        return [(west, east)]
+
+    def _ranges(self, south: float, west: float, north: float,
+                east: float) -> tuple[range, range, list[int]]:
+        """
+        Internal
+        Get the rows and columns of cells bounds (that don't cross the antimeridian) cover,
+        and the cells in them that have aircraft
+        """
+        if south > north:
+            return range(0), range(0), []
+        rows: range = range(self._row(south), self._row(north) + 1)
+        columns: range = range(self._column(west), self._column(east) + 1)
+
+        # for big bounds, going through the cells with aircraft is quicker than every cell
+        if len(rows) * len(columns) > len(self.cells):
+            return rows, columns, [cell for cell in self.cells
+                                   if cell // self.columns in rows
+                                   and cell % self.columns in columns]
+        return rows, columns, [cell for row in rows for column in columns
+                               if (cell := row * self.columns + column) in self.cells]
+
+    def query(self, south: float, west: float, north: float, east: float) -> list[str]:
+        """
+        Get the ICAO addresses of the aircraft inside the bounds
+        Takes bounds as Leaflet gives them (see _split)
+        """
+        result: list[str] = []
+        for range_west, range_east in self._split(west, east):
+            rows, columns, cells = self._ranges(south, range_west, north, range_east)
+            for cell in cells:
+                row, column = divmod(cell, self.columns)
+                if rows[0] < row < rows[-1] and columns[0] < column < columns[-1]:
+                    # cells not on the edge are all inside
+                    result.extend(self.addresses[cell])
+                else:
+                    result.extend(icao for icao, lat, lng in self.cells[cell]
+                                  if south <= lat <= north and range_west <= lng <= range_east)
+        return result
+
+    def clusters(self, south: float, west: float, north: float, east: float,
+                 size: float) -> list[list[float]]:
+        """
+        Get clusters of the aircraft in the cells the bounds cover (see query),
+        grouping cells into clusters of about size by size degrees (at least the size of a cell)
+        Each cluster is the mean latitude and longitude of its aircraft and how many there are
+        """
+        factor: int = max(1, round(size / self.size))
+        groups: dict[tuple[int, int], list[float]] = {}
+        for range_west, range_east in self._split(west, east):
+            for cell in self._ranges(south, range_west, north, range_east)[2]:
+                row, column = divmod(cell, self.columns)
+                count, lat_sum, lng_sum = self.totals[cell]
+                group: list[float] = groups.setdefault((row // factor, column // factor), [0, 0, 0])
+                group[0] += count
+                group[1] += lat_sum
+                group[2] += lng_sum
+
+        return [[round(lat_sum / count, 4), round(lng_sum / count, 4), count]
+                for count, lat_sum, lng_sum in groups.values()]
+
+
+class Viewport:
+    """
+    What one client is looking at, and which aircraft it has been sent
+    Gets deltas (see delta.Deltas) with only the aircraft inside its bounds,
+    numbered by its own versions
+    Zoomed out below cluster_zoom, it gets clusters of aircraft instead (and only the selected one)
+    """
+    __slots__ = ("cluster_zoom", "clustered", "bounds", "zoom", "selected", "sent", "version")
+
+    def __init__(self, cluster_zoom: float = 0) -> None:
+        self.cluster_zoom: float = cluster_zoom
+        self.clustered: bool = False
+        self.bounds: tuple[float, float, float, float] | None = None
+        self.zoom: float = 0
+        # kept even outside the bounds
+        self.selected: str = ""
+        self.sent: set[str] = set()
+        self.version: int = 0
+
+    def _visible(self, state: State, grid: Grid) -> set[str]:
+        """
+        Internal
+        Get the ICAO addresses of the aircraft the client should have
+        """
+        visible: set[str] = (set(grid.query(*self.bounds))
+                             if self.bounds is not None and self.zoom >= self.cluster_zoom
+                             else set())
+        if self.selected in state:
+            visible.add(self.selected)
+        return visible
+
+    def _delta(self, added: Aircraft, changed: Aircraft,
+               removed: list[str]) -> dict[str, Any] | None:
+        """
+        Internal
+        Make the next delta for the client, or None if there's nothing in it
+        """
+        if not (added or changed or removed):
+            return None
+
+        self.sent.difference_update(removed)
+        self.sent.update(added)
+        self.version += 1
+        return {
+            "base": self.version - 1,
+            "version": self.version,
+            "added": added,
+            "changed": changed,
+            "removed": removed
+        }
+
+    def subscribe(self, bounds: tuple[float, float, float, float], zoom: float, selected: str,
+                  state: State, grid: Grid) -> dict[str, Any] | None:
+        """
+        Change the bounds (south, west, north, east), zoom and selected aircraft
+        Gets the delta adding the aircraft now in view and removing the ones that aren't
+        """
+        self.bounds = bounds
+        self.zoom = zoom
+        self.selected = selected
+
+        visible: set[str] = self._visible(state, grid)
+        return self._delta({icao: state[icao] for icao in visible - self.sent}, {},
+                           list(self.sent - visible))
+
+    def update(self, delta: dict[str, Any] | None, state: State,
+               grid: Grid) -> dict[str, Any] | None:
+        """
+        Take the delta of the whole state (from delta.Deltas) after it has changed
+        Gets the delta of just the client's aircraft, also adding the ones that came into view
+        and removing the ones that left it
+        """
+        visible: set[str] = self._visible(state, grid)
+        kept: set[str] = visible & self.sent
+        added: Aircraft = {icao: state[icao] for icao in visible - self.sent}
+        changed: Aircraft = {}
+
+        if delta is not None:
+            # go through whichever is smaller
+            if len(delta["changed"]) < len(kept):
+                changed = {icao: fields for icao, fields in delta["changed"].items()
+                           if icao in kept}
+            else:
+                changed = {icao: delta["changed"][icao] for icao in kept
+                           if icao in delta["changed"]}
+            # removed and added again between polls
+            added.update((icao, aircraft) for icao, aircraft in delta["added"].items()
+                         if icao in kept)
+
+        return self._delta(added, changed, list(self.sent - visible))
+
+    def clusters(self, grid: Grid) -> list[list[float]] | None:
+        """
+        Get the clusters for the client (see Grid.clusters) if it's zoomed out below cluster_zoom,
+        an empty list once it zooms back in (to clear them), or None otherwise
+        Clusters are about 64 pixels across on the map at the client's zoom
+        """
+        if self.bounds is not None and self.zoom < self.cluster_zoom:
+            self.clustered = True
+            return grid.clusters(*self.bounds, 90 / 2 ** self.zoom)
+        if self.clustered:
+            self.clustered = False
+            return []
+        return None
+
+    def snapshot(self, state: State, grid: Grid) -> dict[str, Any]:
+        """
+        Get every aircraft the client should have and the current version,
+        for when it has lost track
+        """
+        self.sent = self._visible(state, grid)
+        self.version += 1
+        return {
+            "version": self.version,
+            "aircraft": {icao: state[icao] for icao in self.sent}
+        }
@@ -24,7 +24,9 @@ document.addEventListener('DOMContentLoaded', function() {
         "DA40": 20
     };
 
-    const socketio = io();
+    // aircraft come packed into columns (see wire.py), a fraction of the size of JSON
+    // and only over WebSockets when there are several workers, so it stays with one of them
+    const socketio = io({auth: {encoding: 'packed'}, transports: transports});
     socketio.on('disconnect', location.reload);
 
     // MARK: - Container
@@ -46,6 +48,7 @@ document.addEventListener('DOMContentLoaded', function() {
     function clearMap() {
         try { map.removeLayer(selection.polylines.orig.line); } catch {};
         try { map.removeLayer(selection.polylines.dest.line); } catch {};
+        try { map.removeLayer(selection.trail); } catch {};
 
         Object.values(aircraft).forEach(function(each) {
             each.marker.getElement().style.opacity = '';
@@ -68,6 +71,7 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('main-container-aircraft-view').style.display = 'none';
 
         selection = null;
+        sendViewport();
     };
 
     function set(i) {
@@ -176,82 +180,263 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 
     // MARK: - Aircraft
+    let version = 0;
+
+    // the opposite of wire.pack, typed arrays are read as little-endian like every browser platform
+    function unpack(buffer) {
+        const length = new DataView(buffer).getUint32(0, true);
+        const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, length)));
+        const rows = Array.from({length: header.count}, () => ({}));
+        let offset = 4 + length;
+
+        header.columns.forEach(function([name, kind, extra]) {
+            if (kind === 'json') {
+                extra.forEach(([n, value]) => rows[n][name] = value);
+                return;
+            };
 
-    socketio.on('aircraft', function(payload) {
-        aircraft = {
-            ...aircraft,
-            ...payload
+            const Type = {hex: Uint32Array, str: Uint16Array, int: Int32Array}[kind];
+            const size = Type.BYTES_PER_ELEMENT * header.count;
+            const column = new Type(buffer.slice(offset, offset + size));
+            offset += size;
+
+            column.forEach(function(value, n) {
+                if (kind === 'hex') {
+                    if (value !== 0xFFFFFFFF) rows[n][name] = value.toString(16).padStart(6, '0');
+                } else if (kind === 'str') {
+                    if (value < 0xFFFE) rows[n][name] = extra[value];
+                    else if (value === 0xFFFE) rows[n][name] = null;
+                } else {
+                    if (value > -2147483647) rows[n][name] = value / extra;
+                    else if (value === -2147483647) rows[n][name] = null;
+                };
+            });
+        });
+
+        return Object.fromEntries(rows.map(row => [row.icao, row]));
+    };
+
+    function decode(payload) {
+        if (payload.encoding === 'packed') {
+            ['added', 'changed', 'aircraft'].forEach(key => {
+                if (key in payload) payload[key] = unpack(payload[key]);
+            });
         };
+        return payload;
+    };
 
-        Object.values(aircraft).forEach(function(i) {
-            i.marker = L.marker([i.lat, i.lng], {
-                icon: L.divIcon({
-                    className: 'aircraft-icon',
-                    html: '<svg><use href="#' + i.icon + '"></use></svg>',
-                    iconSize: [iconSizes[i.icon], iconSizes[i.icon]]
-                })
-            }).addTo(map);
+    function listItemHTML(i) {
+        let airlineLogo = '';
+        if (!/\d/.test(i.csign.slice(0, 3))) {
+            airlineLogo = 'background-image: url(https://www.flightaware.com/images/airline_logos/180px/' + i.csign.slice(0, 3) + '.png)'
+        };
 
-            i.marker.setZIndexOffset(i.alt);
-            i.marker.getElement().setAttribute('tabindex', '-1');
+        return `
+            <div class="aircraft-list-airline-logo" style="${airlineLogo}">
+            </div>
 
-            set(i);
+            <div>
+                <div class="aircraft-list-csign">${i.csign}</div>
+                <div class="aircraft-list-metrics">
+                    <b>${i.reg ?? ''}</b> ${i.type ?? ''}
+                </div>
+                <div class="aircraft-list-metrics">
+                    <span style="width: 1em; height: 1em">
+                        <span style="transform: rotate(${i.hdg}deg); position: absolute">&uarr;</span>
+                    </span>
+                    <span style="margin-left: 1em">
+                        ${Math.round(i.speed)} ${strings.units.aviation.speed}
+                    </span>
+                </div>
+            </div>
+        `;
+    };
 
-            let airlineLogo = '';
-            if (!/\d/.test(i.csign.slice(0, 3))) {
-                airlineLogo = 'background-image: url(https://www.flightaware.com/images/airline_logos/180px/' + i.csign.slice(0, 3) + '.png)'
-            };
+    function aircraftIcon(i) {
+        return L.divIcon({
+            className: 'aircraft-icon',
+            html: '<svg><use href="#' + i.icon + '"></use></svg>',
+            iconSize: [iconSizes[i.icon], iconSizes[i.icon]]
+        });
+    };
 
+    function addAircraft(i) {
+        aircraft[i.icao] = i;
 
-            i.listItem = document.createElement('div');
-            i.listItem.innerHTML = `
-                <div class="aircraft-list-airline-logo" style="${airlineLogo}">
-                </div>
+        i.marker = L.marker([i.lat, i.lng], {
+            icon: aircraftIcon(i)
+        }).addTo(map);
 
-                <div>
-                    <div class="aircraft-list-csign">${i.csign}</div>
-                    <div class="aircraft-list-metrics">
-                        <b>${i.reg ?? ''}</b> ${i.type ?? ''}
-                    </div>
-                    <div class="aircraft-list-metrics">
-                        <span style="width: 1em; height: 1em">
-                            <span style="transform: rotate(${i.hdg}deg); position: absolute">&uarr;</span>
-                        </span>
-                        <span style="margin-left: 1em">
-                            ${Math.round(i.speed)} ${strings.units.aviation.speed}
-                        </span>
-                    </div>
-                </div>
-            `;
+        i.marker.setZIndexOffset(i.alt);
+        i.marker.getElement().setAttribute('tabindex', '-1');
 
-            document.getElementById('aircraft-list').appendChild(i.listItem);
+        set(i);
 
-            [i.listItem, i.marker.getElement()].forEach(element => {
-                element.addEventListener('click', function(event) {
-                    socketio.emit('select', i.icao, i.csign);
-                    event.stopPropagation();
-                }, true);
-                element.classList.add('_' + i.icao);
-            });
+        i.listItem = document.createElement('div');
+        i.listItem.innerHTML = listItemHTML(i);
+        document.getElementById('aircraft-list').insertBefore(i.listItem, document.getElementById('aircraft-list-count'));
 
-            i.marker.addEventListener('mouseover', function(event) {
-                if (window.innerWidth >= 500 && !window.matchMedia('(pointer: coarse)').matches) {
-                    i.listItem.scrollIntoView({behaviour: 'smooth'});
-                    i.listItem.setAttribute('id', 'aircraft-list-div-hover');
-                };
+        [i.listItem, i.marker.getElement()].forEach(element => {
+            element.addEventListener('click', function(event) {
+                socketio.emit('select', i.icao, i.csign);
+                event.stopPropagation();
+            }, true);
+            element.classList.add('_' + i.icao);
+        });
+
+        i.marker.addEventListener('mouseover', function(event) {
+            if (window.innerWidth >= 500 && !window.matchMedia('(pointer: coarse)').matches) {
+                i.listItem.scrollIntoView({behaviour: 'smooth'});
+                i.listItem.setAttribute('id', 'aircraft-list-div-hover');
+            };
+        });
+
+        i.marker.addEventListener('mouseout', function(event) {
+            if (window.innerWidth >= 500 && !window.matchMedia('(pointer: coarse)').matches) {
+                i.listItem.setAttribute('id', '');
+            };
+        });
+    };
+
+    // only touches what the changed fields affect
+    function updateAircraft(icao, fields) {
+        const i = aircraft[icao];
+        Object.entries(fields).forEach(([key, value]) => {
+            if (value === null) {
+                delete i[key];
+            } else {
+                i[key] = value;
+            };
+        });
+
+        if ('icon' in fields) i.marker.setIcon(aircraftIcon(i));
+        if ('alt' in fields) i.marker.setZIndexOffset(i.alt);
+        if ('lat' in fields || 'lng' in fields) i.marker.setLatLng([i.lat, i.lng]);
+        if (['lat', 'lng', 'hdg', 'speed', 'icon'].some(key => key in fields)) set(i);
+        if (['csign', 'reg', 'type', 'hdg', 'speed'].some(key => key in fields)) i.listItem.innerHTML = listItemHTML(i);
+
+        if (selection && selection.icao === icao) {
+            Object.keys(fields).forEach(key => {
+                if (typeof selection[key] !== 'object') selection[key] = i[key];
             });
+        };
+    };
 
-            i.marker.addEventListener('mouseout', function(event) {
-                if (window.innerWidth >= 500 && !window.matchMedia('(pointer: coarse)').matches) {
-                    i.listItem.setAttribute('id', '');
-                };
+    function removeAircraft(icao) {
+        const i = aircraft[icao];
+        if (selection && selection.icao === icao) clearMap();
+        clearInterval(i.marker.moveInterval);
+        map.removeLayer(i.marker);
+        i.listItem.remove();
+        delete aircraft[icao];
+    };
+
+    function updateCount() {
+        let countElement = document.getElementById('aircraft-list-count');
+        if (!countElement) {
+            countElement = document.createElement('footer');
+            countElement.setAttribute('id', 'aircraft-list-count');
+            document.getElementById('aircraft-list').appendChild(countElement);
+        };
+        countElement.textContent = (clusterTotal || Object.keys(aircraft).length) + ' aircraft';
+    };
+
+    // adds an aircraft, or replaces all of its fields if it's already there
+    function putAircraft(icao, i) {
+        if (aircraft[icao]) {
+            const fields = {...i};
+            Object.keys(aircraft[icao]).forEach(key => {
+                if (!(key in i) && !['marker', 'listItem'].includes(key)) fields[key] = null;
             });
+            updateAircraft(icao, fields);
+        } else {
+            addAircraft(i);
+        };
+    };
+
+    // the server only sends the aircraft inside the map bounds (with some margin),
+    // plus the selected one wherever it is
+    function sendViewport() {
+        const bounds = map.getBounds().pad(0.2);
+        socketio.emit('viewport', [bounds.getSouth(), bounds.getWest(), bounds.getNorth(), bounds.getEast()],
+                      map.getZoom(), selection ? selection.icao : '');
+    };
+
+    socketio.on('connect', sendViewport);
+    map.on('moveend', sendViewport);
+
+    // MARK: - Replay
+    // ?replay=<start>&until=<end>&speed=<n> replays recorded aircraft instead of the live ones,
+    // with times as UNIX times or anything Date.parse takes
+    function replayTime(value) {
+        return isNaN(Number(value)) ? Date.parse(value) / 1000 : Number(value);
+    };
+
+    const replayParams = new URLSearchParams(window.location.search);
+    if (replayParams.get('replay')) {
+        socketio.on('connect', function() {
+            const start = replayTime(replayParams.get('replay'));
+            const end = replayParams.get('until') ? replayTime(replayParams.get('until')) : start + 3600;
+            socketio.emit('replay', start, end, Number(replayParams.get('speed') ?? 1));
+        });
+    };
+
+    // MARK: - Clusters
+    // zoomed out, the server sends clusters of aircraft instead of the aircraft themselves
+    const clusterLayer = L.layerGroup().addTo(map);
+    let clusterTotal = 0;
+
+    socketio.on('clusters', function(clusters) {
+        clusterLayer.clearLayers();
+        clusterTotal = 0;
+
+        clusters.forEach(function([lat, lng, count]) {
+            clusterTotal += count;
+            const size = Math.round(Math.min(24 + Math.log2(count) * 4, 56));
+            L.marker([lat, lng], {
+                icon: L.divIcon({
+                    className: 'aircraft-cluster',
+                    html: count >= 1000 ? Math.round(count / 1000) + 'k' : String(count),
+                    iconSize: [size, size]
+                })
+            }).on('click', function() {
+                map.setView([lat, lng], map.getZoom() + 2);
+            }).addTo(clusterLayer);
         });
 
-        const countElement = document.createElement('footer');
-        countElement.setAttribute('id', 'aircraft-list-count');
-        countElement.textContent = Object.keys(aircraft).length + ' aircraft';
-        document.getElementById('aircraft-list').appendChild(countElement);
+        updateCount();
+    });
+
+    // every aircraft in the viewport, when too far behind for a delta
+    socketio.on('aircraft', function(payload) {
+        decode(payload);
+        updateCount();
+        Object.keys(aircraft).forEach(function(icao) {
+            if (!(icao in payload.aircraft)) removeAircraft(icao);
+        });
+        Object.entries(payload.aircraft).forEach(([icao, i]) => putAircraft(icao, i));
+        version = payload.version;
+        updateCount();
+    });
+
+    // only what changed since the last version
+    socketio.on('delta', function(delta) {
+        if (delta.base !== version) {
+            socketio.emit('resync', version);
+            return;
+        };
+        decode(delta);
+
+        delta.removed.forEach(function(icao) {
+            if (aircraft[icao]) removeAircraft(icao);
+        });
+        Object.entries(delta.added).forEach(([icao, i]) => putAircraft(icao, i));
+        Object.entries(delta.changed).forEach(function([icao, fields]) {
+            if (aircraft[icao]) updateAircraft(icao, fields);
+        });
+
+        version = delta.version;
+        updateCount();
     });
 
     // Check if an aircraft is selected in the URL
@@ -273,10 +458,40 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('aircraft-airline-logo').style.display = 'none';
     };
 
+    function showImage(image) {
+        document.getElementById('aircraft-img').src = image.src;
+        document.getElementById('aircraft-img-shadow').title = '© ' + image.attr ?? ''; // for now until I find a better way to credit!
+        document.getElementById('aircraft-img-shadow').href = image.link;
+    };
+
+    // the image comes after the rest of the selection, once it's been found
+    socketio.on('image', function(response) {
+        if (selection && selection.icao === response.icao) {
+            selection.image = response.image;
+            showImage(selection.image);
+        };
+    });
+
+    // where the selected aircraft has been, from the recorded tracks
+    function plotTrail(icao) {
+        fetch('/track/' + icao + '.json').then(response => response.json()).then(points => {
+            if (selection && selection.icao === icao && points.length) {
+                try { map.removeLayer(selection.trail); } catch {};
+                selection.trail = L.polyline(points.map(([time, lat, lng]) => [lat, lng]), {
+                    color: '#FF9500',
+                    weight: 2,
+                    opacity: 0.75,
+                    dashArray: '4 4'
+                }).addTo(map);
+            };
+        });
+    };
+
     socketio.on('select', function(response) {
         document.getElementById('aircraft-img').src = ''
         try { map.removeLayer(selection.polylines.orig.line); } catch {};
         try { map.removeLayer(selection.polylines.dest.line); } catch {};
+        try { map.removeLayer(selection.trail); } catch {};
 
         selection = {
             ...aircraft[response.aircraft.icao],
@@ -300,12 +515,11 @@ document.addEventListener('DOMContentLoaded', function() {
             i.marker.getElement().style.opacity = '50%';
         });
         selection.marker.getElement().style.opacity = '100%';
+        sendViewport();
 
         document.getElementById('main-container-main-view').style.display = 'none';
 
-        document.getElementById('aircraft-img').src = selection.image.src;
-        document.getElementById('aircraft-img-shadow').title = '© ' + selection.image.attr ?? ''; // for now until I find a better way to credit!
-        document.getElementById('aircraft-img-shadow').href = selection.image.link;
+        showImage(selection.image);
         document.getElementById('aircraft-airline-logo').src = 'https://www.flightaware.com/images/airline_logos/180px/' + selection.csign.slice(0, 3) + '.png';
         document.getElementById('aircraft-airline-name').textContent = (selection.airline.name ?? '').replace('International', "Int'l");
         document.getElementById('aircraft-csign').textContent = selection.csign;
@@ -399,6 +613,7 @@ document.addEventListener('DOMContentLoaded', function() {
         });
 
         plotRoutes();
+        plotTrail(selection.icao);
 
         const point = map.latLngToContainerPoint(selection.marker.getLatLng());
         if (window.innerWidth <= 500) {
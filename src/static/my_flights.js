@@ -3,6 +3,15 @@
 document.addEventListener('DOMContentLoaded', function() {
     let totalDistance = 0;
 
+    // every flag on the page comes from one sprite, shown by its code as the fragment
+    const flagCountries = [...new Set([...mf.countries, ...mf.entities.airports.map(airport => airport.country)]
+        .filter(Boolean).map(country => country.toLowerCase()))].sort();
+    const flagSprite = '/image/flags.svg?c=' + flagCountries.join(',');
+
+    function flagURL(country) {
+        return flagSprite + '#' + String(country).toLowerCase();
+    };
+
     generateMap(3);
 
     function animateNumber(id, end, word, dp = 0) {
@@ -26,7 +35,7 @@ document.addEventListener('DOMContentLoaded', function() {
             if (index < countryList.length) {
                 const flagElement = document.createElement('div');
                 flagElement.classList.add('flag');
-                flagElement.style.backgroundImage = 'url(/image/flag/' + countryList[index] + ')';
+                flagElement.style.backgroundImage = 'url("' + flagURL(countryList[index]) + '")';
                 document.getElementById(id).appendChild(flagElement);
                 index++;
             } else {
@@ -66,7 +75,7 @@ document.addEventListener('DOMContentLoaded', function() {
     mf.entities.airports.forEach(function(airport) {
         const tooltipContent = `
             <div class="my-flights-airport-tooltip-title">
-                <span class="flag" style="background-image: url('/image/flag/${airport.country}')"></span>
+                <span class="flag" style="background-image: url('${flagURL(airport.country)}')"></span>
                 <span class="my-flights-airport-tooltip-iata">${airport.iata}</span> ${airport.name.replace('International', "Int'l").replace('Airport', '').trim()}
             </div>
             <div class="my-flights-airport-tooltip-flights">${strings.ui.myflightscounts.flight[(airport.flights > 1 ? 0 : 1)].replace('{}', airport.flights)}</div>
@@ -96,7 +105,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 rankIcon.innerHTML = '<svg><use href="#' + mf.entities.types[i].icon + '"></use></svg>';
             } else if (category === 'airports') {
                 displayName = mf.entities.airports[i].iata;
-                bg = 'url("/image/flag/' + mf.entities.airports[i].country + '")';
+                bg = 'url("' + flagURL(mf.entities.airports[i].country) + '")';
             };
 
             rankIcon.style.backgroundImage = bg;
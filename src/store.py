@@ -0,0 +1,206 @@
+# store.py
+
+"""
+Compact store of the live state of aircraft, kept as columns rather than a dict for each aircraft
+"""
+
+from array import array
+from collections.abc import Mapping
+from math import isnan, nan
+from sys import intern
+from typing import Any, Iterator
+
+__all__: list[str] = [
+    "AircraftStore"
+]
+
+# fields kept as 64-bit floats (NaN for an aircraft without it)
+_NUMBERS: tuple[str, ...] = ("lat", "lng", "alt", "speed", "hdg", "climb")
+# fields kept as interned strings (None for an aircraft without it)
+_STRINGS: tuple[str, ...] = ("csign", "reg", "type", "icon")
+
+
+class AircraftStore(Mapping[str, dict[str, Any]]):
+    """
+    The state of aircraft as columns: typed arrays for the numbers, interned strings for
+    the strings, and a dict for each aircraft only for any other fields it has
+    Each aircraft has a slot, a position in every column, looked up by its ICAO address
+    and given to a new aircraft once the one in it has gone
+    The fields each aircraft has, in order, are kept as a tuple shared by every aircraft
+    with the same ones, so most updates don't have to look for fields that have gone
+
+    Reads like the dict of aircraft (keyed by ICAO address) it replaces,
+    making a dict of an aircraft's fields each time one is got
+    update replaces the state in place and keeps the delta from the last one (see delta.Deltas)
+    in added, changed and removed
+    """
+    __slots__ = ("slots", "icaos", "fields", "numbers", "strings", "others", "free", "layouts",
+                 "added", "changed", "removed")
+
+    def __init__(self, state: Mapping[str, Mapping[str, Any]] | None = None) -> None:
+        self.slots: dict[str, int] = {}
+        self.icaos: list[str | None] = []
+        self.fields: list[tuple[str, ...]] = []
+        self.numbers: dict[str, array] = {field: array("d") for field in _NUMBERS}
+        self.strings: dict[str, list[str | None]] = {field: [] for field in _STRINGS}
+        self.others: dict[int, dict[str, Any]] = {}
+        # slots of aircraft that have gone, to be given to new ones
+        self.free: list[int] = []
+        # each tuple of fields seen, to share between aircraft
+        self.layouts: dict[tuple[str, ...], tuple[str, ...]] = {(): ()}
+        self.added: dict[str, Mapping[str, Any]] = {}
+        self.changed: dict[str, dict[str, Any]] = {}
+        self.removed: list[str] = []
+        if state is not None:
+            self.update(state)
+
+    def _allocate(self, icao: str) -> int:
+        """
+        Internal
+        Get an empty slot for a new aircraft, reusing a free one if there is one
+        """
+        if self.free:
+            slot: int = self.free.pop()
+            self.icaos[slot] = icao
+        else:
+            slot = len(self.icaos)
+            self.icaos.append(icao)
+            self.fields.append(())
+            for numbers in self.numbers.values():
+                numbers.append(nan)
+            for strings in self.strings.values():
+                strings.append(None)
+        self.slots[icao] = slot
+        return slot
+
+    def _clear(self, slot: int) -> None:
+        """
+        Internal
+        Empty a slot and free it
+        """
+        self.icaos[slot] = None
+        self.fields[slot] = ()
+        for numbers in self.numbers.values():
+            numbers[slot] = nan
+        for strings in self.strings.values():
+            strings[slot] = None
+        self.others.pop(slot, None)
+        self.free.append(slot)
+
+    def _write(self, slot: int, fields: Mapping[str, Any]) -> dict[str, Any]:
+        """
+        Internal
+        Replace the fields of the aircraft in a slot
+        Returns the fields that changed, with None for the ones that have gone
+        """
+        changed: dict[str, Any] = {}
+        others: dict[str, Any] = {}
+        for field, value in fields.items():
+            numbers: array | None = self.numbers.get(field)
+            if numbers is not None:
+                if isinstance(value, (float, int)) and not isinstance(value, bool):
+                    if numbers[slot] != value:
+                        changed[field] = value
+                        numbers[slot] = value
+                    continue
+                numbers[slot] = nan
+            strings: list[str | None] | None = self.strings.get(field)
+            if strings is not None:
+                if isinstance(value, str):
+                    if strings[slot] != value:
+                        changed[field] = value
+                        strings[slot] = intern(value)
+                    continue
+                strings[slot] = None
+            if field != "icao":
+                others[field] = value
+
+        # the fields it no longer has, if it doesn't have the same ones as last time
+        layout: tuple[str, ...] = tuple(fields)
+        if layout != self.fields[slot]:
+            for field in self.fields[slot]:
+                if field not in fields:
+                    if field in self.numbers:
+                        self.numbers[field][slot] = nan
+                    elif field in self.strings:
+                        self.strings[field][slot] = None
+                    changed[field] = None
+            self.fields[slot] = self.layouts.setdefault(layout, layout)
+
+        if others or slot in self.others:
+            old: dict[str, Any] = self.others.pop(slot, {})
+            changed.update((field, value) for field, value in others.items()
+                           if field not in old or old[field] != value)
+            if others:
+                self.others[slot] = others
+        return changed
+
+    def update(self, state: Mapping[str, Mapping[str, Any]]) -> None:
+        """
+        Replace the state with a new one (e.g. from opensky.convert), aircraft by aircraft,
+        working out what changed as it goes
+        """
+        self.added = {}
+        self.changed = {}
+        for icao, fields in state.items():
+            slot: int | None = self.slots.get(icao)
+            if slot is None:
+                self._write(self._allocate(icao), fields)
+                self.added[icao] = fields
+            else:
+                changed: dict[str, Any] = self._write(slot, fields)
+                if changed:
+                    self.changed[icao] = changed
+
+        # every aircraft in the state has a slot by now, so any more have gone
+        self.removed = ([icao for icao in self.slots if icao not in state]
+                        if len(self.slots) > len(state) else [])
+        for icao in self.removed:
+            self._clear(self.slots.pop(icao))
+
+    def columns(self) -> dict[str, list[Any]]:
+        """
+        Get each field of every aircraft, keyed by field, with None for an aircraft without it,
+        as wire.pack_columns takes
+        """
+        slots: list[int] = list(self.slots.values())
+        result: dict[str, list[Any]] = {"icao": list(self.slots)}
+        for field, numbers in self.numbers.items():
+            floats: list[float] = [numbers[slot] for slot in slots]
+            if not all(map(isnan, floats)):
+                result[field] = [None if isnan(value) else value for value in floats]
+        for field, strings in self.strings.items():
+            values: list[str | None] = [strings[slot] for slot in slots]
+            if any(value is not None for value in values):
+                result[field] = values
+        names: dict[str, None] = {}
+        for others in self.others.values():
+            names.update(dict.fromkeys(others))
+        for name in names:
+            # a field can be in a column for some aircraft and not for others
+            column: list[Any] = result.get(name, [None] * len(slots))
+            result[name] = [self.others.get(slot, {}).get(name, value)
+                            for slot, value in zip(slots, column)]
+        return result
+
+    def __getitem__(self, icao: str) -> dict[str, Any]:
+        slot: int = self.slots[icao]
+        others: dict[str, Any] = self.others.get(slot, {})
+        aircraft: dict[str, Any] = {"icao": icao}
+        for field in self.fields[slot]:
+            if field in others:
+                aircraft[field] = others[field]
+            elif field in self.numbers:
+                aircraft[field] = self.numbers[field][slot]
+            elif field in self.strings:
+                aircraft[field] = self.strings[field][slot]
+        return aircraft
+
+    def __contains__(self, icao: object) -> bool:
+        return icao in self.slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.slots)
+
+    def __len__(self) -> int:
+        return len(self.slots)
@@ -0,0 +1,213 @@
+# tracks.py
+
+"""
+Keep the positions of aircraft over time, to get an aircraft's trail and to replay a past window
+"""
+
+from collections.abc import Mapping
+from time import time
+from typing import Any, Iterator
+import sqlite3
+
+__all__: list[str] = [
+    "Tracks"
+]
+
+Aircraft = dict[str, dict[str, Any]]
+State = Mapping[str, dict[str, Any]]
+
+# the fields kept for each position, in the order of the columns after icao and time
+_FIELDS: tuple[str, ...] = ("lat", "lng", "alt", "hdg", "speed", "climb", "csign")
+_PARTITION: int = 3600  # seconds of positions in each table
+_CACHE_KB: int = 65536
+
+
+class Tracks:
+    """
+    Append-only store of aircraft positions in SQLite, in one table per hour
+    (named t and the number of hours since the epoch), dropped once older than hours
+    Each table is indexed by aircraft then time, for trails, and by time, for replays
+
+    An aircraft's position is only recorded again when it has moved or changed altitude,
+    or when it was last recorded more than heartbeat seconds ago,
+    so aircraft sitting still aren't written every poll but don't go stale in a replay
+    """
+    def __init__(self, path: str, hours: float = 24, heartbeat: float = 30) -> None:
+        self.path: str = path
+        self.hours: float = hours
+        self.heartbeat: float = heartbeat
+        self.writer: sqlite3.Connection = self._connect()
+        self.reader: sqlite3.Connection = self._connect()
+        # connections open when this process was forked, never used or closed (see after_fork)
+        self.inherited: tuple[sqlite3.Connection, ...] = ()
+        self.partitions: set[int] = self._tables()
+        # the time, position and altitude each aircraft was last recorded with
+        self.last: dict[str, tuple[float, Any, Any, Any]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Internal
+        Open a connection to the database in WAL mode, not syncing on every commit,
+        with a page cache big enough to hold the recent pages of an hour's indexes
+        """
+        db: sqlite3.Connection = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(f"PRAGMA cache_size=-{_CACHE_KB}")
+        return db
+
+    def _tables(self) -> set[int]:
+        """
+        Internal
+        Get the hours of the tables in the database
+        """
+        return {int(row[0][1:]) for row in self.reader.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name GLOB 't[0-9]*'")}
+
+    def _partition(self, hour: int) -> str:
+        """
+        Internal
+        Get the name of the table for an hour, creating it (and dropping old ones) if it's new
+        """
+        name: str = f"t{hour}"
+        if hour not in self.partitions:
+            with self.writer:
+                self.writer.execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                                    "('icao' INTEGER, 'time' REAL, 'lat' REAL, 'lng' REAL, "
+                                    "'alt' REAL, 'hdg' REAL, 'speed' REAL, 'climb' REAL, "
+                                    "'csign' TEXT)")
+                self.writer.execute(f"CREATE INDEX IF NOT EXISTS {name}_icao "
+                                    f"ON {name} (icao, time)")
+                self.writer.execute(f"CREATE INDEX IF NOT EXISTS {name}_time ON {name} (time)")
+                for old in [old for old in self.partitions
+                            if old <= hour - self.hours * 3600 / _PARTITION]:
+                    self.writer.execute(f"DROP TABLE IF EXISTS t{old}")
+                    self.partitions.discard(old)
+            self.partitions.add(hour)
+        return name
+
+    def _partitions(self, start: float, end: float) -> list[str]:
+        """
+        Internal
+        Get the names of the tables that have positions between two times, in order
+        The tables are listed again if the last hour's isn't known,
+        as another process (see after_fork) may have made it, and dropped old ones
+        """
+        if end // _PARTITION not in self.partitions:
+            self.partitions = self._tables()
+        return [f"t{hour}" for hour in sorted(self.partitions)
+                if start // _PARTITION <= hour <= end // _PARTITION]
+
+    def record(self, state: State, at: float | None = None) -> int:
+        """
+        Record the positions in a state of aircraft, at a time (now by default)
+        Aircraft without a position or a hex ICAO address are left out
+        Returns how many positions were written
+        """
+        at = time() if at is None else at
+        rows: list[tuple[Any, ...]] = []
+        for icao, aircraft in state.items():
+            lat: Any = aircraft.get("lat")
+            lng: Any = aircraft.get("lng")
+            alt: Any = aircraft.get("alt")
+            if lat is None or lng is None:
+                continue
+            last: tuple[float, Any, Any, Any] | None = self.last.get(icao)
+            if (last is not None and last[1:] == (lat, lng, alt)
+                    and at - last[0] < self.heartbeat):
+                continue
+            try:
+                address: int = int(icao, 16)
+            except ValueError:
+                continue
+            self.last[icao] = (at, lat, lng, alt)
+            rows.append((address, at, *(aircraft.get(field) for field in _FIELDS)))
+
+        # forget aircraft that have gone, so the next time they're seen is always recorded
+        if len(self.last) > len(state):
+            self.last = {icao: last for icao, last in self.last.items() if icao in state}
+
+        if rows:
+            # inserted in address order, so each page of the aircraft index is touched once
+            rows.sort()
+            name: str = self._partition(int(at // _PARTITION))
+            with self.writer:
+                self.writer.executemany(f"INSERT INTO {name} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        rows)
+        return len(rows)
+
+    def trail(self, icao: str, start: float = 0, end: float | None = None) -> list[list[Any]]:
+        """
+        Get the positions of an aircraft between two times (by default, all of them until now),
+        oldest first
+        Each position is a list of the time, lat, lng and alt
+        """
+        end = time() if end is None else end
+        try:
+            address: int = int(icao, 16)
+        except ValueError:
+            return []
+
+        result: list[list[Any]] = []
+        for name in self._partitions(start, end):
+            result.extend(list(row) for row in self.reader.execute(
+                f"SELECT time, lat, lng, alt FROM {name} "
+                "WHERE icao = ? AND time BETWEEN ? AND ? ORDER BY time", (address, start, end)))
+        return result
+
+    def at(self, start: float, end: float) -> Aircraft:
+        """
+        Get the latest position of each aircraft recorded after start, up to and including end
+        Aircraft are in the same shape as the state they were recorded from,
+        with only the fields kept for each position
+        """
+        state: Aircraft = {}
+        for name in self._partitions(start, end):
+            for row in self.reader.execute(f"SELECT * FROM {name} "
+                                           "WHERE time > ? AND time <= ? ORDER BY time",
+                                           (start, end)):
+                icao: str = format(row[0], "06x")
+                aircraft: dict[str, Any] = {"icao": icao}
+                aircraft.update((field, value) for field, value in zip(_FIELDS, row[2:])
+                                if value is not None)
+                state[icao] = aircraft
+        return state
+
+    def replay(self, start: float, end: float, step: float,
+               stale: float = 60) -> Iterator[tuple[float, Aircraft]]:
+        """
+        Get the state of aircraft every step seconds from start to end, as it was then
+        Each state has every aircraft recorded in the stale seconds before it,
+        where it last was
+        Only the positions since the last state are read each time, so a replay can be
+        paused between states for as long as needed
+        """
+        state: Aircraft = {}
+        seen: dict[str, float] = {}
+        since: float = start - stale
+        moment: float = start
+        while moment <= end:
+            for icao, aircraft in self.at(since, moment).items():
+                state[icao] = aircraft
+                seen[icao] = moment
+            for icao in [icao for icao, last in seen.items() if last < moment - stale]:
+                del state[icao], seen[icao]
+            yield moment, dict(state)
+            since = moment
+            moment += step
+
+    def after_fork(self) -> None:
+        """
+        Open new connections to the database in a process forked from the one that opened these
+        SQLite connections can't be carried across fork(), so the old ones are never used or closed
+        """
+        self.inherited = (self.writer, self.reader)
+        self.writer = self._connect()
+        self.reader = self._connect()
+
+    def close(self) -> None:
+        """
+        Close the connections to the database
+        """
+        self.writer.close()
+        self.reader.close()
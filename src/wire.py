@@ -0,0 +1,208 @@
+# wire.py
+
+"""
+Pack aircraft into a compact binary format for clients that ask for it, instead of JSON
+"""
+
+from array import array
+from collections.abc import Mapping
+from json import dumps, loads
+from struct import pack as pack_struct, unpack_from
+from sys import byteorder
+from typing import Any, Iterable, Iterator, Sequence
+
+__all__: list[str] = [
+    "ENCODING",
+    "pack",
+    "pack_columns",
+    "unpack",
+    "pack_delta"
+]
+
+ENCODING: str = "packed"
+
+Aircraft = dict[str, dict[str, Any]]
+
+# fields that are numbers are kept as 32-bit integers, multiplied by their scale first
+# lat and lng to about a metre, alt and climb to the foot (per minute), hdg and speed to a tenth
+_SCALES: dict[str, int] = {
+    "lat": 100000,
+    "lng": 100000,
+    "alt": 1,
+    "climb": 1,
+    "hdg": 10,
+    "speed": 10
+}
+_DEFAULT_SCALE: int = 1000
+
+# values marking a field an aircraft doesn't have, or has as None (removed, in a delta)
+_INT_MISSING: int = -2 ** 31
+_INT_NONE: int = -2 ** 31 + 1
+_CODE_MISSING: int = 0xFFFF
+_CODE_NONE: int = 0xFFFE
+_HEX_MISSING: int = 0xFFFFFFFF
+# marks a field an aircraft doesn't have while packing, since None is a value
+_MISSING: object = object()
+
+
+def _little(column: array) -> bytes:
+    """
+    Internal
+    Get the bytes of an array in little-endian order
+    """
+    if byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _hex(value: Any) -> int | None:
+    """
+    Internal
+    Get a 24-bit ICAO address (as 6 lowercase hex digits) as an integer, or None if it isn't one
+    """
+    if not isinstance(value, str) or len(value) != 6:
+        return None
+    try:
+        address: int = int(value, 16)
+    except ValueError:
+        return None
+    return address if format(address, "06x") == value else None
+
+
+def _column(name: str, values: list[Any]) -> tuple[list[Any], bytes]:
+    """
+    Internal
+    Pack one field of every aircraft (with _MISSING for aircraft without it)
+    Gets the column's header entry and body
+    Strings are stored as codes into a table of the different values,
+    and anything that doesn't fit a packed kind is kept as JSON in the header
+    """
+    present: list[Any] = [value for value in values
+                          if value is not _MISSING and value is not None]
+
+    if name == "icao" and all(_hex(value) is not None for value in present):
+        return [name, "hex"], _little(array("I", (
+            _HEX_MISSING if value is _MISSING or value is None else _hex(value)
+            for value in values)))
+
+    if all(isinstance(value, str) for value in present):
+        table: dict[str, int] = {}
+        for value in present:
+            table.setdefault(value, len(table))
+        if len(table) < _CODE_NONE:
+            return [name, "str", list(table)], _little(array("H", (
+                _CODE_MISSING if value is _MISSING
+                else _CODE_NONE if value is None
+                else table[value] for value in values)))
+
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        scale: int = _SCALES.get(name, _DEFAULT_SCALE)
+        quantised: list[int] = [round(value * scale) for value in present]
+        if all(_INT_NONE < value < 2 ** 31 for value in quantised):
+            numbers: Iterator[int] = iter(quantised)
+            return [name, "int", scale], _little(array("i", (
+                _INT_MISSING if value is _MISSING
+                else _INT_NONE if value is None
+                else next(numbers) for value in values)))
+
+    return [name, "json", [[n, value] for n, value in enumerate(values)
+                           if value is not _MISSING]], b""
+
+
+def _pack(count: int, columns: Iterable[tuple[str, list[Any]]]) -> bytes:
+    """
+    Internal, use pack() or pack_columns()
+    Pack the names and values (with _MISSING for aircraft without it) of each field
+    """
+    header: list[list[Any]] = []
+    bodies: list[bytes] = []
+    for name, values in columns:
+        entry, body = _column(name, values)
+        header.append(entry)
+        bodies.append(body)
+
+    encoded: bytes = dumps({"count": count, "columns": header},
+                           separators=(",", ":")).encode()
+    return b"".join((pack_struct("<I", len(encoded)), encoded, *bodies))
+
+
+def pack(aircraft: Aircraft) -> bytes:
+    """
+    Pack aircraft (keyed by ICAO address) into columns
+    The ICAO addresses are also packed as a column, so each aircraft needs an icao field
+
+    The format is the length of a JSON header (a little-endian unsigned 32-bit integer),
+    the header, then the body of each column in the order of the header
+    The header is {"count": number of aircraft, "columns": [[name, kind, ...], ...]}, where kind is
+        hex - unsigned 32-bit integers (0xFFFFFFFF for missing)
+        str - unsigned 16-bit codes into the table after it (0xFFFF for missing, 0xFFFE for None)
+        int - signed 32-bit integers, to be divided by the scale after it
+              (-2^31 for missing, -2^31 + 1 for None)
+        json - no body, the [index, value] of each aircraft that has it is after it instead
+    """
+    rows: list[dict[str, Any]] = [dict(fields, icao=fields.get("icao", icao))
+                                  for icao, fields in aircraft.items()]
+    names: dict[str, None] = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return _pack(len(rows), ((name, [row.get(name, _MISSING) for row in rows]) for name in names))
+
+
+def pack_columns(columns: Mapping[str, Sequence[Any]]) -> bytes:
+    """
+    Pack aircraft that are already in columns (e.g. from opensky.columns) the same way as pack,
+    without making a dict for each aircraft
+    Takes a sequence of each field of every aircraft keyed by field, including icao,
+    with None for an aircraft without the field
+    """
+    return _pack(len(columns["icao"]),
+                 ((name, [_MISSING if value is None else value for value in column])
+                  for name, column in columns.items()))
+
+
+def unpack(data: bytes) -> Aircraft:
+    """
+    Unpack aircraft packed with pack, keyed by ICAO address
+    Numbers come back as floats, quantised to their scale
+    """
+    length: int = unpack_from("<I", data)[0]
+    header: dict[str, Any] = loads(data[4:4 + length])
+    offset: int = 4 + length
+    rows: list[dict[str, Any]] = [{} for _ in range(header["count"])]
+
+    for name, kind, *extra in header["columns"]:
+        if kind == "json":
+            for n, value in extra[0]:
+                rows[n][name] = value
+            continue
+
+        column: array = array({"hex": "I", "str": "H", "int": "i"}[kind])
+        size: int = column.itemsize * len(rows)
+        column.frombytes(data[offset:offset + size])
+        offset += size
+        if byteorder == "big":
+            column.byteswap()
+
+        for row, value in zip(rows, column):
+            if kind == "hex" and value != _HEX_MISSING:
+                row[name] = format(value, "06x")
+            elif kind == "str" and value < _CODE_NONE:
+                row[name] = extra[0][value]
+            elif kind == "int" and value > _INT_NONE:
+                row[name] = value / extra[0]
+            elif value in (_CODE_NONE, _INT_NONE):
+                row[name] = None
+
+    return {row["icao"]: row for row in rows}
+
+
+def pack_delta(delta: dict[str, Any]) -> dict[str, Any]:
+    """
+    Get a delta (see delta.Deltas), or a snapshot, with its aircraft packed
+    """
+    packed: dict[str, Any] = dict(delta, encoding=ENCODING)
+    for key in ("added", "changed", "aircraft"):
+        if key in delta:
+            packed[key] = pack(delta[key])
+    return packed
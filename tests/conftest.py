@@ -0,0 +1,17 @@
+# conftest.py
+
+"""
+Run the tests against src as flight_tracker runs, from inside it,
+with a home directory of their own so the real settings and databases are left alone
+"""
+
+from os import chdir, environ
+from os.path import abspath, dirname, join
+from tempfile import mkdtemp
+import sys
+
+_SRC: str = join(dirname(dirname(abspath(__file__))), "src")
+
+environ["HOME"] = mkdtemp(prefix="flight_tracker-tests-")
+chdir(_SRC)
+sys.path.insert(0, _SRC)
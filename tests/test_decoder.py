@@ -0,0 +1,110 @@
+# test_decoder.py
+
+"""
+Tests for decoder.py, against reference frames with known contents
+"""
+
+from typing import Any
+import pytest
+from decoder import Decoder
+
+_IDENTIFICATION: str = "8D4840D6202CC371C32CE0576098"  # KLM1023
+_EVEN: str = "8D40621D58C382D690C8AC2863A7"  # 38000 ft
+_ODD: str = "8D40621D58C386435CC412692AD6"
+_VELOCITY: str = "8D485020994409940838175B284F"  # 159 kt over the ground, heading 183, -832 fpm
+
+
+def _beast(message: str) -> bytes:
+    """
+    Get a Mode S message (in hex) as a Beast frame, with a timestamp that has to be escaped
+    """
+    return b"\x1a\x33" + (b"\x00\x01\x1a\x03\x04\x05\x30" + bytes.fromhex(message)).replace(
+        b"\x1a", b"\x1a\x1a")
+
+
+def test_identification() -> None:
+    decoder: Decoder = Decoder()
+    assert decoder.message(bytes.fromhex(_IDENTIFICATION), 0)
+    assert decoder.tracks["4840d6"].csign == "KLM1023"
+
+
+def test_bad_crc() -> None:
+    decoder: Decoder = Decoder()
+    assert not decoder.message(bytes.fromhex(_IDENTIFICATION[:-1] + "9"), 0)
+    assert decoder.counts == {"messages": 1, "decoded": 0, "bad": 1}
+    assert not decoder.tracks
+
+
+def test_global_position_even_newest() -> None:
+    decoder: Decoder = Decoder()
+    decoder.message(bytes.fromhex(_ODD), 0)
+    assert decoder.state(0) == {}
+    decoder.message(bytes.fromhex(_EVEN), 1)
+    aircraft: dict[str, Any] = decoder.state(1)["40621d"]
+    assert (aircraft["lat"], aircraft["lng"]) == pytest.approx((52.2572, 3.91937), abs=1e-4)
+    assert aircraft["alt"] == 38000
+
+
+def test_global_position_odd_newest() -> None:
+    decoder: Decoder = Decoder()
+    decoder.message(bytes.fromhex(_EVEN), 0)
+    decoder.message(bytes.fromhex(_ODD), 1)
+    aircraft: dict[str, Any] = decoder.state(1)["40621d"]
+    assert (aircraft["lat"], aircraft["lng"]) == pytest.approx((52.26578, 3.93891), abs=1e-4)
+
+
+def test_pair_too_far_apart() -> None:
+    decoder: Decoder = Decoder()
+    decoder.message(bytes.fromhex(_ODD), 0)
+    decoder.message(bytes.fromhex(_EVEN), 11)
+    assert decoder.state(11) == {}
+
+
+def test_local_position() -> None:
+    decoder: Decoder = Decoder()
+    decoder.message(bytes.fromhex(_EVEN), 0)
+    decoder.message(bytes.fromhex(_ODD), 1)
+    # one message is enough once there's a position to decode it against
+    decoder.message(bytes.fromhex(_EVEN), 20)
+    aircraft: dict[str, Any] = decoder.state(20)["40621d"]
+    assert (aircraft["lat"], aircraft["lng"]) == pytest.approx((52.2572, 3.91937), abs=1e-4)
+
+
+def test_velocity() -> None:
+    decoder: Decoder = Decoder()
+    assert decoder.message(bytes.fromhex(_VELOCITY), 0)
+    velocity: tuple[float, float, float] = (decoder.tracks["485020"].speed,
+                                            decoder.tracks["485020"].hdg,
+                                            decoder.tracks["485020"].climb)
+    assert velocity == pytest.approx((159.20, 182.88, -832), abs=1e-2)
+
+
+def test_beast_split_and_escaped() -> None:
+    data: bytes = b"".join(_beast(message) for message in (_IDENTIFICATION, _ODD, _EVEN))
+    decoder: Decoder = Decoder()
+    frames: int = 0
+    for start in range(0, len(data), 7):
+        frames += decoder.beast(data[start:start + 7], 1)
+    assert frames == 3
+    assert decoder.pending == b""
+    assert decoder.counts == {"messages": 3, "decoded": 3, "bad": 0}
+    assert decoder.tracks["4840d6"].csign == "KLM1023"
+    assert decoder.state(1)["40621d"]["lat"] == pytest.approx(52.2572, abs=1e-4)
+
+
+def test_beast_skips_garbage() -> None:
+    decoder: Decoder = Decoder()
+    assert decoder.beast(b"\x00\x1a\x1a\xff" + _beast(_IDENTIFICATION), 0) == 1
+    assert decoder.tracks["4840d6"].csign == "KLM1023"
+
+
+def test_sbs() -> None:
+    line: bytes = (b"MSG,3,1,1,40621D,1,2024/01/01,00:00:00.000,2024/01/01,00:00:00.000,"
+                   b"KLM1023 ,38000,450,90,52.2572,3.9194,-64,,0,0,0,0\n")
+    decoder: Decoder = Decoder()
+    assert decoder.sbs(line[:40], 0) == 0
+    assert decoder.sbs(line[40:] + b"MSG,1", 0) == 1
+    assert decoder.pending == b"MSG,1"
+    assert decoder.state(0) == {"40621d": {"icao": "40621d", "csign": "KLM1023",
+                                           "lat": 52.2572, "lng": 3.9194, "alt": 38000,
+                                           "speed": 450, "hdg": 90, "climb": -64}}
@@ -0,0 +1,95 @@
+# test_delta.py
+
+"""
+Tests for delta.py, applying the deltas the way a client does and checking it ends up
+with the same state
+"""
+
+from random import Random
+from typing import Any
+from delta import Aircraft, Deltas
+from store import AircraftStore
+
+
+def _states(seed: int, count: int = 50) -> list[Aircraft]:
+    """
+    Get a run of random states, with aircraft coming, going and changing between them
+    """
+    rand: Random = Random(seed)
+    icaos: list[str] = [f"{n:06x}" for n in range(40)]
+    states: list[Aircraft] = []
+    for _ in range(count):
+        state: Aircraft = {}
+        for icao in rand.sample(icaos, rand.randrange(len(icaos))):
+            fields: dict[str, Any] = {"icao": icao,
+                                      "lat": rand.choice([51.5, 52.25, -33.9]),
+                                      "alt": rand.choice([0, 35000, 38000])}
+            if rand.random() < 0.7:
+                fields["csign"] = rand.choice(["BAW1", "KLM1023", "DLH2"])
+            if rand.random() < 0.3:
+                fields["squawk"] = rand.choice(["7000", 1200, [1, 2]])
+            state[icao] = fields
+        states.append(state)
+    return states
+
+
+def _apply(client: Aircraft, version: int, delta: dict[str, Any]) -> int:
+    """
+    Apply a delta to a client's copy of the state, as the front end does
+    Returns the version it brings the copy up to
+    """
+    assert delta["base"] == version
+    for icao in delta["removed"]:
+        del client[icao]
+    for icao, fields in delta["added"].items():
+        client[icao] = dict(fields)
+    for icao, fields in delta["changed"].items():
+        for key, value in fields.items():
+            if value is None:
+                client[icao].pop(key, None)
+            else:
+                client[icao][key] = value
+    return delta["version"]
+
+
+def test_update_round_trip() -> None:
+    deltas: Deltas = Deltas()
+    client: Aircraft = {}
+    version: int = 0
+    for state in _states(1):
+        delta: dict[str, Any] | None = deltas.update(state)
+        if delta is not None:
+            version = _apply(client, version, delta)
+        assert client == state
+    assert version == deltas.version
+
+
+def test_store_round_trip() -> None:
+    deltas: Deltas = Deltas()
+    store: AircraftStore = AircraftStore()
+    client: Aircraft = {}
+    version: int = 0
+    for state in _states(2):
+        store.update(state)
+        delta: dict[str, Any] | None = deltas.apply(store, store.added, store.changed,
+                                                    store.removed)
+        if delta is not None:
+            version = _apply(client, version, delta)
+        assert client == state
+        assert client == {icao: store[icao] for icao in store}
+
+
+def test_nothing_changed() -> None:
+    deltas: Deltas = Deltas()
+    state: Aircraft = {"4840d6": {"icao": "4840d6", "csign": "KLM1023"}}
+    assert deltas.update(state) is not None
+    assert deltas.update({icao: dict(fields) for icao, fields in state.items()}) is None
+    assert deltas.version == 1
+
+
+def test_removed_field() -> None:
+    deltas: Deltas = Deltas()
+    deltas.update({"4840d6": {"icao": "4840d6", "csign": "KLM1023", "alt": 38000}})
+    delta: dict[str, Any] | None = deltas.update({"4840d6": {"icao": "4840d6", "alt": 37975}})
+    assert delta == {"base": 1, "version": 2, "added": {},
+                     "changed": {"4840d6": {"alt": 37975, "csign": None}}, "removed": []}
@@ -0,0 +1,61 @@
+# test_feed.py
+
+"""
+Tests for feed.py
+"""
+
+from typing import Any, Iterator
+import pytest
+from feed import documents
+
+
+def _documents(lines: list[str]) -> tuple[list[Any], list[str]]:
+    """
+    Get the documents in lines, and what was logged
+    """
+    logged: list[str] = []
+    return list(documents(iter(lines), logged.append)), logged
+
+
+def test_newline_delimited() -> None:
+    assert _documents(['{"a": 1}\n', '{"b": 2}\n', '[3]\n']) == ([{"a": 1}, {"b": 2}, [3]], [])
+
+
+def test_documents_left_at_the_end() -> None:
+    # the last lines aren't tried as they come, so they're all parsed at the end
+    assert _documents(['{"a": [\n', "1,\n" * 4, '2]}  {"b": 2}', ' {"c": 3}']) == (
+        [{"a": [1, 1, 1, 1, 2]}, {"b": 2}, {"c": 3}], [])
+
+
+def test_multi_line_document_as_soon_as_it_closes() -> None:
+    lines: list[str] = ['{"a": [\n', "1,\n" * 4, "2]}\n", '{"b": 2}\n']
+    read: list[str] = []
+
+    def reading() -> Iterator[str]:
+        for line in lines:
+            read.append(line)
+            yield line
+
+    parsed: Iterator[Any] = documents(reading())
+    assert next(parsed) == {"a": [1, 1, 1, 1, 2]}
+    # without waiting for the next line
+    assert len(read) == 3
+    assert list(parsed) == [{"b": 2}]
+
+
+def test_pretty_printed() -> None:
+    lines: list[str] = ["{\n", '  "a": {\n', '    "b": [1, 2]\n', "  }\n", "}\n",
+                        "[\n", "  4\n", "]\n"]
+    assert _documents(lines) == ([{"a": {"b": [1, 2]}}, [4]], [])
+
+
+def test_invalid_lines_skipped() -> None:
+    got, logged = _documents(['{"a": 1}\n', '{"b": tru\n', '{"c": "unterminated\n',
+                              "[1, 2,]\n", '{"d": 4}'])
+    assert got == [{"a": 1}, {"d": 4}]
+    assert len(logged) == 3
+
+
+def test_ends_partway_through() -> None:
+    with pytest.raises(ValueError):
+        _documents(['{"a": 1}\n', '{"b":\n'])
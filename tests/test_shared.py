@@ -0,0 +1,96 @@
+# test_shared.py
+
+"""
+Tests for shared.py, with the writer and reader mapping the same file as separate processes would
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Iterator
+import pytest
+from shared import _HEADER, SharedState
+from store import AircraftStore
+
+_STATE: dict[str, dict[str, Any]] = {
+    "4840d6": {"icao": "4840d6", "csign": "KLM1023", "lat": 52.257202, "lng": 3.919373,
+               "alt": 38000.0, "squawk": "7000"},
+    "40621d": {"icao": "40621d", "lat": -33.9, "lng": 151.17}
+}
+
+
+@pytest.fixture(name="pair")
+def _pair(tmp_path: Path) -> Iterator[tuple[SharedState, SharedState]]:
+    """
+    A writer and a reader of the same shared state
+    """
+    writer: SharedState = SharedState(str(tmp_path / "state.shm"), 4096)
+    reader: SharedState = SharedState(str(tmp_path / "state.shm"))
+    yield writer, reader
+    reader.close()
+    writer.close(remove=True)
+
+
+def test_nothing_written(pair: tuple[SharedState, SharedState]) -> None:
+    assert pair[1].read() is None
+
+
+def test_write_read(pair: tuple[SharedState, SharedState]) -> None:
+    writer, reader = pair
+    writer.write(AircraftStore(_STATE))
+    assert reader.read() == _STATE
+    # not again until there's a new state
+    assert reader.read() is None
+    writer.write(AircraftStore({}))
+    assert reader.read() == {}
+    assert reader.sequence == writer.sequence == 4
+
+
+def test_grows(pair: tuple[SharedState, SharedState]) -> None:
+    writer, reader = pair
+    state: dict[str, dict[str, Any]] = {f"{n:06x}": {"icao": f"{n:06x}", "lat": n / 100,
+                                                     "csign": f"TEST{n}"} for n in range(2000)}
+    writer.write(AircraftStore(state))
+    assert len(writer.map) > 4096
+    assert reader.read() == state
+
+
+def test_being_written(pair: tuple[SharedState, SharedState]) -> None:
+    writer, reader = pair
+    writer.write(AircraftStore(_STATE))
+    # a writer partway through leaves the sequence odd
+    magic, sequence, length = _HEADER.unpack_from(writer.map)
+    _HEADER.pack_into(writer.map, 0, magic, sequence + 1, length)
+    assert reader.read() is None
+    # and the next write carries on from after it
+    writer.write(AircraftStore(_STATE))
+    assert writer.sequence == sequence + 4
+    assert reader.read() == _STATE
+
+
+def test_written_while_read(pair: tuple[SharedState, SharedState],
+                            monkeypatch: pytest.MonkeyPatch) -> None:
+    writer, reader = pair
+    writer.write(AircraftStore(_STATE))
+    decode: Callable[[SharedState], dict[str, dict[str, Any]]] = SharedState._decode
+
+    def overwritten(self: SharedState) -> dict[str, dict[str, Any]]:
+        state: dict[str, dict[str, Any]] = decode(self)
+        writer.write(AircraftStore({}))
+        return state
+
+    monkeypatch.setattr(SharedState, "_decode", overwritten)
+    # what was read is thrown away, as the state changed under it
+    assert reader.read() is None
+    monkeypatch.undo()
+    assert reader.read() == {}
+
+
+def test_counters(pair: tuple[SharedState, SharedState]) -> None:
+    writer, reader = pair
+    assert reader.counters() == (0,) * 16
+    assert writer.count(3) == 1
+    assert reader.count(3) == 2
+    assert reader.count(15) == 1
+    assert writer.counters()[3] == 2
+    assert writer.counters()[15] == 1
+    # counting doesn't look like a new state
+    assert reader.read() is None
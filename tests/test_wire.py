@@ -0,0 +1,73 @@
+# test_wire.py
+
+"""
+Tests for wire.py
+"""
+
+from typing import Any
+import pytest
+from wire import ENCODING, pack, pack_columns, pack_delta, unpack
+
+_AIRCRAFT: dict[str, dict[str, Any]] = {
+    "4840d6": {"icao": "4840d6", "csign": "KLM1023", "lat": 52.257202, "lng": 3.919373,
+               "alt": 38000, "hdg": 182.88, "speed": 159.2, "climb": -832},
+    "40621d": {"icao": "40621d", "csign": "KLM1023", "lat": -33.9, "lng": 151.17,
+               "squawk": [7, 7, 0, 0], "on_ground": True},
+    "485020": {"icao": "485020", "csign": None, "alt": None}
+}
+
+
+def test_round_trip() -> None:
+    unpacked: dict[str, dict[str, Any]] = unpack(pack(_AIRCRAFT))
+    assert unpacked.keys() == _AIRCRAFT.keys()
+    for icao, fields in _AIRCRAFT.items():
+        # the same fields, numbers quantised to their scale (a tenth at the coarsest)
+        assert unpacked[icao].keys() == fields.keys()
+        for key, value in fields.items():
+            if isinstance(value, float):
+                assert unpacked[icao][key] == pytest.approx(value, abs=0.05)
+            else:
+                assert unpacked[icao][key] == value
+
+
+def test_quantised() -> None:
+    unpacked: dict[str, dict[str, Any]] = unpack(pack(_AIRCRAFT))
+    assert unpacked["4840d6"]["lat"] == 52.25720
+    assert unpacked["4840d6"]["hdg"] == 182.9
+    assert unpacked["4840d6"]["alt"] == 38000
+
+
+def test_not_hex_icao() -> None:
+    aircraft: dict[str, dict[str, Any]] = {"~abc123": {"icao": "~abc123", "alt": 1000}}
+    assert unpack(pack(aircraft)) == aircraft
+
+
+def test_out_of_range_kept_as_json() -> None:
+    aircraft: dict[str, dict[str, Any]] = {"4840d6": {"icao": "4840d6", "lat": 1e9}}
+    assert unpack(pack(aircraft)) == aircraft
+
+
+def test_pack_columns() -> None:
+    columns: dict[str, list[Any]] = {
+        "icao": ["4840d6", "40621d"],
+        "csign": ["KLM1023", None],
+        "alt": [38000, None],
+        "lat": [52.257202, -33.9]
+    }
+    assert unpack(pack_columns(columns)) == unpack(pack({
+        "4840d6": {"icao": "4840d6", "csign": "KLM1023", "alt": 38000, "lat": 52.257202},
+        "40621d": {"icao": "40621d", "lat": -33.9}
+    }))
+
+
+def test_pack_delta() -> None:
+    delta: dict[str, Any] = {"base": 1, "version": 2, "added": _AIRCRAFT,
+                             "changed": {"4840d6": {"alt": 37975, "csign": None}},
+                             "removed": ["a00001"]}
+    packed: dict[str, Any] = pack_delta(delta)
+    assert packed["encoding"] == ENCODING
+    assert (packed["base"], packed["version"], packed["removed"]) == (1, 2, ["a00001"])
+    assert unpack(packed["added"]).keys() == _AIRCRAFT.keys()
+    # None, for a field that's gone, survives packing
+    assert unpack(packed["changed"]) == {"4840d6": {"icao": "4840d6", "alt": 37975,
+                                                    "csign": None}}